@@ -18,6 +18,7 @@ class User(AbstractUser):
     bio = models.TextField(blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profile_pictures/', blank=True, null=True,
                                     validators=[FileExtensionValidator(allowed_extensions=['jpg', 'png', 'jpeg'])])
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False)
     ''''Newly added line'''
     email_confirmed = models.BooleanField(default=False) 
     
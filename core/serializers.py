@@ -3,6 +3,7 @@ from djoser.serializers import UserCreateSerializer as BaseUserCreateSerializer,
                                SetPasswordSerializer as BaseSetPasswordSerializer
 from rest_framework import serializers
 from .models import User
+from courses.serializers import ImageVariantsField
 from django.conf import settings
 import logging
 
@@ -24,8 +25,9 @@ class UserCreateSerializer(serializers.ModelSerializer):
 
 class UserSerializer(BaseUserSerializer):
     profile_picture = serializers.ImageField(read_only=False)
+    profile_picture_variants = ImageVariantsField('profile_picture')
    
     #role = serializers.ChoiceField(choices=User.ROLE_CHOICES, required=True)
     class Meta(BaseUserSerializer.Meta):
         model = User  # Ensure this points to your custom User model
-        fields = ['email', 'first_name', 'last_name', 'bio', 'website', 'role', 'profile_picture']
+        fields = ['email', 'first_name', 'last_name', 'bio', 'website', 'role', 'profile_picture', 'profile_picture_variants']
@@ -0,0 +1,118 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+from .models import CourseProgress
+
+
+# Generations: every cache key embeds the current generation of its namespace, so bumping
+# the generation invalidates every cached response in that namespace at once.
+CATALOG = 'catalog'
+SITE_CONTENT = 'site'
+
+
+def _generation_key(namespace):
+    return f'response-cache:{namespace}:generation'
+
+
+def get_generation(namespace):
+    key = _generation_key(namespace)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, 1, timeout=None)
+        generation = cache.get(key, 1)
+    return generation
+
+
+def bump_generation(namespace):
+    # Bump after commit so a concurrent reader can't re-cache the pre-commit state
+    def bump():
+        key = _generation_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 2, timeout=None)
+    transaction.on_commit(bump)
+
+
+def is_public_request(request):
+    """Anonymous users and students all see the same catalog, so only their reads are cached."""
+    user = request.user
+    if not user or not user.is_authenticated:
+        return True
+    return getattr(user, 'role', None) == 'student' and not user.is_staff and not user.is_superuser
+
+
+def cached_response(namespace, request, build):
+    """
+    Serve the response data for a public GET from cache, calling build() on a miss.
+    Only 200 responses are stored, and instructor/staff requests bypass the cache entirely.
+    """
+    if request.method != 'GET' or not is_public_request(request):
+        return build()
+
+    url = f'{request.path}?{urlencode(sorted(request.query_params.lists()), doseq=True)}'
+    key = f'response-cache:{namespace}:{get_generation(namespace)}:{hashlib.md5(url.encode()).hexdigest()}'
+    data = cache.get(key)
+    if data is not None:
+        return Response(data)
+
+    response = build()
+    if response.status_code == 200:
+        cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+    return response
+
+
+class CachedReadMixin:
+    """Cache `list` and `retrieve` of a viewset for public users under `cache_namespace`."""
+    cache_namespace = CATALOG
+
+    def list(self, request, *args, **kwargs):
+        return cached_response(self.cache_namespace, request, lambda: super(CachedReadMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(self.cache_namespace, request, lambda: super(CachedReadMixin, self).retrieve(request, *args, **kwargs))
+
+
+def conditional_course_response(request, course, build, per_student=False):
+    """
+    Answer If-None-Match / If-Modified-Since for anything rendered from a course and its outline.
+    `course` is a queryset narrowed to the one course the caller may see. The validators come
+    from Course.version and Course.last_update (one indexed lookup), so a 304 never serializes
+    anything. ETags are weak because payloads embed signed storage URLs, and for the same reason
+    validators roll over every CONDITIONAL_RESPONSE_MAX_AGE seconds: a client can't keep
+    revalidating a payload whose links have expired. Pass `per_student` for payloads that render
+    LessonSerializer.opened, so the requesting user's progress row joins the validators.
+    """
+    row = course.values_list('pk', 'version', 'last_update').first()
+    if row is None:
+        return build()
+    course_id, version, last_update = row
+    etag = f'course-{course_id}-{version}-{int(last_update.timestamp() * 1000000)}'
+    if per_student and request.user.is_authenticated:
+        progress = CourseProgress.objects.filter(course_id=course_id, student=request.user) \
+            .values_list('completed_bits', 'last_accessed').first()
+        if progress is not None:
+            etag += '-' + hashlib.md5(bytes(progress[0] or b'')).hexdigest()[:12]
+            last_update = max(last_update, progress[1])
+    max_age = settings.CONDITIONAL_RESPONSE_MAX_AGE
+    bucket = int(time.time()) // max_age
+    etag = f'W/"{etag}-{bucket}"'
+    last_modified = max(int(last_update.timestamp()), bucket * max_age)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    response = build()
+    if response.status_code == 200:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        # Always revalidate; the bucket decides when a stored copy stops being answered with 304
+        response['Cache-Control'] = 'private, no-cache'
+    return response
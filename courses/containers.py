@@ -0,0 +1,215 @@
+import math
+import struct
+import requests
+
+
+# Duration straight from container metadata: the MP4/MOV `moov/mvhd` box or the Matroska/WebM
+# Segment `Info` element. Only box/element headers are read on the way there and every payload in
+# between (mdat, Clusters) is skipped with a seek, so a multi-GB file costs a handful of small reads.
+
+HEADER_EXTENSIONS = {'mp4': 'mp4', 'm4v': 'mp4', 'mov': 'mp4', 'mkv': 'mkv', 'webm': 'mkv'}
+
+READ_BLOCK = 64 * 1024
+MAX_BOX_READ = 16 * 1024 * 1024  # An mvhd or Info element larger than this isn't a real header
+
+
+class ContainerError(Exception):
+    pass
+
+
+class RangeReader:
+    """
+    Read-only, seekable file over HTTP Range requests (e.g. a signed S3 URL). Reads are served
+    from one cached block of READ_BLOCK bytes, so walking consecutive headers costs one request.
+    """
+
+    def __init__(self, url, session=None, timeout=30):
+        self.url = url
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.position = 0
+        self.block_start = None
+        self.block = b''
+        self.requests = 0
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.position
+        elif whence == 2:
+            raise ContainerError('RangeReader cannot seek from the end')
+        self.position = offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def _fetch(self, start, length):
+        self.requests += 1
+        response = self.session.get(
+            self.url, headers={'Range': f'bytes={start}-{start + length - 1}'}, timeout=self.timeout)
+        if response.status_code == 416:
+            return b''
+        if response.status_code != 206:
+            raise ContainerError(f'Range request failed with HTTP {response.status_code}')
+        return response.content
+
+    def read(self, size):
+        data = b''
+        while size > 0:
+            if self.block_start is None or not self.block_start <= self.position < self.block_start + len(self.block):
+                self.block_start = self.position
+                self.block = self._fetch(self.position, max(size, READ_BLOCK))
+                if not self.block:
+                    break
+            offset = self.position - self.block_start
+            chunk = self.block[offset:offset + size]
+            data += chunk
+            self.position += len(chunk)
+            size -= len(chunk)
+        return data
+
+    def close(self):
+        self.session.close()
+
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise ContainerError('Unexpected end of file')
+    return data
+
+
+# MP4 / QuickTime
+
+def _mp4_boxes(stream, start, end):
+    """Yield (type, payload_start, payload_end) for the boxes in [start, end); end=None means until EOF."""
+    position = start
+    while end is None or position + 8 <= end:
+        stream.seek(position)
+        header = stream.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', header)
+        payload = position + 8
+        if size == 1:
+            size = struct.unpack('>Q', _read_exact(stream, 8))[0]
+            payload += 8
+        elif size == 0:
+            # Box extends to the end of the file; only the last top-level box may do this
+            yield box_type, payload, end
+            return
+        if size < payload - position:
+            raise ContainerError(f'Invalid MP4 box size {size}')
+        yield box_type, payload, position + size
+        position += size
+
+
+def mp4_duration(stream):
+    """Seconds from the movie header: moov/mvhd holds a timescale and a duration in that timescale."""
+    for box_type, start, end in _mp4_boxes(stream, 0, None):
+        if box_type != b'moov':
+            continue
+        for child_type, child_start, child_end in _mp4_boxes(stream, start, end):
+            if child_type != b'mvhd':
+                continue
+            stream.seek(child_start)
+            version = _read_exact(stream, 4)[0]
+            if version == 1:
+                timescale, duration = struct.unpack('>16xIQ', _read_exact(stream, 28))
+            else:
+                timescale, duration = struct.unpack('>8xII', _read_exact(stream, 16))
+            if not timescale:
+                raise ContainerError('mvhd has a zero timescale')
+            return duration / timescale
+        raise ContainerError('moov has no mvhd box')
+    raise ContainerError('No moov box found')
+
+
+# Matroska / WebM (EBML)
+
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+INFO = 0x1549A966
+CLUSTER = 0x1F43B675
+TIMESTAMP_SCALE = 0x2AD7B1
+DURATION = 0x4489
+
+
+def _read_vint(stream, keep_marker):
+    first = _read_exact(stream, 1)[0]
+    if not first:
+        raise ContainerError('Invalid EBML variable-length integer')
+    length = 8 - first.bit_length() + 1
+    value = first if keep_marker else first & (0xFF >> length)
+    for byte in _read_exact(stream, length - 1):
+        value = (value << 8) | byte
+    unknown = not keep_marker and value == (1 << (7 * length)) - 1
+    return value, unknown
+
+
+def _ebml_element(stream):
+    element_id, _ = _read_vint(stream, keep_marker=True)
+    size, unknown = _read_vint(stream, keep_marker=False)
+    return element_id, None if unknown else size, stream.tell()
+
+
+def mkv_duration(stream):
+    """Seconds from Segment/Info: Duration (a float) in units of TimestampScale nanoseconds."""
+    stream.seek(0)
+    element_id, size, start = _ebml_element(stream)
+    if element_id != EBML_HEADER or size is None:
+        raise ContainerError('Not an EBML file')
+    stream.seek(start + size)
+    element_id, segment_size, segment_start = _ebml_element(stream)
+    if element_id != SEGMENT:
+        raise ContainerError('No Matroska Segment found')
+    segment_end = segment_start + segment_size if segment_size is not None else None
+
+    position = segment_start
+    while segment_end is None or position < segment_end:
+        stream.seek(position)
+        element_id, size, start = _ebml_element(stream)
+        if element_id == INFO and size is not None:
+            if size > MAX_BOX_READ:
+                raise ContainerError('Segment Info is implausibly large')
+            return _info_duration(stream, start, start + size)
+        if element_id == CLUSTER or size is None:
+            # Media data (or a live stream of unknown size) before Info: the header isn't where we can seek to it
+            break
+        position = start + size
+    raise ContainerError('No Segment Info with a duration found')
+
+
+def _info_duration(stream, start, end):
+    scale, duration = 1000000, None
+    position = start
+    while position < end:
+        stream.seek(position)
+        element_id, size, payload = _ebml_element(stream)
+        if size is None:
+            raise ContainerError('Unknown-size element inside Segment Info')
+        if element_id == TIMESTAMP_SCALE:
+            scale = int.from_bytes(_read_exact(stream, size), 'big')
+        elif element_id == DURATION:
+            if size not in (4, 8):
+                raise ContainerError(f'Invalid Duration size {size}')
+            duration = struct.unpack('>f' if size == 4 else '>d', _read_exact(stream, size))[0]
+            if not math.isfinite(duration) or duration < 0:
+                raise ContainerError(f'Invalid Duration {duration}')
+        position = payload + size
+    if duration is None:
+        raise ContainerError('Segment Info has no Duration')
+    seconds = duration * scale / 1e9
+    if not math.isfinite(seconds):
+        raise ContainerError('Duration overflows')
+    return seconds
+
+
+def header_duration(stream, extension):
+    """Duration in seconds of an MP4/MOV or MKV/WebM `stream`, or ContainerError if it can't be read from headers."""
+    kind = HEADER_EXTENSIONS.get(extension.lower())
+    if kind == 'mp4':
+        return mp4_duration(stream)
+    if kind == 'mkv':
+        return mkv_duration(stream)
+    raise ContainerError(f'No header parser for .{extension}')
@@ -0,0 +1,116 @@
+from collections import Counter
+from django.db.models import Count, F, Q
+from django.db.models.functions import Floor
+from .models import CourseProgress, CourseProgressRollup, Section, StudentScore
+
+# The instructor dashboard reads only CourseProgressRollup: per course, how many students sit in each
+# progress bucket, took N days to complete, and attempted or passed each section's quiz. Every write
+# that moves a student between buckets applies the difference, so a request never scans progress rows.
+
+PROGRESS_BUCKETS = 10  # 0-10%, ..., 90-100%; plus bucket 10 for 100%
+
+
+def apply_rollup_changes(deltas):
+    """Add the Counter of {(course id, kind, key): delta} to the stored counts, one UPDATE per changed count."""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    missing = []
+    for (course_id, kind, key), delta in deltas.items():
+        if not CourseProgressRollup.objects.filter(course_id=course_id, kind=kind, key=key) \
+                .update(count=F('count') + delta):
+            missing.append((course_id, kind, key))
+    if missing:
+        CourseProgressRollup.objects.bulk_create(
+            [CourseProgressRollup(course_id=course_id, kind=kind, key=key) for course_id, kind, key in missing],
+            ignore_conflicts=True,
+        )
+        for course_id, kind, key in missing:
+            CourseProgressRollup.objects.filter(course_id=course_id, kind=kind, key=key) \
+                .update(count=F('count') + deltas[course_id, kind, key])
+
+
+def progress_bucket(progress):
+    return int(progress // 10)
+
+
+def days_to_complete(started_at, completed_at):
+    return (completed_at - started_at).days if started_at and completed_at else None
+
+
+def progress_buckets(progress):
+    """Counter of {(course id, PROGRESS, bucket): students} over a CourseProgress queryset; one grouped query."""
+    rows = progress.annotate(bucket=Floor(F('progress') / 10)).values('course_id', 'bucket') \
+        .annotate(students=Count('id')).order_by()
+    return Counter({(row['course_id'], CourseProgressRollup.PROGRESS, int(row['bucket'])): row['students'] for row in rows})
+
+
+def rebuild_rollups(course_ids=None):
+    """Recount the rollups from the progress and score tables; used by the `rebuild_progress_rollups` command."""
+    progress = CourseProgress.objects.all()
+    scores = StudentScore.objects.all()
+    rollups = CourseProgressRollup.objects.all()
+    if course_ids is not None:
+        progress = progress.filter(course_id__in=course_ids)
+        scores = scores.filter(section__course_id__in=course_ids)
+        rollups = rollups.filter(course_id__in=course_ids)
+
+    counts = progress_buckets(progress)
+    finished = progress.filter(completed=True, started_at__isnull=False, completed_at__isnull=False)
+    for course_id, started_at, completed_at in finished.values_list('course_id', 'started_at', 'completed_at').iterator():
+        counts[course_id, CourseProgressRollup.DAYS_TO_COMPLETE, days_to_complete(started_at, completed_at)] += 1
+    sections = scores.values('section_id', 'section__course_id').order_by() \
+        .annotate(attempted=Count('id'), passed=Count('id', filter=Q(completed=True)))
+    for row in sections:
+        counts[row['section__course_id'], CourseProgressRollup.SECTION_ATTEMPTED, row['section_id']] = row['attempted']
+        counts[row['section__course_id'], CourseProgressRollup.SECTION_PASSED, row['section_id']] = row['passed']
+
+    rollups.delete()
+    CourseProgressRollup.objects.bulk_create([
+        CourseProgressRollup(course_id=course_id, kind=kind, key=key, count=count)
+        for (course_id, kind, key), count in counts.items() if count
+    ], batch_size=1000)
+    return counts
+
+
+def _median(histogram):
+    total = sum(histogram.values())
+    if not total:
+        return None
+    seen = 0
+    for key in sorted(histogram):
+        seen += histogram[key]
+        if seen * 2 >= total:
+            return key
+
+
+def course_dashboard(course):
+    """The dashboard document for a course: two queries whatever its enrolment."""
+    rollups = {kind: Counter() for kind, _ in CourseProgressRollup.KIND_CHOICES}
+    for kind, key, count in CourseProgressRollup.objects.filter(course=course).values_list('kind', 'key', 'count'):
+        rollups[kind][key] = count
+
+    buckets = rollups[CourseProgressRollup.PROGRESS]
+    students = sum(buckets.values())
+    completed = buckets[PROGRESS_BUCKETS]
+    sections = []
+    for section_id, title in Section.objects.filter(course=course).order_by('order', 'id').values_list('id', 'title'):
+        attempted = rollups[CourseProgressRollup.SECTION_ATTEMPTED][section_id]
+        passed = rollups[CourseProgressRollup.SECTION_PASSED][section_id]
+        sections.append({
+            'id': section_id,
+            'title': title,
+            'attempted': attempted,
+            'passed': passed,
+            'pass_rate': round(passed * 100 / attempted, 2) if attempted else None,
+        })
+
+    return {
+        'students': students,
+        'completed': completed,
+        'completion_rate': round(completed * 100 / students, 2) if students else None,
+        'progress_histogram': [
+            {'from': bucket * 10, 'to': min(bucket * 10 + 10, 100), 'students': buckets[bucket]}
+            for bucket in range(PROGRESS_BUCKETS + 1)
+        ],
+        'median_days_to_complete': _median(rollups[CourseProgressRollup.DAYS_TO_COMPLETE]),
+        'sections': sections,
+    }
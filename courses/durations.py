@@ -0,0 +1,61 @@
+import threading
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Sum
+from .cache import bump_generation, CATALOG
+from .models import Course, Lesson, Section
+
+# Section and course duration totals. Lesson saves and deletes only mark their section as dirty;
+# the totals of every dirty section (and its course) are recomputed with SUM aggregates once, when
+# the transaction commits, so saving N lessons in one transaction costs O(sections) queries.
+
+_pending = threading.local()
+
+
+def _dirty_sections():
+    if not hasattr(_pending, 'sections'):
+        _pending.sections = set()
+    return _pending.sections
+
+
+def schedule_duration_rollup(*section_ids):
+    """Recompute the totals of these sections and their courses when the current transaction commits."""
+    _dirty_sections().update(section_id for section_id in section_ids if section_id)
+    # Every call registers a flush: a rolled-back savepoint drops its own callbacks, but any
+    # surviving one flushes the whole set, and later ones find it empty.
+    transaction.on_commit(flush_duration_rollups)
+
+
+def flush_duration_rollups():
+    sections = _dirty_sections()
+    if not sections:
+        return
+    section_ids = list(sections)
+    sections.clear()
+    recompute_durations(section_ids)
+
+
+def recompute_durations(section_ids):
+    """Set total_duration of the sections and their courses from one SUM(Lesson.duration) over the courses."""
+    course_ids = set(Section.objects.filter(pk__in=section_ids).values_list('course_id', flat=True))
+    if not course_ids:
+        return
+    rows = Lesson.objects.filter(section__course_id__in=course_ids) \
+        .values('section', 'section__course').annotate(seconds=Sum('duration')).order_by()
+
+    seconds = {section_id: 0 for section_id in section_ids}
+    course_seconds = dict.fromkeys(course_ids, 0)
+    for row in rows:
+        if row['section'] in seconds:
+            seconds[row['section']] = row['seconds'] or 0
+        course_seconds[row['section__course']] += row['seconds'] or 0
+
+    Section.objects.bulk_update(
+        [Section(pk=pk, total_duration=timedelta(seconds=total)) for pk, total in seconds.items()],
+        ['total_duration'], batch_size=1000)
+    Course.objects.bulk_update(
+        [Course(pk=pk, total_duration=timedelta(seconds=total)) for pk, total in course_seconds.items()],
+        ['total_duration'], batch_size=1000)
+    # The updates bypass save() signals, so invalidate what renders the totals here
+    Course.touch(*course_ids)
+    bump_generation(CATALOG)
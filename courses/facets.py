@@ -0,0 +1,134 @@
+from collections import Counter
+from decimal import Decimal
+from django.db.models import F
+from rest_framework.exceptions import ValidationError
+from .models import Collection, Course, CourseFacetCount
+
+
+# (label, lower bound inclusive, upper bound exclusive or None)
+PRICE_BANDS = [
+    ('0-20', Decimal('0'), Decimal('20')),
+    ('20-50', Decimal('20'), Decimal('50')),
+    ('50-100', Decimal('50'), Decimal('100')),
+    ('100+', Decimal('100'), None),
+]
+# Rating facets are cumulative ("4.5 and up"), so a course counts under every threshold it meets
+RATING_THRESHOLDS = [4.5, 4.0, 3.5, 3.0]
+
+FACET_FIELDS = ['level', 'currency', 'collection_id', 'price', 'average_rating', 'is_active']
+
+
+def price_band(price):
+    for label, lower, upper in PRICE_BANDS:
+        if price >= lower and (upper is None or price < upper):
+            return label
+    return None
+
+
+def facet_values(values):
+    """The (facet, value) pairs a course contributes to; `values` maps FACET_FIELDS to the course's values."""
+    if not values or not values['is_active']:
+        return set()
+    pairs = {
+        ('level', values['level']),
+        ('currency', values['currency']),
+        ('collection', str(values['collection_id'])),
+    }
+    if values['price'] is not None:
+        pairs.add(('price', price_band(Decimal(values['price']))))
+    for threshold in RATING_THRESHOLDS:
+        if (values['average_rating'] or 0) >= threshold:
+            pairs.add(('rating', str(threshold)))
+    return pairs
+
+
+def course_facet_values(course):
+    return facet_values({field: getattr(course, field) for field in FACET_FIELDS})
+
+
+def apply_facet_changes(deltas):
+    """Add the Counter of {(facet, value): delta} to the stored counts with one UPDATE per changed value."""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    CourseFacetCount.objects.bulk_create(
+        [CourseFacetCount(facet=facet, value=value) for facet, value in deltas], ignore_conflicts=True
+    )
+    for (facet, value), delta in deltas.items():
+        CourseFacetCount.objects.filter(facet=facet, value=value).update(count=F('count') + delta)
+
+
+def update_course_facets(old_pairs, new_pairs):
+    deltas = Counter()
+    for pair in old_pairs - new_pairs:
+        deltas[pair] -= 1
+    for pair in new_pairs - old_pairs:
+        deltas[pair] += 1
+    apply_facet_changes(deltas)
+
+
+def rebuild_facet_counts():
+    """Recount every facet from the course table; used by the `rebuild_facet_counts` command."""
+    counts = Counter()
+    for values in Course.objects.values(*FACET_FIELDS).iterator(chunk_size=2000):
+        counts.update(facet_values(values))
+    CourseFacetCount.objects.all().delete()
+    CourseFacetCount.objects.bulk_create(
+        [CourseFacetCount(facet=facet, value=value, count=count) for (facet, value), count in counts.items()]
+    )
+    return counts
+
+
+def get_facet_counts():
+    """{facet: {value: count}} straight from the aggregate table, with collection titles."""
+    facets = {'level': {}, 'currency': {}, 'collection': {}, 'price': {}, 'rating': {}}
+    for facet, value, count in CourseFacetCount.objects.filter(count__gt=0).values_list('facet', 'value', 'count'):
+        facets.setdefault(facet, {})[value] = count
+    titles = dict(Collection.objects.filter(pk__in=list(facets['collection'])).values_list('pk', 'title'))
+    facets['collection'] = [
+        {'id': int(pk), 'title': titles.get(int(pk)), 'count': count} for pk, count in facets['collection'].items()
+    ]
+    return facets
+
+
+def filter_courses(queryset, params):
+    """
+    Apply ?level=, ?currency=, ?collection=, ?price=<band> and ?rating=<min> to a course queryset.
+    Unknown values raise a ValidationError (400) instead of silently matching nothing.
+    """
+    errors = {}
+    level = params.get('level')
+    if level:
+        if level not in dict(Course.LEVEL_CHOICES):
+            errors['level'] = f'Must be one of {", ".join(dict(Course.LEVEL_CHOICES))}.'
+        queryset = queryset.filter(level=level)
+    currency = params.get('currency')
+    if currency:
+        if currency not in dict(Course.CURRENCY_CHOICES):
+            errors['currency'] = f'Must be one of {", ".join(dict(Course.CURRENCY_CHOICES))}.'
+        queryset = queryset.filter(currency=currency)
+    collection = params.get('collection')
+    if collection:
+        if not collection.isdigit():
+            errors['collection'] = 'Must be a collection id.'
+        else:
+            queryset = queryset.filter(collection_id=collection)
+    band = params.get('price')
+    if band:
+        bands = {label: (lower, upper) for label, lower, upper in PRICE_BANDS}
+        if band not in bands:
+            errors['price'] = f'Must be one of {", ".join(bands)}.'
+        else:
+            lower, upper = bands[band]
+            queryset = queryset.filter(price__gte=lower)
+            if upper is not None:
+                queryset = queryset.filter(price__lt=upper)
+    rating = params.get('rating')
+    if rating:
+        try:
+            queryset = queryset.filter(average_rating__gte=float(rating))
+        except ValueError:
+            errors['rating'] = 'Must be a number.'
+    if errors:
+        raise ValidationError(errors)
+    return queryset
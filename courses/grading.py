@@ -0,0 +1,98 @@
+from collections import Counter
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from .dashboard import apply_rollup_changes
+from .models import CourseProgressRollup, Question, StudentAnswer, StudentScore
+
+# Grading of a whole quiz submission in a fixed number of queries: the section's question -> option
+# map and the student's earlier answers are read once, the submission is validated and scored in
+# memory, the answers are upserted in one statement and the score is written in one more.
+
+PASS_MARK = 70.0
+
+
+class GradingError(Exception):
+    pass
+
+
+class UnknownAnswerError(GradingError):
+    pass
+
+
+def answer_key(section):
+    """{question id: {option id: is_correct}} for every question of the section, options or not."""
+    questions = {}
+    rows = Question.objects.filter(section=section).values_list('id', 'options__id', 'options__is_correct')
+    for question_id, option_id, is_correct in rows:
+        options = questions.setdefault(question_id, {})
+        if option_id is not None:
+            options[option_id] = is_correct
+    return questions
+
+
+def parse_answers(answers, questions):
+    """Validate [{'question_id', 'option_id'}, ...] against the answer key; returns {question id: option id}."""
+    if not isinstance(answers, list):
+        raise GradingError('Answers should be provided as a list.')
+    selected = {}
+    for answer in answers:
+        question_id = answer.get('question_id') if isinstance(answer, dict) else None
+        option_id = answer.get('option_id') if isinstance(answer, dict) else None
+        if not question_id or not option_id:
+            raise GradingError('Both question_id and option_id are required.')
+        try:
+            question_id, option_id = int(question_id), int(option_id)
+        except (TypeError, ValueError):
+            raise GradingError('question_id and option_id must be integers.')
+        if question_id not in questions:
+            raise UnknownAnswerError(f'Question {question_id} is not in this section.')
+        if option_id not in questions[question_id]:
+            raise UnknownAnswerError(f'Option {option_id} is not an option of question {question_id}.')
+        # As before, a question answered twice keeps the last option
+        selected[question_id] = option_id
+    return selected
+
+
+def grade_submission(student, section, answers):
+    """
+    Store a student's answers to a section's questions and recompute their score. Answers left out of
+    the submission keep their earlier option. Returns (StudentScore, correct answers, total questions).
+    """
+    questions = answer_key(section)
+    selected = parse_answers(answers, questions)
+
+    with transaction.atomic():
+        # StudentScore has no unique key, so a missing row can't be locked: the student's own row
+        # serializes their submissions instead, and the score is then read locked for the pass delta
+        get_user_model().objects.select_for_update().filter(pk=student.pk).values_list('pk', flat=True).get()
+        earlier = StudentAnswer.objects.filter(student=student, question__section=section) \
+            .values_list('question_id', 'selected_option_id')
+        chosen = dict(earlier)
+        chosen.update(selected)
+
+        # MySQL upserts on any unique key and takes no conflict target
+        target = ['student', 'question'] if connection.features.supports_update_conflicts_with_target else None
+        StudentAnswer.objects.bulk_create(
+            [StudentAnswer(student=student, question_id=question_id, selected_option_id=option_id)
+             for question_id, option_id in selected.items()],
+            update_conflicts=True, unique_fields=target, update_fields=['selected_option'], batch_size=1000,
+        )
+
+        correct = sum(1 for question_id, option_id in chosen.items()
+                      if questions.get(question_id, {}).get(option_id))
+        total = len(questions)
+        score = correct * 100.0 / total if total else 0.0
+        passed = score >= PASS_MARK
+
+        student_score = StudentScore.objects.select_for_update().filter(student=student, section=section) \
+            .order_by('id').first()
+        if student_score is None:
+            # Signals count the new attempt for the dashboard
+            student_score = StudentScore.objects.create(student=student, section=section, score=score, completed=passed)
+        else:
+            StudentScore.objects.filter(pk=student_score.pk).update(score=score, completed=passed)
+            if student_score.completed != passed:
+                key = (section.course_id, CourseProgressRollup.SECTION_PASSED, section.pk)
+                apply_rollup_changes(Counter({key: 1 if passed else -1}))
+            student_score.score, student_score.completed = score, passed
+    return student_score, correct, total
@@ -0,0 +1,255 @@
+import logging
+import os
+import posixpath
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from uuid import uuid4
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .cache import bump_generation, CATALOG
+from .media import _media_source
+from .models import Course, Lesson, Section
+
+logger = logging.getLogger(__name__)
+
+# HLS renditions of lesson videos. The transcode_lessons worker claims queued lessons and runs one
+# ffmpeg per lesson (all renditions in a single decode pass) in a bounded process pool, then uploads
+# the playlists and segments under HLS_ROOT/<lesson id>/<run>/ and records the master playlist on
+# the lesson. Players read playlists through LessonHlsView and segments straight from storage.
+# A run's tree is deleted once the lesson's file is replaced or the lesson is deleted.
+
+HLS_ROOT = 'course/lessons/hls'
+SEGMENT_SECONDS = 6
+TRANSCODE_TIMEOUT = 6 * 60 * 60
+# A claim older than this belongs to a worker that died mid-transcode
+CLAIM_TIMEOUT = timedelta(seconds=TRANSCODE_TIMEOUT) + timedelta(minutes=30)
+
+_VIDEO_SIZE_RE = re.compile(rb'Stream #.*Video:.*?, (\d{2,5})x(\d{2,5})')
+_AUDIO_RE = re.compile(rb'Stream #.*Audio:')
+
+
+class TranscodeError(Exception):
+    pass
+
+
+def _ffmpeg():
+    from imageio_ffmpeg import get_ffmpeg_exe
+    return get_ffmpeg_exe()
+
+
+def probe_streams(source):
+    """(video height, has audio) from the stream headers."""
+    result = subprocess.run([_ffmpeg(), '-hide_banner', '-nostdin', '-i', source], capture_output=True, timeout=120)
+    size = _VIDEO_SIZE_RE.search(result.stderr)
+    if not size:
+        raise TranscodeError('No video stream found')
+    return int(size.group(2)), bool(_AUDIO_RE.search(result.stderr))
+
+
+def renditions_for(height):
+    # Never upscale; a source smaller than every rendition still gets the smallest one
+    renditions = [rendition for rendition in settings.HLS_RENDITIONS if rendition['height'] <= height]
+    return renditions or settings.HLS_RENDITIONS[:1]
+
+
+def ffmpeg_command(source, output_dir, renditions, has_audio):
+    count = len(renditions)
+    filters = f'[0:v]split={count}' + ''.join(f'[v{i}]' for i in range(count)) + ';' + ';'.join(
+        f'[v{i}]scale=-2:{rendition["height"]}[v{i}out]' for i, rendition in enumerate(renditions))
+    command = [_ffmpeg(), '-hide_banner', '-nostdin', '-loglevel', 'error', '-y', '-i', source,
+               '-filter_complex', filters]
+    for i, rendition in enumerate(renditions):
+        command += ['-map', f'[v{i}out]']
+        if has_audio:
+            command += ['-map', '0:a:0']
+    for i, rendition in enumerate(renditions):
+        command += [f'-c:v:{i}', 'libx264', f'-b:v:{i}', rendition['video_bitrate']]
+        if has_audio:
+            command += [f'-c:a:{i}', 'aac', f'-b:a:{i}', rendition['audio_bitrate']]
+    stream_map = [
+        f'v:{i},a:{i},name:{rendition["name"]}' if has_audio else f'v:{i},name:{rendition["name"]}'
+        for i, rendition in enumerate(renditions)
+    ]
+    return command + [
+        '-preset', 'veryfast',
+        # Keyframes on segment boundaries so every rendition switches cleanly
+        '-force_key_frames', f'expr:gte(t,n_forced*{SEGMENT_SECONDS})', '-sc_threshold', '0',
+        '-f', 'hls', '-hls_time', str(SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(output_dir, '%v', 'segment_%04d.ts'),
+        '-master_pl_name', 'master.m3u8', '-var_stream_map', ' '.join(stream_map),
+        os.path.join(output_dir, '%v', 'index.m3u8'),
+    ]
+
+
+def transcode(source, output_dir):
+    """
+    Write the HLS renditions of `source` (a path or URL) into `output_dir`. Runs in a pool
+    process, so it only shells out to ffmpeg and never touches the database.
+    """
+    height, has_audio = probe_streams(source)
+    renditions = renditions_for(height)
+    result = subprocess.run(ffmpeg_command(source, output_dir, renditions, has_audio),
+                            capture_output=True, timeout=TRANSCODE_TIMEOUT)
+    if result.returncode:
+        raise TranscodeError(result.stderr.decode(errors='replace')[-500:])
+    return [rendition['name'] for rendition in renditions]
+
+
+def publish(lesson, output_dir):
+    """Upload a finished rendition tree next to the lesson; returns (master playlist name, bytes uploaded)."""
+    prefix = f'{HLS_ROOT}/{lesson.pk}/{uuid4().hex[:12]}'
+    storage = lesson.file.storage
+    uploaded = 0
+    try:
+        for root, dirs, files in os.walk(output_dir):
+            for filename in files:
+                path = os.path.join(root, filename)
+                relative = os.path.relpath(path, output_dir).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    storage.save(f'{prefix}/{relative}', File(f))
+                uploaded += os.path.getsize(path)
+    except Exception:
+        delete_renditions(storage, prefix)
+        raise
+    return f'{prefix}/master.m3u8', uploaded
+
+
+def delete_renditions(storage, prefix):
+    """Delete everything stored under `prefix`: one run's tree, or HLS_ROOT/<lesson id> for every run."""
+    try:
+        directories, files = storage.listdir(prefix)
+    except FileNotFoundError:
+        return
+    for filename in files:
+        storage.delete(f'{prefix}/{filename}')
+    for directory in directories:
+        delete_renditions(storage, f'{prefix}/{directory}')
+
+
+def schedule_rendition_cleanup(storage, prefix):
+    # After commit, so a rolled-back file replacement keeps the renditions it would have orphaned
+    transaction.on_commit(lambda: delete_renditions(storage, prefix))
+
+
+def claim_transcodes(limit):
+    now = timezone.now()
+    with transaction.atomic():
+        queued = Lesson.objects.filter(
+            Q(hls_status=Lesson.HLS_PENDING) |
+            Q(hls_status=Lesson.HLS_RUNNING, hls_claimed_at__lt=now - CLAIM_TIMEOUT)
+        )
+        lessons = list(queued.select_for_update(skip_locked=True).order_by('id').only('id', 'file', 'section')[:limit])
+        Lesson.objects.filter(pk__in=[lesson.pk for lesson in lessons]) \
+            .update(hls_status=Lesson.HLS_RUNNING, hls_claimed_at=now)
+    return lessons
+
+
+def _record(lesson, **fields):
+    """Store a transcode outcome if the lesson is still claimed for the same file; returns whether it was."""
+    claimed = Lesson.objects.filter(pk=lesson.pk, hls_status=Lesson.HLS_RUNNING, file=lesson.file.name)
+    if not claimed.update(hls_claimed_at=None, **fields):
+        return False
+    # The update bypasses save() signals, so invalidate what renders the lesson here
+    Course.touch(*Section.objects.filter(pk=lesson.section_id).values_list('course_id', flat=True))
+    bump_generation(CATALOG)
+    return True
+
+
+def _finish(lesson, future, output_dir):
+    try:
+        renditions = future.result()
+        playlist, uploaded = publish(lesson, output_dir)
+    except (TranscodeError, subprocess.TimeoutExpired, OSError) as e:
+        logger.warning('HLS transcode failed for lesson %s: %s', lesson.pk, e)
+        _record(lesson, hls_status=Lesson.HLS_FAILED)
+        return
+    except Exception:
+        # Anything else, e.g. BrokenProcessPool after a child was killed, must not leave the lesson claimed
+        logger.exception('HLS transcode crashed for lesson %s', lesson.pk)
+        _record(lesson, hls_status=Lesson.HLS_FAILED)
+        return
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    logger.info('Lesson %s: %s renditions, %d bytes', lesson.pk, ', '.join(renditions), uploaded)
+    if not _record(lesson, hls_status=Lesson.HLS_READY, hls_playlist=playlist):
+        # The file was replaced or the lesson deleted mid-transcode; nothing will ever read this tree
+        delete_renditions(lesson.file.storage, posixpath.dirname(playlist))
+
+
+def _new_pool(workers, pool=None):
+    # A child killed mid-transcode (e.g. out of memory) breaks the whole pool; replace it
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def run_worker(workers=None, interval=5.0, once=False):
+    """
+    Keep up to `workers` ffmpeg transcodes running until the queue is empty (`once`) or forever.
+    Returns the number of lessons processed.
+    """
+    workers = workers or settings.HLS_WORKERS
+    total = 0
+    running = {}
+    pool = _new_pool(workers)
+    try:
+        while True:
+            for lesson in claim_transcodes(workers - len(running)) if len(running) < workers else []:
+                output_dir = tempfile.mkdtemp(prefix='hls-')
+                source = _media_source(lesson.file)
+                try:
+                    future = pool.submit(transcode, source, output_dir)
+                except BrokenProcessPool:
+                    pool = _new_pool(workers, pool)
+                    future = pool.submit(transcode, source, output_dir)
+                running[future] = (lesson, output_dir)
+            if not running:
+                if once:
+                    return total
+                time.sleep(interval)
+                continue
+            done, _ = wait(running, timeout=interval, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                lesson, output_dir = running.pop(future)
+                _finish(lesson, future, output_dir)
+                total += 1
+                broken = broken or (not future.cancelled() and isinstance(future.exception(), BrokenProcessPool))
+            if broken:
+                logger.warning('HLS worker pool broke; starting a new one')
+                pool = _new_pool(workers, pool)
+    finally:
+        pool.shutdown()
+
+
+def queue_existing():
+    """Queue every probed video lesson that has no renditions yet."""
+    videos = Q()
+    for extension in Lesson.VIDEO_EXTENTIONS:
+        videos |= Q(file__iendswith=f'.{extension}')
+    return Lesson.objects.filter(videos, media_status=Lesson.MEDIA_READY, hls_status='') \
+        .update(hls_status=Lesson.HLS_PENDING)
+
+
+def rewrite_playlist(storage, playlist_name, text):
+    """
+    Point a playlist's segment URIs at signed storage URLs so players fetch the bytes from storage
+    directly; nested playlists stay relative and come back through LessonHlsView.
+    """
+    directory = posixpath.dirname(playlist_name)
+    lines = []
+    for line in text.splitlines():
+        uri = line.strip()
+        if uri and not uri.startswith('#') and not uri.endswith('.m3u8'):
+            line = storage.url(posixpath.normpath(posixpath.join(directory, uri)))
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,204 @@
+import io
+import logging
+import os
+import posixpath
+import time
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+from .cache import bump_generation, CATALOG, SITE_CONTENT
+from .models import Course, ImageVariantJob
+
+logger = logging.getLogger(__name__)
+
+# Resized copies of uploaded images. Saving a model listed in IMAGE_FIELDS with a new image queues an
+# ImageVariantJob; the `render_image_variants` worker renders every IMAGE_VARIANT_WIDTHS width narrower
+# than the original in every IMAGE_VARIANT_FORMATS format, at names derived from the original
+# (see variant_name), and records {'source', 'layout', 'widths', 'formats'} in the model's `<field>_variants`.
+# Serializers expose them through ImageVariantsField so clients can pick the smallest that fits.
+
+# Model label -> (image field, cache namespace rendering it)
+IMAGE_FIELDS = {
+    'courses.Course': ('image', CATALOG),
+    'courses.StaffMember': ('image', SITE_CONTENT),
+    'courses.Testimonial': ('image', SITE_CONTENT),
+    'courses.PaymentStatus': ('image', None),
+    'core.User': ('profile_picture', None),
+}
+
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+CLAIM_TIMEOUT = timedelta(minutes=10)
+# Naming scheme of the stored variants; rows rendered under an older one are re-queued by queue_existing()
+VARIANT_LAYOUT = 2
+
+
+def variant_name(source, width, fmt, layout=VARIANT_LAYOUT):
+    if layout == VARIANT_LAYOUT:
+        # course/images/cover.png -> course/images/variants/cover.png/320.webp
+        return f'{posixpath.dirname(source)}/variants/{posixpath.basename(source)}/{width}.{EXTENSIONS[fmt]}'
+    # Layout 1 dropped the extension, so cover.png and cover.jpg shared (and overwrote) their variants
+    root = os.path.splitext(source)[0]
+    return f'{posixpath.dirname(root)}/variants/{posixpath.basename(root)}/{width}.{EXTENSIONS[fmt]}'
+
+
+def is_current(variants, name):
+    return variants.get('source') == name and variants.get('layout') == VARIANT_LAYOUT
+
+
+def variant_urls(field_file, variants):
+    """[{'width', <format>: url, ...}] narrowest first, or [] until the current image has been rendered."""
+    if not field_file or not is_current(variants, field_file.name):
+        return []
+    storage = field_file.storage
+    return [
+        {'width': width, **{fmt: storage.url(variant_name(field_file.name, width, fmt)) for fmt in variants['formats']}}
+        for width in variants['widths']
+    ]
+
+
+def _encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        if image.mode == 'RGBA':
+            flat = Image.new('RGB', image.size, 'white')
+            flat.paste(image, mask=image.getchannel('A'))
+            image = flat
+        image.save(buffer, 'JPEG', quality=82, optimize=True, progressive=True)
+    else:
+        image.save(buffer, 'WEBP', quality=80, method=4)
+    return buffer.getvalue()
+
+
+def _replace(storage, name, data):
+    # Deterministic names: a re-render overwrites instead of getting a suffixed copy
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(data))
+
+
+def render_variants(storage, source):
+    """Render and store the variants of `source`; returns the widths produced (none wider than the original)."""
+    with storage.open(source, 'rb') as f:
+        image = Image.open(f)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    widths = sorted(width for width in settings.IMAGE_VARIANT_WIDTHS if width < image.width)
+    for width in reversed(widths):
+        # Each width is resized from the previous (larger) one: same quality, far fewer pixels to filter
+        image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        for fmt in settings.IMAGE_VARIANT_FORMATS:
+            _replace(storage, variant_name(source, width, fmt), _encode(image, fmt))
+    return widths
+
+
+def delete_variants(storage, variants):
+    for width in variants.get('widths', []):
+        for fmt in variants.get('formats', []):
+            storage.delete(variant_name(variants['source'], width, fmt, variants.get('layout', 1)))
+
+
+def queue_variants(instance):
+    """Queue a job (after commit) if the instance's image has no variants yet."""
+    label = instance._meta.label
+    field, _ = IMAGE_FIELDS[label]
+    name = getattr(instance, field).name
+    if not name or is_current(getattr(instance, f'{field}_variants'), name):
+        return
+
+    def enqueue():
+        try:
+            ImageVariantJob.objects.update_or_create(
+                model=label, object_id=instance.pk, defaults={'source': name, 'claimed_at': None})
+        except IntegrityError:
+            # A concurrent save queued it first; the next save or queue_existing() catches a lost update
+            pass
+    transaction.on_commit(enqueue)
+
+
+def queue_existing():
+    """Queue every image whose variants are missing or out of date. Returns the number queued."""
+    jobs = []
+    for label, (field, _) in IMAGE_FIELDS.items():
+        model = apps.get_model(label)
+        rows = model.objects.exclude(Q(**{field: ''}) | Q(**{f'{field}__isnull': True})) \
+            .values_list('pk', field, f'{field}_variants')
+        jobs += [
+            ImageVariantJob(model=label, object_id=pk, source=name)
+            for pk, name, variants in rows.iterator() if not is_current(variants, name)
+        ]
+    ImageVariantJob.objects.bulk_create(jobs, batch_size=500, ignore_conflicts=True)
+    return len(jobs)
+
+
+def claim_jobs(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        queued = ImageVariantJob.objects.filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - CLAIM_TIMEOUT))
+        jobs = list(queued.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+        ImageVariantJob.objects.filter(pk__in=[job.pk for job in jobs]).update(claimed_at=now)
+    return jobs
+
+
+def render_job(job):
+    """Render one job's variants. Returns True if the model row was updated."""
+    model = apps.get_model(job.model)
+    field, _ = IMAGE_FIELDS[job.model]
+    variants_field = f'{field}_variants'
+    # Filtering on the source skips rows deleted or given a newer image since the job was queued
+    current = model.objects.filter(pk=job.object_id, **{field: job.source}).values_list(variants_field, flat=True)
+    previous = current.first()
+    if previous is None:
+        return False
+
+    storage = model._meta.get_field(field).storage
+    try:
+        variants = {'source': job.source, 'layout': VARIANT_LAYOUT, 'widths': render_variants(storage, job.source),
+                    'formats': list(settings.IMAGE_VARIANT_FORMATS)}
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning('Image variants failed for %s #%s: %s', job.model, job.object_id, e)
+        variants = {'source': job.source, 'layout': VARIANT_LAYOUT, 'widths': [], 'formats': [], 'error': str(e)[:200]}
+
+    updated = current.update(**{variants_field: variants})
+    # Re-rendering the same image overwrote its files in place; anything else left the old ones behind
+    if updated and previous.get('source') and not is_current(previous, job.source):
+        delete_variants(storage, previous)
+    return bool(updated)
+
+
+def render_jobs(batch_size=20):
+    """Render one batch of queued jobs and invalidate what displays them. Returns the number of jobs processed."""
+    jobs = claim_jobs(batch_size)
+    courses, namespaces = set(), set()
+    for job in jobs:
+        if render_job(job):
+            namespaces.add(IMAGE_FIELDS[job.model][1])
+            if job.model == Course._meta.label:
+                courses.add(job.object_id)
+        # A job re-queued for a newer image while this one ran keeps its row
+        ImageVariantJob.objects.filter(pk=job.pk, source=job.source).delete()
+
+    if courses:
+        Course.touch(*courses)
+    for namespace in namespaces - {None}:
+        bump_generation(namespace)
+    return len(jobs)
+
+
+def run_worker(batch_size=20, interval=5.0, once=False):
+    """Render queued variants until the queue is empty (`once`) or forever, sleeping `interval` when idle."""
+    total = 0
+    while True:
+        processed = render_jobs(batch_size)
+        total += processed
+        if not processed:
+            if once:
+                return total
+            time.sleep(interval)
@@ -0,0 +1,70 @@
+from django.db import transaction
+from .cache import bump_generation, CATALOG
+from .durations import schedule_duration_rollup
+from .models import Course, Lesson, Section
+from .ordering import ORDER_GAP, append_key
+from .progress import schedule_lesson_count_refresh
+
+
+class LessonBatchError(Exception):
+    pass
+
+
+def lock_section(section_id):
+    """Lock the section row for the rest of the transaction, so concurrent writers assign lesson order one at a time."""
+    return Section.objects.select_for_update().get(pk=section_id)
+
+
+def next_lesson_order(section):
+    # Call with the section locked (lock_section), or two writers may pick the same order
+    return append_key(Lesson.objects.filter(section=section))
+
+
+def apply_lesson_batch(section_id, create=(), order=None, delete=()):
+    """
+    Apply a batch of lesson changes to one section in a single transaction: delete the `delete` ids,
+    re-key the remaining lessons in `order` when given (which must list all of them), then append
+    the `create` lessons (unsaved Lesson instances) with bulk_create. Counters and durations are
+    refreshed once. Returns the section's lessons in order.
+    """
+    with transaction.atomic():
+        section = lock_section(section_id)
+        lessons = {lesson.pk: lesson for lesson in Lesson.objects.filter(section=section).only('id', 'order')}
+
+        unknown = set(delete) - lessons.keys()
+        if unknown:
+            raise LessonBatchError(f'Lessons {sorted(unknown)} are not in this section.')
+        if delete:
+            Lesson.objects.filter(pk__in=delete).delete()
+            for pk in delete:
+                del lessons[pk]
+
+        if order is not None:
+            if len(order) != len(set(order)) or set(order) != lessons.keys():
+                raise LessonBatchError('`order` must list every remaining lesson of the section exactly once.')
+            # A full reorder re-keys the section ORDER_GAP apart; only changed rows are written
+            changed = []
+            for position, pk in enumerate(order, start=1):
+                lesson = lessons[pk]
+                if lesson.order != position * ORDER_GAP:
+                    lesson.order = position * ORDER_GAP
+                    changed.append(lesson)
+            Lesson.objects.bulk_update(changed, ['order'], batch_size=500)
+
+        last = max((lesson.order for lesson in lessons.values()), default=0)
+        bits = Course.allocate_progress_bits(section.course_id, len(create)) if create else ()
+        for position, (lesson, bit) in enumerate(zip(create, bits), start=1):
+            lesson.section = section
+            lesson.order = last + position * ORDER_GAP
+            lesson.progress_bit = bit
+            lesson.prepare_media()
+        Lesson.objects.bulk_create(create, batch_size=500)
+
+        # bulk_create/bulk_update skip the Lesson signals, so refresh what they would have
+        Section.objects.filter(pk=section.pk).update(number_of_lessons=len(lessons) + len(create))
+        schedule_duration_rollup(section.pk)
+        if create:
+            schedule_lesson_count_refresh(section.course_id)
+        Course.touch(section.course_id)
+        bump_generation(CATALOG)
+    return Lesson.objects.filter(section_id=section_id).order_by('order', 'id')
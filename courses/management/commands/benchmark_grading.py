@@ -0,0 +1,65 @@
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from courses.grading import grade_submission
+from courses.models import Collection, Course, Option, Question, Section, StudentAnswer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Count the queries (and time) of grading an answer-all submission at several quiz sizes; '
+            'all rows are rolled back afterwards. The count should not grow with the quiz.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[5, 50, 200])
+        parser.add_argument('--options', type=int, default=4, help='Options per question.')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['sizes'], options['options'])
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def run(self, sizes, option_count):
+        User = get_user_model()
+        instructor = User.objects.create(email='grading-benchmark@example.com', role='instructor')
+        student = User.objects.create(email='grading-benchmark-student@example.com', role='student')
+        course = Course.objects.create(
+            title='Grading benchmark', objectives='-', description='-', syllabus='-', courseFor='-', price=10,
+            instructor=instructor, collection=Collection.objects.create(title='Grading benchmark'),
+            preview='benchmark/grading.mp4', image='benchmark.jpg',
+        )
+
+        self.stdout.write(f'{"questions":>9}  {"first":>14}  {"resubmit":>14}')
+        for size in sizes:
+            section = Section.objects.create(course=course, title=f'{size} questions')
+            questions = [Question.objects.create(section=section, text=f'Q{i}') for i in range(size)]
+            Option.objects.bulk_create([
+                Option(question=question, text=f'O{i}', is_correct=i == 0)
+                for question in questions for i in range(option_count)
+            ])
+            options = {}
+            for option_id, question_id, is_correct in Option.objects.filter(question__section=section) \
+                    .order_by('id').values_list('id', 'question_id', 'is_correct'):
+                options.setdefault(question_id, []).append(option_id)
+
+            # First attempt inserts every answer; a resubmission (every other answer changed) updates them
+            first = [{'question_id': q.pk, 'option_id': options[q.pk][0]} for q in questions]
+            second = [{'question_id': q.pk, 'option_id': options[q.pk][i % 2]} for i, q in enumerate(questions)]
+            results = [self.measure(student, section, answers) for answers in (first, second)]
+            assert StudentAnswer.objects.filter(student=student, question__section=section).count() == size
+            self.stdout.write(f'{size:>9}  ' + '  '.join(
+                f'{queries:>3} q {elapsed:6.1f}ms' for queries, elapsed in results))
+
+    def measure(self, student, section, answers):
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            grade_submission(student, section, answers)
+        return len(queries.captured_queries), (time.perf_counter() - started) * 1000
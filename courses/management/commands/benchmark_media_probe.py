@@ -0,0 +1,128 @@
+import os
+import shutil
+import statistics
+import struct
+import subprocess
+import tempfile
+import time
+from django.core.management.base import BaseCommand, CommandError
+from courses.containers import ContainerError, header_duration
+from courses.media import MediaProbeError, ffmpeg_duration
+
+
+class CountingFile:
+    """File wrapper that counts the bytes and reads the header parser actually does."""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.bytes_read = 0
+        self.reads = 0
+
+    def read(self, size):
+        data = self.file.read(size)
+        self.bytes_read += len(data)
+        self.reads += 1
+        return data
+
+    def seek(self, offset, whence=0):
+        return self.file.seek(offset, whence)
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class Command(BaseCommand):
+    help = ('Compare lesson duration probing: container-header parser vs ffmpeg vs moviepy. '
+            'Pass video paths, or --synthetic-gb to build a sparse multi-GB MP4 to measure against.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*')
+        parser.add_argument('--synthetic-gb', type=float, default=0)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--skip-moviepy', action='store_true')
+
+    def handle(self, *args, **options):
+        paths = list(options['paths'])
+        workdir = None
+        if options['synthetic_gb']:
+            workdir = tempfile.mkdtemp(prefix='media-probe-benchmark-')
+            paths.append(self.synthetic_mp4(workdir, options['synthetic_gb']))
+        if not paths:
+            raise CommandError('Pass at least one video path or --synthetic-gb.')
+        try:
+            for path in paths:
+                self.benchmark(path, options['repeat'], options['skip_moviepy'])
+        finally:
+            if workdir:
+                shutil.rmtree(workdir)
+
+    def synthetic_mp4(self, workdir, gigabytes):
+        # A real 60s clip with a sparse `free` box between mdat and moov, so the moov sits past
+        # several GB like an unoptimized upload while sample offsets (and decoding) stay valid.
+        from imageio_ffmpeg import get_ffmpeg_exe
+        clip = os.path.join(workdir, 'clip.mp4')
+        subprocess.run([get_ffmpeg_exe(), '-y', '-loglevel', 'error', '-f', 'lavfi',
+                        '-i', 'testsrc=duration=60:size=320x240:rate=25', clip], check=True)
+        with open(clip, 'rb') as f:
+            data = f.read()
+        moov = data.rfind(b'moov') - 4
+        padding = int(gigabytes * 1024 ** 3)
+
+        path = os.path.join(workdir, f'synthetic-{gigabytes:g}gb.mp4')
+        with open(path, 'wb') as f:
+            f.write(data[:moov])
+            f.write(struct.pack('>I4sQ', 1, b'free', padding))
+            f.seek(padding - 16, os.SEEK_CUR)
+            f.write(data[moov:])
+        return path
+
+    def timed(self, repeat, probe):
+        timings, result = [], None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = probe()
+            timings.append((time.perf_counter() - started) * 1000)
+        return result, statistics.median(timings)
+
+    def benchmark(self, path, repeat, skip_moviepy):
+        extension = os.path.splitext(path)[1][1:]
+        self.stdout.write(f'{os.path.basename(path)} ({os.path.getsize(path) / 1024 ** 3:.2f} GB)')
+
+        def parse():
+            stream = CountingFile(path)
+            try:
+                return header_duration(stream, extension), stream
+            finally:
+                stream.close()
+        try:
+            (duration, stream), elapsed = self.timed(repeat, parse)
+            self.stdout.write(f'  header parser  {duration:10.2f}s  p50={elapsed:9.2f}ms  '
+                              f'{stream.reads} reads, {stream.bytes_read} bytes')
+        except ContainerError as e:
+            self.stdout.write(f'  header parser  unsupported ({e})')
+
+        try:
+            duration, elapsed = self.timed(repeat, lambda: ffmpeg_duration(path, path))
+            self.stdout.write(f'  ffmpeg -i      {duration:10d}s  p50={elapsed:9.2f}ms')
+        except MediaProbeError as e:
+            self.stdout.write(f'  ffmpeg -i      failed ({e})')
+
+        if skip_moviepy:
+            return
+        try:
+            from moviepy.editor import VideoFileClip
+        except ImportError:
+            self.stdout.write('  moviepy        not installed')
+            return
+
+        def clip_duration():
+            clip = VideoFileClip(path)
+            try:
+                return clip.duration
+            finally:
+                clip.close()
+        duration, elapsed = self.timed(repeat, clip_duration)
+        self.stdout.write(f'  moviepy        {duration:10.2f}s  p50={elapsed:9.2f}ms')
@@ -0,0 +1,87 @@
+import random
+import statistics
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from courses.models import Collection, Course, CourseSearchTerm
+from courses.search import build_terms, rank_courses, search_course_ids, term_weights, tokenize
+
+
+WORDS = (
+    'python django react javascript design marketing finance excel data science machine learning '
+    'statistics photography music guitar piano drawing writing business leadership management '
+    'cloud security network linux docker kubernetes sql database testing agile product video '
+    'editing animation english spanish french cooking fitness yoga health accounting startup sales'
+).split()
+
+QUERIES = ['python', 'django web', 'machine learning data', 'guitar music', 'cloud security linux', 'nomatch']
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measure search latency against a synthetic catalog; all rows are rolled back afterwards.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['courses'], options['repeat'], random.Random(options['seed']))
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def sentence(self, rng, length):
+        return ' '.join(rng.choice(WORDS) for _ in range(length))
+
+    def run(self, count, repeat, rng):
+        instructor = get_user_model().objects.create(email='search-benchmark@example.com', role='instructor')
+        collection = Collection.objects.create(title='Search benchmark')
+
+        started = time.perf_counter()
+        for start in range(0, count, 1000):
+            courses = Course.objects.bulk_create([
+                Course(
+                    title=self.sentence(rng, 4), objectives=self.sentence(rng, 12),
+                    description=self.sentence(rng, 40), syllabus=self.sentence(rng, 20),
+                    courseFor=self.sentence(rng, 3), price=10, instructor=instructor,
+                    collection=collection, preview=f'benchmark/{i}.mp4', image='benchmark.jpg',
+                )
+                for i in range(start, min(start + 1000, count))
+            ])
+            # bulk_create skips post_save, so build the postings directly
+            if courses[0].pk is None:
+                courses = list(Course.objects.filter(collection=collection).order_by('-id')[:len(courses)])
+            CourseSearchTerm.objects.bulk_create([
+                CourseSearchTerm(course=course, term=term, weight=weight)
+                for course in courses for term, weight in build_terms(course).items()
+            ], batch_size=5000)
+        self.stdout.write(f'Indexed {count} courses in {time.perf_counter() - started:.1f}s')
+
+        postings = CourseSearchTerm.objects.filter(course__is_active=True)
+        for query in QUERIES:
+            top_k = self.time(repeat, lambda: search_course_ids(query, limit=30))
+            idf = term_weights(list(dict.fromkeys(tokenize(query))))
+            exhaustive = self.time(repeat, lambda: rank_courses(postings, idf, 30) if idf else [])
+            # Scores are compared rounded: the two paths add the same terms in a different order
+            same = [round(score, 6) for _, score in top_k[0]] == [round(score, 6) for _, score in exhaustive[0]]
+            self.stdout.write(
+                f'{query!r:28} top-k p50={top_k[1]:7.1f}ms p95={top_k[2]:7.1f}ms   '
+                f'exhaustive p50={exhaustive[1]:7.1f}ms p95={exhaustive[2]:7.1f}ms   {"same" if same else "DIFFERENT"} ranking'
+            )
+
+    def time(self, repeat, search):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = search()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return result, statistics.median(timings), timings[max(int(len(timings) * 0.95) - 1, 0)]
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from courses.uploads import clear_stale_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete unfinished upload sessions older than UPLOAD_SESSION_MAX_AGE, with their stored chunks.'
+
+    def handle(self, *args, **options):
+        count = clear_stale_sessions()
+        self.stdout.write(self.style.SUCCESS(f'Removed {count} upload sessions.'))
@@ -0,0 +1,28 @@
+import sys
+from django.core.management.base import BaseCommand
+from courses.models import Course
+from courses.transfer import export_courses
+
+
+class Command(BaseCommand):
+    help = 'Stream courses with their sections, lessons and questions as NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', help='File to write to (defaults to stdout).')
+        parser.add_argument('--ids', help='Comma-separated course ids to export.')
+
+    def handle(self, *args, **options):
+        queryset = Course.objects.all()
+        if options['ids']:
+            queryset = queryset.filter(pk__in=options['ids'].split(','))
+
+        output = open(options['output'], 'w', encoding='utf-8') if options['output'] else sys.stdout
+        try:
+            count = 0
+            for line in export_courses(queryset):
+                output.write(line)
+                count += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        self.stderr.write(self.style.SUCCESS(f'Exported {count} courses.'))
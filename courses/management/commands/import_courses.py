@@ -0,0 +1,26 @@
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from courses.transfer import import_courses, CourseImportError
+
+
+class Command(BaseCommand):
+    help = 'Import NDJSON course trees produced by export_courses.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="NDJSON file to import, or '-' for stdin.")
+        parser.add_argument('--batch-size', type=int, default=50, help='Courses per transaction.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        source = sys.stdin if options['path'] == '-' else open(options['path'], encoding='utf-8')
+        try:
+            courses, lessons = import_courses(source, batch_size=options['batch_size'])
+        except CourseImportError as e:
+            raise CommandError(str(e))
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {courses} courses and {lessons} lessons in {time.perf_counter() - started:.1f}s.'
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from courses.media import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Probe queued lesson videos for their duration and update section/course totals.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        total = run_worker(batch_size=options['batch_size'], interval=options['interval'], once=options['once'])
+        self.stdout.write(self.style.SUCCESS(f'Probed {total} lessons.'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from courses.cache import bump_generation, CATALOG
+from courses.models import Course, Lesson, Section
+from courses.ordering import crowded_parents, rebalance
+
+
+class Command(BaseCommand):
+    help = ('Re-space the order keys of sections and lessons whose neighbours have run short of room, '
+            'so later moves stay single-row updates. Safe to run periodically.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-gap', type=int, default=8,
+                            help='Rebalance a parent when two neighbouring keys are closer than this.')
+
+    def handle(self, *args, **options):
+        touched = set()
+        for course_id in crowded_parents(Section, 'course_id', options['min_gap']):
+            with transaction.atomic():
+                Course.objects.select_for_update().filter(pk=course_id).first()
+                rebalance(Section.objects.filter(course_id=course_id))
+            touched.add(course_id)
+        sections = crowded_parents(Lesson, 'section_id', options['min_gap'])
+        for section_id in sections:
+            with transaction.atomic():
+                Section.objects.select_for_update().filter(pk=section_id).first()
+                rebalance(Lesson.objects.filter(section_id=section_id))
+        touched.update(Section.objects.filter(pk__in=sections).values_list('course_id', flat=True))
+
+        if touched:
+            Course.touch(*touched)
+            bump_generation(CATALOG)
+        self.stdout.write(self.style.SUCCESS(f'Rebalanced {len(touched)} courses.'))
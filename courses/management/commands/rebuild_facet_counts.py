@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from courses.facets import rebuild_facet_counts
+
+
+class Command(BaseCommand):
+    help = 'Recount the catalog facet counts from the course table.'
+
+    def handle(self, *args, **options):
+        counts = rebuild_facet_counts()
+        self.stdout.write(self.style.SUCCESS(f'Stored {len(counts)} facet values.'))
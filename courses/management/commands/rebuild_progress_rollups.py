@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from courses.dashboard import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recount the instructor dashboard rollups from the progress and quiz score tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses',
+                            help='Only this course id (repeatable). Defaults to every course.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            counts = rebuild_rollups(options['courses'])
+        self.stdout.write(self.style.SUCCESS(f'Stored {len(counts)} rollup counts.'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from courses.models import Course
+from courses.progress import PROGRESS_CHUNK_SIZE, recompute_course_progress
+
+
+class Command(BaseCommand):
+    help = ('Recount lessons per course and rewrite every student\'s progress from the stored counters, '
+            'in chunks. Use after structural changes made outside the app (raw SQL, restores).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses',
+                            help='Only this course id (repeatable). Defaults to every course.')
+        parser.add_argument('--chunk-size', type=int, default=PROGRESS_CHUNK_SIZE,
+                            help='Progress rows per UPDATE.')
+        parser.add_argument('--recount', action='store_true',
+                            help='Also clear bits of deleted lessons and rebuild completed counts from the bitsets.')
+
+    def handle(self, *args, **options):
+        courses = Course.objects.order_by('pk')
+        if options['courses']:
+            courses = courses.filter(pk__in=options['courses'])
+        counts = courses.annotate(lessons=Count('sections__lessons')).values_list('pk', 'lessons')
+
+        total = 0
+        for course_id, lessons in counts.iterator(chunk_size=500):
+            Course.objects.filter(pk=course_id).exclude(lesson_count=lessons).update(lesson_count=lessons)
+            recompute_course_progress(course_id, options['chunk_size'], recount=options['recount'])
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f'Recomputed progress for {total} courses.'))
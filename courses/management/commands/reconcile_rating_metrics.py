@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from courses.ratings import reconcile_rating_metrics
+
+
+class Command(BaseCommand):
+    help = 'Repair courses whose running rating aggregates drifted from the Rating table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        repaired = reconcile_rating_metrics(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Repaired {len(repaired)} courses.'))
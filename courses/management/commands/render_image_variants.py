@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from courses.images import queue_existing, run_worker
+
+
+class Command(BaseCommand):
+    help = 'Render resized WebP/JPEG variants of queued course, profile, staff, testimonial and payment images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty.')
+        parser.add_argument('--queue-existing', action='store_true',
+                            help='First queue every image whose variants are missing or out of date.')
+
+    def handle(self, *args, **options):
+        if options['queue_existing']:
+            self.stdout.write(f'Queued {queue_existing()} images.')
+        total = run_worker(batch_size=options['batch_size'], interval=options['interval'], once=options['once'])
+        self.stdout.write(self.style.SUCCESS(f'Rendered variants for {total} images.'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from courses.hls import queue_existing, run_worker
+
+
+class Command(BaseCommand):
+    help = 'Transcode queued lesson videos into HLS renditions in a bounded pool of ffmpeg processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Concurrent transcodes (default HLS_WORKERS).')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty.')
+        parser.add_argument('--queue-existing', action='store_true',
+                            help='First queue every probed video that has no renditions yet.')
+
+    def handle(self, *args, **options):
+        if options['queue_existing']:
+            self.stdout.write(f'Queued {queue_existing()} lessons.')
+        total = run_worker(workers=options['workers'], interval=options['interval'], once=options['once'])
+        self.stdout.write(self.style.SUCCESS(f'Transcoded {total} lessons.'))
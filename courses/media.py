@@ -0,0 +1,130 @@
+import logging
+import os
+import re
+import subprocess
+import time
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .containers import ContainerError, HEADER_EXTENSIONS, RangeReader, header_duration
+from .models import Lesson
+from .durations import recompute_durations
+
+logger = logging.getLogger(__name__)
+
+# A claimed lesson whose probe hasn't finished after this long is assumed lost (worker crashed) and re-queued
+PROBE_TIMEOUT = timedelta(minutes=10)
+FFMPEG_TIMEOUT = 60
+
+_DURATION_RE = re.compile(rb'Duration:\s*(\d+):(\d{2}):(\d{2}(?:\.\d+)?)')
+
+
+class MediaProbeError(Exception):
+    pass
+
+
+def _media_source(field_file):
+    # Local storages have a filesystem path; remote ones (S3) give a signed URL to read headers from
+    try:
+        return field_file.storage.path(field_file.name)
+    except NotImplementedError:
+        return field_file.storage.url(field_file.name)
+
+
+def _open_source(source):
+    if os.path.exists(source):
+        return open(source, 'rb')
+    return RangeReader(source)
+
+
+def probe_duration(field_file):
+    """
+    Return the duration of a stored video in whole seconds. MP4/MOV and MKV/WebM durations are read
+    from the container headers with a few ranged reads; anything else (or a file whose headers the
+    parser can't use) falls back to ffmpeg. Either way nothing is decoded or downloaded in full.
+    """
+    source = _media_source(field_file)
+    extension = os.path.splitext(field_file.name)[1][1:].lower()
+    if extension in HEADER_EXTENSIONS:
+        try:
+            stream = _open_source(source)
+            try:
+                return int(header_duration(stream, extension))
+            finally:
+                stream.close()
+        except (ContainerError, OSError) as e:
+            logger.info('Header parse failed for %s, falling back to ffmpeg: %s', field_file.name, e)
+    return ffmpeg_duration(source, field_file.name)
+
+
+def ffmpeg_duration(source, name):
+    """Duration in whole seconds as reported by `ffmpeg -i` (no output, so only the headers are probed)."""
+    from imageio_ffmpeg import get_ffmpeg_exe
+
+    try:
+        result = subprocess.run(
+            [get_ffmpeg_exe(), '-hide_banner', '-nostdin', '-i', source],
+            capture_output=True, timeout=FFMPEG_TIMEOUT,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise MediaProbeError(f'{name}: {e}')
+    match = _DURATION_RE.search(result.stderr)
+    if not match:
+        raise MediaProbeError(f'{name}: no duration in media headers')
+    hours, minutes, seconds = match.groups()
+    return int(int(hours) * 3600 + int(minutes) * 60 + float(seconds))
+
+
+def claim_lessons(batch_size):
+    """Mark up to `batch_size` queued lessons as probing and return them; concurrent workers skip each other's rows."""
+    now = timezone.now()
+    with transaction.atomic():
+        queued = Lesson.objects.filter(
+            Q(media_status=Lesson.MEDIA_PENDING) |
+            Q(media_status=Lesson.MEDIA_PROBING, media_claimed_at__lt=now - PROBE_TIMEOUT)
+        )
+        lessons = list(queued.select_for_update(skip_locked=True).order_by('id').only('id', 'file', 'section_id')[:batch_size])
+        Lesson.objects.filter(pk__in=[lesson.pk for lesson in lessons]) \
+            .update(media_status=Lesson.MEDIA_PROBING, media_claimed_at=now)
+    return lessons
+
+
+def probe_lessons(batch_size=10):
+    """
+    Probe one batch of queued lessons, store their durations and recompute the totals of the
+    sections they belong to (once per section). Returns the number of lessons processed.
+    """
+    lessons = claim_lessons(batch_size)
+    for lesson in lessons:
+        try:
+            duration, status = probe_duration(lesson.file), Lesson.MEDIA_READY
+        except MediaProbeError as e:
+            logger.warning('Media probe failed for lesson %s: %s', lesson.pk, e)
+            duration, status = 0, Lesson.MEDIA_FAILED
+        except Exception:
+            # A malformed upload must not stop the worker, or its claim would be retried forever
+            logger.exception('Media probe crashed on lesson %s', lesson.pk)
+            duration, status = 0, Lesson.MEDIA_FAILED
+        # update() rather than save(): the probe result must not re-queue the lesson or re-run the save hooks.
+        # Filtering on the claim keeps a re-queued (newly uploaded) lesson from getting a stale result.
+        # A probed video is queued for HLS transcoding (courses/hls.py).
+        Lesson.objects.filter(pk=lesson.pk, media_status=Lesson.MEDIA_PROBING, file=lesson.file.name) \
+            .update(duration=duration, media_status=status, media_claimed_at=None,
+                    hls_status=Lesson.HLS_PENDING if status == Lesson.MEDIA_READY else '')
+
+    if lessons:
+        recompute_durations({lesson.section_id for lesson in lessons})
+    return len(lessons)
+
+
+def run_worker(batch_size=10, interval=5.0, once=False):
+    """Probe queued lessons until the queue is empty (`once`) or forever, sleeping `interval` when idle."""
+    total = 0
+    while True:
+        processed = probe_lessons(batch_size)
+        total += processed
+        if not processed:
+            if once:
+                return total
+            time.sleep(interval)
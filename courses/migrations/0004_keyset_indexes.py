@@ -0,0 +1,29 @@
+# Generated by Django 4.2.17 on 2026-10-18 19:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0003_staffmember_is_admin'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['price', 'id'], name='courses_cou_price_320d23_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['last_update', 'id'], name='courses_cou_last_up_75f34a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'placed_at', 'id'], name='courses_ord_custome_2eb034_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['course', 'created_at', 'id'], name='courses_rev_course__6d09d4_idx'),
+        ),
+    ]
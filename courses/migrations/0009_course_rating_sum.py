@@ -0,0 +1,32 @@
+# Generated by Django 4.2.17 on 2026-10-18 19:49
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, FloatField, IntegerField
+from django.db.models.functions import Coalesce, Round
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    Rating = apps.get_model('courses', 'Rating')
+    ratings = Rating.objects.filter(course=OuterRef('pk')).order_by().values('course')
+    count = Coalesce(Subquery(ratings.annotate(total=Count('id')).values('total'), output_field=IntegerField()), 0)
+    total = Coalesce(Subquery(ratings.annotate(total=Sum('score')).values('total'), output_field=FloatField()), 0.0)
+    Course.objects.update(rating_count=count, rating_sum=total)
+    Course.objects.filter(rating_count__gt=0).update(average_rating=Round(models.F('rating_sum') / models.F('rating_count'), 2))
+    Course.objects.filter(rating_count=0).update(average_rating=0.0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_coursefacetcount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='rating_sum',
+            field=models.FloatField(blank=True, default=0.0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
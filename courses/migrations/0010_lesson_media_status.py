@@ -0,0 +1,27 @@
+# Generated by Django 4.2.17 on 2026-10-18 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_course_rating_sum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='media_claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='media_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('probing', 'Probing'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['media_status', 'id'], name='courses_les_media_s_6057d5_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.17 on 2026-10-18 20:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='hls_claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='hls_playlist',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='hls_status',
+            field=models.CharField(blank=True, choices=[('', 'None'), ('pending', 'Pending'), ('running', 'Running'), ('ready', 'Ready'), ('failed', 'Failed')], default='', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['hls_status', 'id'], name='courses_les_hls_sta_2f2f52_idx'),
+        ),
+    ]
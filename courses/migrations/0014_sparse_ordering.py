@@ -0,0 +1,53 @@
+# Generated by Django 4.2.17 on 2026-10-18 20:14
+
+from django.db import migrations, models
+from django.db.models import F
+
+ORDER_GAP = 1024
+
+
+def spread(model, parent_field):
+    # Renumber every parent's children ORDER_GAP apart in their current (order, id) sequence
+    changed, previous, position = [], None, 0
+    for item in model.objects.order_by(parent_field, 'order', 'id').only('id', parent_field, 'order').iterator():
+        parent = getattr(item, parent_field)
+        position = position + 1 if parent == previous else 1
+        previous = parent
+        item.order = position * ORDER_GAP
+        changed.append(item)
+        if len(changed) >= 1000:
+            model.objects.bulk_update(changed, ['order'])
+            changed = []
+    model.objects.bulk_update(changed, ['order'])
+
+
+def backfill_order(apps, schema_editor):
+    # Sections had no order and were shown by id; lessons had dense 1..n keys
+    spread(apps.get_model('courses', 'Section'), 'course_id')
+    spread(apps.get_model('courses', 'Lesson'), 'section_id')
+    # Stored outlines now carry section order
+    apps.get_model('courses', 'Course').objects.update(version=F('version') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0013_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='section',
+            name='order',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_order, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['section', 'order', 'id'], name='courses_les_section_85a768_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='section',
+            index=models.Index(fields=['course', 'order', 'id'], name='courses_sec_course__518f68_idx'),
+        ),
+    ]
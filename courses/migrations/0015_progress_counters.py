@@ -0,0 +1,48 @@
+# Generated by Django 4.2.17 on 2026-10-18 20:17
+
+from django.db import migrations, models
+from django.db.models import Count, F, FloatField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Least, NullIf
+
+
+def backfill_counters(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    Lesson = apps.get_model('courses', 'Lesson')
+    CourseProgress = apps.get_model('courses', 'CourseProgress')
+    CompletedLesson = CourseProgress.completed_lessons.through
+
+    lessons = Lesson.objects.filter(section__course_id=OuterRef('pk')).order_by() \
+        .values('section__course_id').annotate(total=Count('id')).values('total')
+    Course.objects.update(lesson_count=Coalesce(Subquery(lessons), Value(0)))
+
+    completed = CompletedLesson.objects.filter(courseprogress_id=OuterRef('pk')).order_by() \
+        .values('courseprogress_id').annotate(total=Count('lesson_id')).values('total')
+    CourseProgress.objects.update(completed_count=Coalesce(Subquery(completed), Value(0)))
+
+    lesson_count = Subquery(Course.objects.filter(pk=OuterRef('course_id')).values('lesson_count')[:1])
+    CourseProgress.objects.update(progress=Coalesce(
+        Least(F('completed_count') * Value(100.0) / NullIf(lesson_count, 0), Value(100.0)),
+        Value(0.0), output_field=FloatField()))
+    CourseProgress.objects.filter(progress__gte=100.0).update(completed=True)
+    CourseProgress.objects.filter(progress__lt=100.0).update(completed=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0014_sparse_ordering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='lesson_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='completed_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+from collections import defaultdict
+from django.db import migrations, models
+from django.db.models import F, FloatField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Least, NullIf
+
+
+def backfill_bitsets(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    Lesson = apps.get_model('courses', 'Lesson')
+    CourseProgress = apps.get_model('courses', 'CourseProgress')
+    CompletedLesson = CourseProgress.completed_lessons.through
+
+    # Number each course's lessons 0..n-1 in outline order
+    next_bit, changed = defaultdict(int), []
+    lessons = Lesson.objects.order_by('section__course_id', 'section__order', 'section_id', 'order', 'id') \
+        .values_list('id', 'section__course_id')
+    bit_of = {}
+    for lesson_id, course_id in lessons.iterator():
+        bit_of[lesson_id] = (course_id, next_bit[course_id])
+        changed.append(Lesson(pk=lesson_id, progress_bit=next_bit[course_id]))
+        next_bit[course_id] += 1
+        if len(changed) >= 1000:
+            Lesson.objects.bulk_update(changed, ['progress_bit'])
+            changed = []
+    Lesson.objects.bulk_update(changed, ['progress_bit'])
+    Course.objects.bulk_update([Course(pk=pk, next_progress_bit=bits) for pk, bits in next_bit.items()],
+                               ['next_progress_bit'], batch_size=1000)
+
+    # Fold the completed_lessons rows into one bitset per progress row
+    course_of = dict(CourseProgress.objects.values_list('id', 'course_id'))
+    values = defaultdict(int)
+    for progress_id, lesson_id in CompletedLesson.objects.values_list('courseprogress_id', 'lesson_id').iterator():
+        course_id, bit = bit_of[lesson_id]
+        if course_id == course_of[progress_id]:
+            values[progress_id] |= 1 << bit
+    CourseProgress.objects.bulk_update([
+        CourseProgress(pk=pk, completed_bits=value.to_bytes((value.bit_length() + 7) // 8, 'little'),
+                       completed_count=value.bit_count())
+        for pk, value in values.items()
+    ], ['completed_bits', 'completed_count'], batch_size=1000)
+    lesson_count = Subquery(Course.objects.filter(pk=OuterRef('course_id')).values('lesson_count')[:1])
+    CourseProgress.objects.update(progress=Coalesce(
+        Least(F('completed_count') * Value(100.0) / NullIf(lesson_count, 0), Value(100.0)),
+        Value(0.0), output_field=FloatField()))
+    CourseProgress.objects.filter(progress__gte=100.0).update(completed=True)
+    CourseProgress.objects.filter(progress__lt=100.0).update(completed=False)
+
+    # Stored outlines no longer carry `opened`
+    Course.objects.update(version=F('version') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0015_progress_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='next_progress_bit',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='progress_bit',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='completed_bits',
+            field=models.BinaryField(blank=True, default=bytes),
+        ),
+        migrations.RunPython(backfill_bitsets, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='lesson',
+            name='progress_bit',
+            field=models.PositiveIntegerField(editable=False),
+        ),
+        migrations.RemoveField(
+            model_name='courseprogress',
+            name='completed_lessons',
+        ),
+        migrations.RemoveField(
+            model_name='lesson',
+            name='opened',
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.17 on 2026-10-18 20:26
+
+from django.db import migrations, models
+from django.db.models import Count, F, Q
+from django.db.models.functions import Floor
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def backfill_rollups(apps, schema_editor):
+    # Enrolment dates of existing rows are unknown, so they don't count towards days-to-complete
+    CourseProgress = apps.get_model('courses', 'CourseProgress')
+    StudentScore = apps.get_model('courses', 'StudentScore')
+    CourseProgressRollup = apps.get_model('courses', 'CourseProgressRollup')
+    rollups = []
+    buckets = CourseProgress.objects.annotate(bucket=Floor(F('progress') / 10)).values('course_id', 'bucket') \
+        .annotate(students=Count('id')).order_by()
+    for row in buckets:
+        rollups.append(CourseProgressRollup(course_id=row['course_id'], kind='progress', key=int(row['bucket']),
+                                            count=row['students']))
+    sections = StudentScore.objects.values('section_id', 'section__course_id').order_by() \
+        .annotate(attempted=Count('id'), passed=Count('id', filter=Q(completed=True)))
+    for row in sections:
+        rollups.append(CourseProgressRollup(course_id=row['section__course_id'], kind='attempted',
+                                            key=row['section_id'], count=row['attempted']))
+        rollups.append(CourseProgressRollup(course_id=row['section__course_id'], kind='passed',
+                                            key=row['section_id'], count=row['passed']))
+    CourseProgressRollup.objects.bulk_create(rollups, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0017_lesson_watch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courseprogress',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='started_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        # Added without a default first, so existing rows keep NULL instead of the migration time
+        migrations.AlterField(
+            model_name='courseprogress',
+            name='started_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='CourseProgressRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('progress', 'Progress bucket'), ('days', 'Days to complete'), ('attempted', 'Section attempted'), ('passed', 'Section passed')], max_length=10)),
+                ('key', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress_rollups', to='courses.course')),
+            ],
+            options={
+                'unique_together': {('course', 'kind', 'key')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
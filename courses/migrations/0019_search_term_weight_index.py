@@ -0,0 +1,17 @@
+# Generated by Django 4.2.17 on 2026-10-18 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0018_progress_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='coursesearchterm',
+            index=models.Index(fields=['term', '-weight', 'course'], name='courses_cou_term_6c4991_idx'),
+        ),
+    ]
@@ -1,16 +1,16 @@
 from django.contrib import admin
 from decimal import Decimal
-from django.db.models import Sum, Count, Avg
+from django.db.models import Count, Avg, F, OuterRef, Subquery, IntegerField, FloatField, Case, When, Value
+from django.db.models.functions import Coalesce, Round
 from django.core.validators import MinValueValidator, FileExtensionValidator, \
     MaxValueValidator
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.utils import timezone
 from datetime import timedelta
-from notifications.notifications import send_course_completion_notification
 import os
 from uuid import uuid4
-from moviepy.editor import VideoFileClip
 import io
 
 
@@ -45,6 +45,29 @@ class Promotion(models.Model):
         return f'{self.description} - {self.discount}%'
 
 
+class CourseQuerySet(models.QuerySet):
+    CATALOG_STATS = ('students', 'rating_count', 'average_rating')
+
+    def with_catalog_stats(self, *stats):
+        # Annotate the per-course figures the catalog shows so a list page is
+        # fetched in one query instead of three extra queries per row.
+        # Pass a subset of CATALOG_STATS to annotate only those.
+        stats = stats or self.CATALOG_STATS
+        ratings = Rating.objects.filter(course=OuterRef('pk')).order_by().values('course')
+        annotations = {}
+        if 'students' in stats:
+            students = OrderItem.objects.filter(course=OuterRef('pk')).order_by().values('course') \
+                .annotate(total=Count('order__customer', distinct=True)).values('total')
+            annotations['catalog_students'] = Coalesce(Subquery(students, output_field=IntegerField()), 0)
+        if 'rating_count' in stats:
+            annotations['catalog_rating_count'] = Coalesce(
+                Subquery(ratings.annotate(total=Count('id')).values('total'), output_field=IntegerField()), 0)
+        if 'average_rating' in stats:
+            annotations['catalog_average_rating'] = Subquery(
+                ratings.annotate(avg=Avg('score')).values('avg'), output_field=FloatField())
+        return self.annotate(**annotations)
+
+
 class Course(models.Model):
     CURRENCY_USD = 'USD'
     CURRENCY_EUR = 'EUR'
@@ -68,8 +91,11 @@ class Course(models.Model):
     title = models.CharField(max_length=255)
     objectives = models.TextField()
     total_duration = models.DurationField(default=timedelta, blank=True)
+    lesson_count = models.PositiveIntegerField(default=0)  # Kept current by courses/progress.py
+    next_progress_bit = models.PositiveIntegerField(default=0)  # Next free Lesson.progress_bit
     image = models.ImageField(upload_to='course/images',
                               validators=[FileExtensionValidator(allowed_extensions=['jpg', 'png'])])
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)  # Resized copies, see courses/images.py
     preview = models.FileField(
         upload_to='course/lessons/videos',
         validators=[FileExtensionValidator(allowed_extensions=['mp4', 'avi', 'mov', 'wmv', 'mkv', 'flv', 'mpeg', 
@@ -88,6 +114,7 @@ class Course(models.Model):
     rating_count = models.PositiveIntegerField(blank=True, default=0) # Number of students
     ratings = models.ManyToManyField('Rating', related_name='course_ratings')  # Average Rating
     average_rating = models.FloatField(blank=True, default=0.0)
+    rating_sum = models.FloatField(blank=True, default=0.0)  # Running sum of scores, so average_rating never needs an AVG()
     syllabus = models.TextField(blank=True, null=True) #  store information about the content or topics covered in the course
     prerequisites = models.TextField(blank=True, null=True)
     is_active = models.BooleanField(default=True)
@@ -97,10 +124,16 @@ class Course(models.Model):
     promotions = models.ManyToManyField(Promotion, blank=True, related_name='course_promotions')
     last_update = models.DateTimeField(auto_now=True)
     numberOfStudents = models.PositiveIntegerField(default=0)
+    version = models.PositiveIntegerField(default=0)  # Bumped whenever the course or its outline changes; used for ETags
 
+    objects = CourseQuerySet.as_manager()
 
     class Meta:
         unique_together = ['preview']
+        indexes = [
+            models.Index(fields=['price', 'id']),
+            models.Index(fields=['last_update', 'id']),
+        ]
     
     def get_rating_count(self):
         ratingCount = self.course_ratings.count()
@@ -111,10 +144,34 @@ class Course(models.Model):
         average_rating = round(average, 2) if average else 0.0
         return average_rating
     
-    def update_rating_metrics(self): 
-        self.rating_count = self.get_rating_count()
-        self.average_rating = self.get_average_rating()
-        self.save(update_fields=['rating_count', 'average_rating'])
+    @classmethod
+    def touch(cls, *course_ids):
+        # Mark the courses (and their sections/lessons) as changed without a full save
+        cls.objects.filter(pk__in=course_ids).update(version=F('version') + 1, last_update=timezone.now())
+
+    @classmethod
+    def allocate_progress_bits(cls, course_id, count):
+        # Reserve `count` completion-bitset positions for new lessons. The UPDATE row lock holds to the
+        # end of the transaction, so the read-back sees this allocation only.
+        with transaction.atomic():
+            cls.objects.filter(pk=course_id).update(next_progress_bit=F('next_progress_bit') + count)
+            end = cls.objects.filter(pk=course_id).values_list('next_progress_bit', flat=True).get()
+        return range(end - count, end)
+
+    @classmethod
+    def apply_rating_change(cls, course_id, count_delta, score_delta):
+        # O(1) update of the running rating aggregates. average_rating is assigned first because
+        # MySQL evaluates SET left to right, so it must read the pre-update count and sum.
+        count = F('rating_count') + count_delta
+        total = F('rating_sum') + score_delta
+        cls.objects.filter(pk=course_id).update(
+            average_rating=Case(
+                When(rating_count__gt=-count_delta, then=Round(total / count, 2)),
+                default=Value(0.0), output_field=models.FloatField(),
+            ),
+            rating_count=count,
+            rating_sum=total,
+        )
 
     def duration_in_hours(self):
         hours = self.total_duration.total_seconds() / 3600
@@ -133,12 +190,74 @@ class Course(models.Model):
         self.save()
 
     def update_total_duration(self):
-        total_duration = timedelta()
-        for section in self.sections.all():
-            total_duration += section.total_duration or timedelta()
-        
-        self.total_duration = total_duration
-        self.save(update_fields=["total_duration"])
+        from .durations import recompute_durations
+        recompute_durations(self.sections.values_list('id', flat=True))
+        self.refresh_from_db(fields=['total_duration'])
+
+class CourseOutline(models.Model):
+    # Materialized sections/lessons outline of a course, valid while `version` matches Course.version
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True, related_name='outline')
+    version = models.PositiveIntegerField(default=0)
+    document = models.JSONField(default=dict)
+    built_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Outline of {self.course_id} (v{self.version})'
+
+
+class CourseProgressRollup(models.Model):
+    # Student counts behind the instructor dashboard, kept current by courses/dashboard.py
+    PROGRESS = 'progress'  # key: progress // 10, so 10 means complete
+    DAYS_TO_COMPLETE = 'days'  # key: whole days from enrolment to completion
+    SECTION_ATTEMPTED = 'attempted'  # key: section id
+    SECTION_PASSED = 'passed'  # key: section id
+
+    KIND_CHOICES = [
+        (PROGRESS, 'Progress bucket'),
+        (DAYS_TO_COMPLETE, 'Days to complete'),
+        (SECTION_ATTEMPTED, 'Section attempted'),
+        (SECTION_PASSED, 'Section passed'),
+    ]
+
+    course = models.ForeignKey('Course', on_delete=models.CASCADE, related_name='progress_rollups')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    key = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('course', 'kind', 'key')
+
+    def __str__(self):
+        return f'{self.course_id} {self.kind}={self.key}: {self.count}'
+
+
+class CourseFacetCount(models.Model):
+    # Number of active courses per catalog facet value, kept current by the Course signal handlers
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=50)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('facet', 'value')
+
+    def __str__(self):
+        return f'{self.facet}={self.value}: {self.count}'
+
+
+class CourseSearchTerm(models.Model):
+    # Inverted index posting: one row per (term, course) with the ranking weight of the term in that course
+    term = models.CharField(max_length=64)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        unique_together = ('term', 'course')
+        # Best-weighted postings of a term first, for top-k search
+        indexes = [models.Index(fields=['term', '-weight', 'course'])]
+
+    def __str__(self):
+        return f'{self.term} -> {self.course_id}'
+
 
 class Rating(models.Model): 
     score = models.FloatField(validators=[MinValueValidator(1.0),
@@ -150,19 +269,37 @@ class Rating(models.Model):
     def __str__(self):
         return f'{self.user.username} rated {self.course.title}'
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        self.course.update_rating_metrics() 
-        
-    def delete(self, *args, **kwargs):
-        course = self.course
-        super().delete(*args, **kwargs)
-        course.update_rating_metrics()
-
 
 class Lesson(models.Model):
     VIDEO_EXTENTIONS = ['mp4', 'avi', 'mov', 'wmv', 'mkv', 'flv', 'mpeg']
 
+    # Video durations are probed by the `probe_media` worker, not during the upload request
+    MEDIA_PENDING = 'pending'
+    MEDIA_PROBING = 'probing'
+    MEDIA_READY = 'ready'
+    MEDIA_FAILED = 'failed'
+
+    MEDIA_STATUS_CHOICES = [
+        (MEDIA_PENDING, 'Pending'),
+        (MEDIA_PROBING, 'Probing'),
+        (MEDIA_READY, 'Ready'),
+        (MEDIA_FAILED, 'Failed'),
+    ]
+
+    # HLS renditions are produced by the `transcode_lessons` worker once the duration is known
+    HLS_PENDING = 'pending'
+    HLS_RUNNING = 'running'
+    HLS_READY = 'ready'
+    HLS_FAILED = 'failed'
+
+    HLS_STATUS_CHOICES = [
+        ('', 'None'),
+        (HLS_PENDING, 'Pending'),
+        (HLS_RUNNING, 'Running'),
+        (HLS_READY, 'Ready'),
+        (HLS_FAILED, 'Failed'),
+    ]
+
     section = models.ForeignKey('Section', on_delete=models.PROTECT, related_name='lessons', default=1)
     title = models.CharField(max_length=255)
     file = models.FileField(
@@ -175,47 +312,54 @@ class Lesson(models.Model):
             'doc', 'docx', 'pdf', 'txt', 'rtf', 'odt', 'html', 'htm'
         ])]
     )
-    order = models.PositiveIntegerField()  # Helps in sorting lessons
+    order = models.PositiveIntegerField()  # Sparse sort key within the section, see courses/ordering.py
     is_active = models.BooleanField(default=True)  # Mark if the lesson is available for students
     duration = models.PositiveIntegerField(default=0)
-    opened = models.BooleanField(default=False) # Track if the lesson has been opened
-    
-    
+    # Position in the course's completion bitsets (CourseProgress.completed_bits); never reused
+    progress_bit = models.PositiveIntegerField(editable=False)
+    media_status = models.CharField(max_length=10, choices=MEDIA_STATUS_CHOICES, default=MEDIA_READY)
+    media_claimed_at = models.DateTimeField(null=True, blank=True)  # When a probe worker took the lesson
+    hls_status = models.CharField(max_length=10, choices=HLS_STATUS_CHOICES, default='', blank=True)
+    hls_playlist = models.CharField(max_length=255, blank=True)  # Storage name of the master playlist
+    hls_claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['media_status', 'id']),
+            models.Index(fields=['hls_status', 'id']),
+            models.Index(fields=['section', 'order', 'id']),
+        ]
+
     def __str__(self):
         return f'{self.title} - {self.section.course.title}'
     
     def save(self, *args, **kwargs):
+        if self.progress_bit is None:
+            self.progress_bit = Course.allocate_progress_bits(self.section.course_id, 1)[0]
+        self.prepare_media()
+        # Call the original save method to save the lesson
+        # (section and course totals are rolled up on commit, see courses/durations.py)
+        super().save(*args, **kwargs)
+
+    def prepare_media(self):
+        # Also called for bulk_create(), which bypasses save()
         # Check if the file is a video format
         if self.file:
             file_extension = os.path.splitext(self.file.name)[-1][1:].lower()  # Get the file extension
             if file_extension in self.VIDEO_EXTENTIONS:
-                # Only calculate duration for video files if not already set
+                # Queue video files without a duration for the probe worker
                 if not self.duration:
-                    video_path = self.file.path
-                    # Check if the video file exists
-                    if not os.path.exists(video_path):
-                        print(f"File does not exist: {video_path}")
-                    else:
-                        try:
-                            clip = VideoFileClip(video_path)
-                            self.duration = int(clip.duration)  # Convert seconds to minutes
-                            clip.close()
-                        except Exception as e:
-                            print(f"Error reading video duration for {self.file.name}: {e}")
+                    self.media_status = self.MEDIA_PENDING
+                    self.media_claimed_at = None
+                    # Renditions of the previous file no longer apply
+                    self.hls_status = ''
+                    self.hls_playlist = ''
             else:
                 # Reset duration for non-video files
                 self.duration = 0
-        # Call the original save method to save the lesson
-        super().save(*args, **kwargs)
-        # Update section and durations
-        self.section.update_total_duration()
-
-    def delete(self, *args, **kwargs):
-        section = self.section # Share reference before deletion
-        # Call original delete method
-        super().delete(*args, **kwargs)
-        # Update section and course duration after deletion
-        section.update_total_duration()
+                self.media_status = self.MEDIA_READY
+                self.hls_status = ''
+                self.hls_playlist = ''
 
 
 class Section(models.Model):
@@ -225,21 +369,69 @@ class Section(models.Model):
     total_duration = models.DurationField(default=timedelta, blank=True)
     locked = models.BooleanField(default=True)
     default = models.BooleanField(default=False)
+    order = models.PositiveIntegerField(default=0)  # Sparse sort key within the course, see courses/ordering.py
+
+    class Meta:
+        indexes = [models.Index(fields=['course', 'order', 'id'])]
 
     def save(self, *args, **kwargs):
         # Save the section instance first to ensure it has a primary key
         if self.default:
             Section.objects.filter(course=self.course, default=True).update(default=False)
+        if self._state.adding and not self.order:
+            # New sections go last
+            from .ordering import append_key
+            self.order = append_key(Section.objects.filter(course_id=self.course_id))
         super().save(*args, **kwargs)
 
     def update_total_duration(self):
-        total_duration = timedelta()
-        for lesson in self.lessons.all():
-            lesson_duration = timedelta(seconds=lesson.duration) if lesson.duration else timedelta()
-            total_duration += lesson_duration
-        self.total_duration = total_duration
-        self.save(update_fields=["total_duration"])
-        self.course.update_total_duration()
+        # Immediate recompute; lesson saves go through schedule_duration_rollup() instead
+        from .durations import recompute_durations
+        recompute_durations([self.pk])
+        self.refresh_from_db(fields=['total_duration'])
+
+
+class UploadSession(models.Model):
+    # Resumable upload of a lesson file or course preview; see courses/uploads.py for the protocol
+    STATUS_OPEN = 'open'
+    STATUS_COMPLETE = 'complete'
+
+    STATUS_CHOICES = [
+        (STATUS_OPEN, 'Open'),
+        (STATUS_COMPLETE, 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, null=True, blank=True, related_name='upload_sessions')  # Replace the preview
+    section = models.ForeignKey(Section, on_delete=models.CASCADE, null=True, blank=True, related_name='upload_sessions')  # Add a lesson
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, null=True, blank=True, related_name='upload_sessions')  # Replace the file
+    title = models.CharField(max_length=255, blank=True)  # Title of the lesson created in `section`
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)  # Bytes received so far
+    chunks = models.JSONField(default=list, blank=True)  # Storage names of the received chunks, in order
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_OPEN)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.filename} ({self.offset}/{self.size})'
+
+
+class ImageVariantJob(models.Model):
+    # An image whose resized variants the `render_image_variants` worker still has to produce
+    model = models.CharField(max_length=100)  # App label, e.g. 'courses.Course'
+    object_id = models.PositiveBigIntegerField()
+    source = models.CharField(max_length=255)  # Storage name of the image to render
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [['model', 'object_id']]
+
+    def __str__(self):
+        return f'{self.model} #{self.object_id}: {self.source}'
 
 
 class Question(models.Model):
@@ -327,7 +519,12 @@ class CourseProgress(models.Model):
     completed = models.BooleanField(default=False)
     progress = models.FloatField(default=0.0, validators=[MinValueValidator(0.0), MaxValueValidator(100.0)])  # percentage
     last_accessed = models.DateTimeField(auto_now=True)
-    completed_lessons = models.ManyToManyField(Lesson, blank=True, related_name='completed_by')  # Track completed lessons
+    # Bit Lesson.progress_bit is set when that lesson is completed, see courses/progress.py
+    completed_bits = models.BinaryField(default=bytes, blank=True)
+    # Set bits of live lessons; progress = completed_count / Course.lesson_count
+    completed_count = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(default=timezone.now, null=True, editable=False)  # Unknown for older rows
+    completed_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         unique_together = ('student', 'course')
@@ -335,26 +532,17 @@ class CourseProgress(models.Model):
     def __str__(self):
         return f'{self.student.username} - {self.course.title}'
 
-    def calculate_progress(self):
-        total_lessons = self.course.sections.annotate(lesson_count=Count('lessons')).aggregate(total=Sum('lesson_count'))['total']
-        completed_lessons = self.completed_lessons.count()
-        
-        if total_lessons:
-            self.progress = (completed_lessons / total_lessons) * 100
-            
-        self.completed = self.progress >= 100.0
-        
-        if self.completed:
-            send_course_completion_notification(
-                self.course.instructor,
-                self.course,
-                self.student
-            )
 
-    def save(self, *args, **kwargs):
-        if self.pk:
-            self.calculate_progress()
-        super().save(*args, **kwargs)
+class LessonWatch(models.Model):
+    # Playback position per student and lesson, written in bulk from buffered heartbeats (courses/watch.py)
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='lesson_watches')
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='watches')
+    position = models.PositiveIntegerField(default=0)  # Last reported, in seconds
+    furthest = models.PositiveIntegerField(default=0)  # Furthest reported, in seconds
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('student', 'lesson')
 
 
 class Certificate(models.Model):
@@ -377,6 +565,11 @@ class Review(models.Model):
     name = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['course', 'created_at', 'id']),
+        ]
+
     def __str__(self):
         return f'Review for {self.course.title} by {self.user.username}'
 
@@ -438,6 +631,9 @@ class Order(models.Model):
         permissions = [
             ('cancel_order', 'Can cancel order')
         ]
+        indexes = [
+            models.Index(fields=['customer', 'placed_at', 'id']),
+        ]
 
     def __str__(self):
         return f"Order {self.id} - {self.get_payment_status_display()}"
@@ -505,6 +701,7 @@ class StaffMember(models.Model):
     last_name = models.CharField(max_length=255)
     image = models.ImageField(upload_to='profile_pictures/', blank=True, null=True,
                               validators=[FileExtensionValidator(allowed_extensions=['jpg', 'png', 'jpeg'])])
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     phone = models.CharField(max_length=255)
     email = models.EmailField(unique=True)
     fb = models.CharField(max_length=255, default='https://www.facebook.com/')
@@ -518,6 +715,7 @@ class Testimonial(models.Model):
     full_name = models.CharField(max_length=255)
     image = models.ImageField(upload_to='profile_pictures/', blank=True, null=True,
                               validators=[FileExtensionValidator(allowed_extensions=['jpg', 'png', 'jpeg'])])
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     title = models.TextField()
 
 
@@ -531,4 +729,5 @@ class Description(models.Model):
 
 class PaymentStatus(models.Model):
     image = models.ImageField(upload_to='course/images',
-                              validators=[FileExtensionValidator(allowed_extensions=['jpg', 'png'])])
\ No newline at end of file
+                              validators=[FileExtensionValidator(allowed_extensions=['jpg', 'png'])])
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
\ No newline at end of file
@@ -0,0 +1,80 @@
+from django.db.models import Max, Q
+
+# Sparse ordering keys for Section.order and Lesson.order. Keys are spaced ORDER_GAP apart, so a
+# move writes one row: the midpoint between the new neighbours. Only when two neighbours run out of
+# room is the parent renumbered (inline, or ahead of time by `manage.py rebalance_ordering`).
+# Callers hold a lock on the parent row (course or section) while assigning keys.
+
+ORDER_GAP = 1024
+
+
+class OrderingError(Exception):
+    pass
+
+
+def append_key(siblings):
+    """Key after the last of `siblings`."""
+    return (siblings.aggregate(last=Max('order'))['last'] or 0) + ORDER_GAP
+
+
+def rebalance(siblings):
+    """Renumber `siblings` ORDER_GAP apart, keeping their order. Returns the number of rows written."""
+    items = list(siblings.order_by('order', 'id').only('id', 'order'))
+    changed = []
+    for position, item in enumerate(items, start=1):
+        if item.order != position * ORDER_GAP:
+            item.order = position * ORDER_GAP
+            changed.append(item)
+    siblings.model.objects.bulk_update(changed, ['order'], batch_size=500)
+    return len(changed)
+
+
+def _neighbour(siblings, anchor, later):
+    # The sibling right after (later) or before `anchor` in (order, id) sequence
+    if later:
+        condition = Q(order__gt=anchor.order) | Q(order=anchor.order, id__gt=anchor.pk)
+        ordering = ('order', 'id')
+    else:
+        condition = Q(order__lt=anchor.order) | Q(order=anchor.order, id__lt=anchor.pk)
+        ordering = ('-order', '-id')
+    return siblings.filter(condition).order_by(*ordering).only('id', 'order').first()
+
+
+def move(item, siblings, before=None, after=None):
+    """
+    Give `item` a key that places it right before the sibling `before` or right after `after`
+    (ids within `siblings`, which should exclude nothing). One UPDATE unless the gap is used up.
+    Returns the new key.
+    """
+    if (before is None) == (after is None):
+        raise OrderingError('Give exactly one of `before` or `after`.')
+    others = siblings.exclude(pk=item.pk)
+    anchor = others.filter(pk=before if after is None else after).only('id', 'order').first()
+    if anchor is None:
+        raise OrderingError('The anchor must be another item of the same parent.')
+
+    if after is not None:
+        lower, upper = anchor, _neighbour(others, anchor, later=True)
+    else:
+        lower, upper = _neighbour(others, anchor, later=False), anchor
+    lower_key = lower.order if lower else 0
+    upper_key = upper.order if upper else lower_key + 2 * ORDER_GAP
+    if upper_key - lower_key < 2:
+        rebalance(siblings)
+        return move(item, siblings, before=before, after=after)
+
+    key = (lower_key + upper_key) // 2
+    siblings.model.objects.filter(pk=item.pk).update(order=key)
+    item.order = key
+    return key
+
+
+def crowded_parents(model, parent_field, min_gap):
+    """Ids of parents whose children have two neighbouring keys less than `min_gap` apart (one pass over the keys)."""
+    crowded, previous = set(), (None, None)
+    rows = model.objects.order_by(parent_field, 'order', 'id').values_list(parent_field, 'order')
+    for parent_id, key in rows.iterator(chunk_size=5000):
+        if parent_id == previous[0] and key - previous[1] < min_gap:
+            crowded.add(parent_id)
+        previous = (parent_id, key)
+    return crowded
@@ -0,0 +1,68 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.utils.duration import duration_string
+from .models import CourseOutline, Lesson, Section
+
+
+def build_outline(course):
+    """
+    Build the outline document for a course: every section with its lessons' titles,
+    durations and counts, in the shape SectionSerializer produces minus `course`, file URLs and
+    the per-student `opened` flag.
+    Costs two queries however many sections and lessons the course has.
+    """
+    lessons_by_section = defaultdict(list)
+    lessons = Lesson.objects.filter(section__course_id=course.pk) \
+        .values('id', 'section_id', 'title', 'order', 'is_active', 'duration', 'file') \
+        .order_by('order', 'id')
+    for lesson in lessons:
+        lessons_by_section[lesson['section_id']].append({
+            'id': lesson['id'],
+            'title': lesson['title'],
+            'order': lesson['order'],
+            'is_active': lesson['is_active'],
+            'duration': lesson['duration'],
+            'has_file': bool(lesson['file']),
+        })
+
+    sections = []
+    total_duration = 0
+    for section in Section.objects.filter(course_id=course.pk).values('id', 'title', 'order').order_by('order', 'id'):
+        section_lessons = lessons_by_section.get(section['id'], [])
+        section_duration = sum(lesson['duration'] for lesson in section_lessons)
+        total_duration += section_duration
+        sections.append({
+            'id': section['id'],
+            'title': section['title'],
+            'order': section['order'],
+            'number_of_lessons': str(len(section_lessons)),
+            'total_duration': duration_string(timedelta(seconds=section_duration)),
+            'lessons': section_lessons,
+        })
+
+    return {
+        'section_count': len(sections),
+        'lesson_count': sum(len(section['lessons']) for section in sections),
+        'total_duration': duration_string(timedelta(seconds=total_duration)),
+        'sections': sections,
+    }
+
+
+def rebuild_outline(course):
+    document = build_outline(course)
+    CourseOutline.objects.update_or_create(course_id=course.pk, defaults={'version': course.version, 'document': document})
+    return document
+
+
+def get_outline(course):
+    """
+    Return the stored outline for `course`, rebuilding it first if it was built from an
+    older Course.version. Any section or lesson change bumps the version (Course.touch),
+    so the next read after an edit rebuilds once and every later read is a single lookup.
+    """
+    document = CourseOutline.objects.filter(course_id=course.pk, version=course.version) \
+        .values_list('document', flat=True).first()
+    if document is None:
+        document = rebuild_outline(course)
+    return document
+
@@ -1,4 +1,108 @@
-from rest_framework.pagination import PageNumberPagination
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 
 class DefaultPagination(PageNumberPagination):
-  page_size = 30
\ No newline at end of file
+  page_size = 30
+
+
+class KeysetPagination(CursorPagination):
+  """
+    Cursor pagination that seeks on an indexed ordering instead of using
+    OFFSET/COUNT(*), so every page costs the same as the first one.
+    The ordering comes from ?ordering= when it is one of the view's
+    `ordering_fields`, otherwise from the view's `ordering` attribute.
+    Non-unique orderings are tie-broken on id, and the cursor holds both
+    values so the page seeks on (field, id) rather than offsetting past ties.
+  """
+  page_size = 30
+  page_size_query_param = 'page_size'
+  max_page_size = 100
+  ordering = '-id'
+
+  def get_ordering(self, request, queryset, view):
+    default = getattr(view, 'ordering', None) or self.ordering
+    ordering = request.query_params.get('ordering', default)
+    if ordering.lstrip('-') not in getattr(view, 'ordering_fields', []):
+      ordering = default
+    if ordering.lstrip('-') == 'id':
+      return (ordering,)
+    # Break ties on the primary key so the cursor position is stable
+    return (ordering, '-id' if ordering.startswith('-') else 'id')
+
+  def _get_position_from_instance(self, instance, ordering):
+    position = super()._get_position_from_instance(instance, ordering)
+    if len(ordering) == 1:
+      return position
+    # Every position is unique, so DRF's cursors never fall back to an offset
+    pk = instance['id'] if isinstance(instance, dict) else instance.pk
+    return f'{position}|{pk}'
+
+  def paginate_queryset(self, queryset, request, view=None):
+    self.request = request
+    self.page_size = self.get_page_size(request)
+    if not self.page_size:
+      return None
+
+    self.base_url = request.build_absolute_uri()
+    self.ordering = self.get_ordering(request, queryset, view)
+
+    self.cursor = self.decode_cursor(request)
+    if self.cursor is None:
+      (offset, reverse, current_position) = (0, False, None)
+    else:
+      (offset, reverse, current_position) = self.cursor
+
+    if reverse:
+      queryset = queryset.order_by(*[o[1:] if o.startswith('-') else '-' + o for o in self.ordering])
+    else:
+      queryset = queryset.order_by(*self.ordering)
+
+    if current_position is not None:
+      queryset = queryset.filter(self.seek(current_position, reverse))
+
+    results = list(queryset[offset:offset + self.page_size + 1])
+    self.page = list(results[:self.page_size])
+
+    if len(results) > len(self.page):
+      has_following_position = True
+      following_position = self._get_position_from_instance(results[-1], self.ordering)
+    else:
+      has_following_position = False
+      following_position = None
+
+    if reverse:
+      self.page = list(reversed(self.page))
+      self.has_next = (current_position is not None) or (offset > 0)
+      self.has_previous = has_following_position
+      if self.has_next:
+        self.next_position = current_position
+      if self.has_previous:
+        self.previous_position = following_position
+    else:
+      self.has_next = has_following_position
+      self.has_previous = (current_position is not None) or (offset > 0)
+      if self.has_next:
+        self.next_position = following_position
+      if self.has_previous:
+        self.previous_position = current_position
+
+    if (self.has_previous or self.has_next) and self.template is not None:
+      self.display_page_controls = True
+
+    return self.page
+
+  def seek(self, position, reverse):
+    """The rows strictly after `position` in the (reversed, if `reverse`) ordering."""
+    field = self.ordering[0].lstrip('-')
+    lookup = 'lt' if reverse != self.ordering[0].startswith('-') else 'gt'
+    if len(self.ordering) == 1:
+      return Q(**{f'{field}__{lookup}': position})
+
+    value, _, pk = position.rpartition('|')
+    if not value or not pk.isdigit():
+      raise NotFound(self.invalid_cursor_message)
+    # The leading range on the field alone lets the (field, id) index bound the scan
+    return Q(**{f'{field}__{lookup}e': value}) & (
+      Q(**{f'{field}__{lookup}': value}) | Q(**{'id__' + lookup: int(pk)})
+    )
@@ -1,5 +1,6 @@
 from rest_framework import permissions
 from rest_framework import viewsets, status
+from django.db.models import Q
 from .models import OrderItem, Course, Section, StudentScore
 import logging
 
@@ -143,7 +144,10 @@ class IsPreviousSectionCompleted(permissions.BasePermission):
                 return True  # Allow access to the first section by default
 
             # Get the previous section
-            previous_section = Section.objects.filter(course=current_section.course, id__lt=current_section.id).order_by('-id').first()
+            previous_section = Section.objects.filter(
+                Q(order__lt=current_section.order) | Q(order=current_section.order, id__lt=current_section.id),
+                course_id=current_section.course_id,
+            ).order_by('-order', '-id').first()
             logger.debug(f'Previous section: {previous_section.id if previous_section else "None"}')
             
             if previous_section:
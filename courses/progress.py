@@ -0,0 +1,190 @@
+import threading
+from collections import Counter, defaultdict
+from django.db import transaction
+from django.db.models import F, FloatField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Least, NullIf
+from django.utils import timezone
+from notifications.notifications import send_course_completion_notification
+from .dashboard import apply_rollup_changes, days_to_complete, progress_buckets
+from .models import Course, CourseProgress, CourseProgressRollup, Lesson
+
+# Per-student lesson completion. Every lesson gets a position in its course (Lesson.progress_bit,
+# never reused) and a student's completed lessons are one bitset per course (CourseProgress.
+# completed_bits, bit n in byte n // 8), with completed_count kept next to it. Marking a lesson
+# rewrites one row; progress is completed_count / Course.lesson_count.
+# Adding or removing lessons marks the course; on commit its lesson_count is recounted once and, if
+# it changed, every enrolled student's percentage is rewritten PROGRESS_CHUNK_SIZE rows at a time.
+# Removals also clear the dead lesson's bit from those rows.
+
+PROGRESS_CHUNK_SIZE = 1000
+
+_pending = threading.local()
+
+
+def _value(bits):
+    return int.from_bytes(bits or b'', 'little')
+
+
+def _bits(value):
+    return value.to_bytes((value.bit_length() + 7) // 8, 'little')
+
+
+def has_bit(bits, position):
+    return bool(_value(bits) >> position & 1)
+
+
+def popcount(bits):
+    return _value(bits).bit_count()
+
+
+def _progress_percentage():
+    lesson_count = Subquery(Course.objects.filter(pk=OuterRef('course_id')).values('lesson_count')[:1])
+    return Coalesce(
+        Least(F('completed_count') * Value(100.0) / NullIf(lesson_count, 0), Value(100.0)),
+        Value(0.0), output_field=FloatField(),
+    )
+
+
+def refresh_progress(progress):
+    """
+    Recompute the percentage and `completed` flag of a CourseProgress queryset from its counters, and
+    move the rows between the dashboard rollups (courses/dashboard.py).
+    """
+    deltas = Counter()
+    deltas.subtract(progress_buckets(progress))
+    progress.update(progress=_progress_percentage())
+    deltas.update(progress_buckets(progress))
+
+    reopened = list(progress.filter(completed=True, progress__lt=100.0).values_list('pk', 'course_id', 'started_at', 'completed_at'))
+    if reopened:
+        CourseProgress.objects.filter(pk__in=[row[0] for row in reopened]).update(completed=False, completed_at=None)
+        for _, course_id, started_at, completed_at in reopened:
+            days = days_to_complete(started_at, completed_at)
+            if days is not None:
+                deltas[course_id, CourseProgressRollup.DAYS_TO_COMPLETE, days] -= 1
+
+    finished = list(progress.filter(completed=False, progress__gte=100.0).select_related('course__instructor', 'student'))
+    if finished:
+        now = timezone.now()
+        CourseProgress.objects.filter(pk__in=[row.pk for row in finished]).update(completed=True, completed_at=now)
+        for row in finished:
+            days = days_to_complete(row.started_at, now)
+            if days is not None:
+                deltas[row.course_id, CourseProgressRollup.DAYS_TO_COMPLETE, days] += 1
+            send_course_completion_notification(row.course.instructor, row.course, row.student)
+    apply_rollup_changes(deltas)
+
+
+def set_lesson_completed(progress, lesson, completed):
+    """
+    Set or clear `lesson`'s bit in `progress` (a CourseProgress of the lesson's course). Locks and
+    rewrites that one row whatever the course or enrolment size. Returns whether anything changed.
+    """
+    rows = CourseProgress.objects.filter(pk=progress.pk)
+    with transaction.atomic():
+        value = _value(rows.select_for_update().values_list('completed_bits', flat=True).get())
+        mask = 1 << lesson.progress_bit
+        if bool(value & mask) == completed:
+            rows.update(last_accessed=timezone.now())
+            return False
+        rows.update(completed_bits=_bits(value ^ mask), last_accessed=timezone.now(),
+                    completed_count=F('completed_count') + (1 if completed else -1))
+        refresh_progress(rows)
+    return True
+
+
+def lesson_bits(course_id):
+    """{progress_bit: lesson id} for the course's lessons."""
+    return dict(Lesson.objects.filter(section__course_id=course_id).values_list('progress_bit', 'id'))
+
+
+def completed_lesson_ids(bits, lessons_by_bit):
+    """Ids of the lessons set in `bits`, given the course's lesson_bits()."""
+    value = _value(bits)
+    return sorted(pk for bit, pk in lessons_by_bit.items() if value >> bit & 1)
+
+
+def lesson_completion_counts(course_id, chunk_size=PROGRESS_CHUNK_SIZE):
+    """
+    {lesson id: number of students who completed it} for a course. Streams the bitsets once and
+    tallies byte values per byte position, so each lesson's sum reads at most 256 entries.
+    """
+    histograms = defaultdict(Counter)
+    rows = CourseProgress.objects.filter(course_id=course_id).values_list('completed_bits', flat=True)
+    for bits in rows.iterator(chunk_size=chunk_size):
+        for index, byte in enumerate(bytes(bits or b'')):
+            if byte:
+                histograms[index][byte] += 1
+
+    counts = {}
+    for bit, pk in lesson_bits(course_id).items():
+        index, offset = divmod(bit, 8)
+        counts[pk] = sum(students for byte, students in histograms.get(index, {}).items() if byte >> offset & 1)
+    return counts
+
+
+def _dirty_courses():
+    if not hasattr(_pending, 'courses'):
+        _pending.courses = {}
+    return _pending.courses
+
+
+def schedule_lesson_count_refresh(course_id, removed=False):
+    """
+    Recount the course's lessons (and rescale progress if the count changed) when the transaction
+    commits. `removed` means lessons were deleted, so their bits are cleared from the bitsets too.
+    """
+    courses = _dirty_courses()
+    courses[course_id] = courses.get(course_id, False) or removed
+    # Same pattern as courses/durations.py: any surviving callback flushes the whole set
+    transaction.on_commit(flush_lesson_counts)
+
+
+def flush_lesson_counts():
+    courses = _dirty_courses()
+    pending = dict(courses)
+    courses.clear()
+    for course_id, removed in pending.items():
+        refresh_lesson_count(course_id, recount=removed)
+
+
+def refresh_lesson_count(course_id, recount=False):
+    """Store the course's lesson count; when it changed (or with `recount`), refresh every enrolled student's progress."""
+    count = Lesson.objects.filter(section__course_id=course_id).count()
+    changed = Course.objects.filter(pk=course_id).exclude(lesson_count=count).update(lesson_count=count)
+    if changed or recount:
+        recompute_course_progress(course_id, recount=recount)
+
+
+def recompute_course_progress(course_id, chunk_size=PROGRESS_CHUNK_SIZE, recount=False):
+    """
+    Refresh every progress row of a course, chunk_size rows at a time by primary key, each chunk in its own
+    short transaction. With `recount`, bits of deleted lessons are cleared and completed_count is rebuilt
+    from the bitsets first.
+    """
+    dead = 0
+    if recount:
+        # Only positions allocated before this pass: lessons created meanwhile keep their bits
+        allocated = Course.objects.filter(pk=course_id).values_list('next_progress_bit', flat=True).get()
+        dead = (1 << allocated) - 1
+        for bit in lesson_bits(course_id):
+            dead &= ~(1 << bit)
+
+    last_pk = 0
+    while True:
+        pks = list(CourseProgress.objects.filter(course_id=course_id, pk__gt=last_pk)
+                   .order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return
+        with transaction.atomic():
+            rows = CourseProgress.objects.filter(pk__in=pks)
+            if recount:
+                changed = []
+                for row in rows.select_for_update().only('id', 'completed_bits', 'completed_count'):
+                    value = _value(row.completed_bits) & ~dead
+                    if _bits(value) != bytes(row.completed_bits or b'') or value.bit_count() != row.completed_count:
+                        row.completed_bits, row.completed_count = _bits(value), value.bit_count()
+                        changed.append(row)
+                CourseProgress.objects.bulk_update(changed, ['completed_bits', 'completed_count'])
+            refresh_progress(rows)
+        last_pk = pks[-1]
@@ -0,0 +1,67 @@
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Sum, FloatField, IntegerField
+from django.db.models.functions import Coalesce
+from .cache import bump_generation, CATALOG
+from .facets import FACET_FIELDS, facet_values, rebuild_facet_counts, update_course_facets
+from .models import Course, Rating
+
+
+def record_rating_change(course_id, count_delta, score_delta):
+    """
+    Apply a rating create/update/delete to the course's running aggregates and move the course
+    between rating facets if its average crossed a threshold. Costs one UPDATE and one lookup.
+    """
+    if not count_delta and not score_delta:
+        return
+    Course.apply_rating_change(course_id, count_delta, score_delta)
+    row = Course.objects.filter(pk=course_id).values(*FACET_FIELDS, 'rating_count', 'rating_sum').first()
+    if row is None:
+        return
+    old_count = row['rating_count'] - count_delta
+    old_row = dict(row, average_rating=round((row['rating_sum'] - score_delta) / old_count, 2) if old_count > 0 else 0.0)
+    update_course_facets(facet_values(old_row), facet_values(row))
+
+
+def _true_rating_metrics(queryset):
+    ratings = Rating.objects.filter(course=OuterRef('pk')).order_by().values('course')
+    return queryset.annotate(
+        true_count=Coalesce(Subquery(ratings.annotate(total=Count('id')).values('total'), output_field=IntegerField()), 0),
+        true_sum=Coalesce(Subquery(ratings.annotate(total=Sum('score')).values('total'), output_field=FloatField()), 0.0),
+    )
+
+
+def reconcile_rating_metrics(batch_size=1000):
+    """
+    Recompute rating_count, rating_sum and average_rating from the Rating table and repair
+    every course whose running aggregates drifted. Courses are scanned in primary-key batches;
+    drifted rows are locked and recomputed before being written back. Returns the repaired ids.
+    """
+    repaired = []
+    last_pk = 0
+    while True:
+        batch = list(_true_rating_metrics(Course.objects.filter(pk__gt=last_pk).order_by('pk'))
+                     .values_list('pk', 'rating_count', 'rating_sum', 'true_count', 'true_sum')[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+        drifted = [pk for pk, count, total, true_count, true_sum in batch
+                   if count != true_count or abs(total - true_sum) > 1e-6]
+        if not drifted:
+            continue
+
+        with transaction.atomic():
+            courses = list(_true_rating_metrics(Course.objects.select_for_update().filter(pk__in=drifted))
+                           .only('id', 'rating_count', 'rating_sum', 'average_rating'))
+            for course in courses:
+                course.rating_count = course.true_count
+                course.rating_sum = course.true_sum
+                course.average_rating = round(course.true_sum / course.true_count, 2) if course.true_count else 0.0
+            Course.objects.bulk_update(courses, ['rating_count', 'rating_sum', 'average_rating'])
+            Course.touch(*drifted)
+        repaired.extend(drifted)
+
+    if repaired:
+        # bulk_update skips the Course signals, so refresh what they would have maintained
+        rebuild_facet_counts()
+        bump_generation(CATALOG)
+    return repaired
@@ -0,0 +1,162 @@
+import math
+import re
+from collections import Counter, defaultdict
+from functools import reduce
+from operator import or_
+from django.db import transaction
+from django.db.models import Case, When, F, Sum, Count, FloatField, Q, Value
+from .models import Course, CourseSearchTerm
+
+
+# Field weights used when ranking; a hit in the title counts far more than one in the description
+SEARCH_FIELDS = {
+    'title': 5,
+    'courseFor': 2,
+    'objectives': 2,
+    'syllabus': 1,
+    'description': 1,
+}
+
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'how', 'in', 'is', 'it',
+    'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'will', 'with', 'you', 'your',
+}
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TERM_LENGTH = 64
+
+
+def tokenize(text):
+    """Split text into lowercase index terms, dropping stop words and single characters."""
+    if not text:
+        return []
+    return [
+        token[:MAX_TERM_LENGTH] for token in TOKEN_RE.findall(text.lower())
+        if len(token) > 1 and token not in STOP_WORDS
+    ]
+
+
+def build_terms(course):
+    """Return {term: weight} for a course, summing field weights for every occurrence."""
+    weights = Counter()
+    for field, field_weight in SEARCH_FIELDS.items():
+        for term in tokenize(getattr(course, field)):
+            weights[term] += field_weight
+    return weights
+
+
+def index_course(course):
+    # Replace the course's postings in one delete and one bulk insert
+    terms = build_terms(course)
+    with transaction.atomic():
+        CourseSearchTerm.objects.filter(course=course).delete()
+        CourseSearchTerm.objects.bulk_create(
+            [CourseSearchTerm(course=course, term=term, weight=weight) for term, weight in terms.items()]
+        )
+
+
+def rebuild_index(batch_size=500):
+    """Re-index every course; used by the `rebuild_search_index` command."""
+    CourseSearchTerm.objects.all().delete()
+    total = 0
+    queryset = Course.objects.only('id', *SEARCH_FIELDS).order_by('id')
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        postings = []
+        for course in batch:
+            postings.extend(
+                CourseSearchTerm(course=course, term=term, weight=weight)
+                for term, weight in build_terms(course).items()
+            )
+        CourseSearchTerm.objects.bulk_create(postings, batch_size=2000)
+        total += len(batch)
+        last_id = batch[-1].id
+    return total
+
+
+# Top-k search without scoring every posting:
+#   1. The best SEARCH_DEPTH x limit postings of each term, read from the (term, -weight) index, give
+#      candidates; the k-th best of their full scores, theta, is a lower bound on the final k-th best.
+#   2. A course scoring at least theta has, for some term t, weight(t) >= theta x best(t) / ceiling,
+#      where ceiling is the best possible score. Only postings above those cutoffs are read.
+#   3. A course missing from a term's cutoff range weighs less than the cutoff there, which bounds its
+#      score; courses whose bound is below theta are dropped and the rest are scored exactly.
+# Ties at theta stay in, so the ranking is the one scoring every posting would give.
+SEARCH_DEPTH = 4
+
+
+def term_weights(terms):
+    """{term: IDF} for the indexed `terms`, from one COUNT over their postings."""
+    document_frequency = dict(
+        CourseSearchTerm.objects.filter(term__in=terms).values_list('term').annotate(df=Count('id')).order_by()
+    )
+    total_courses = Course.objects.count() or 1
+    return {term: math.log(total_courses / df) + 1.0 for term, df in document_frequency.items()}
+
+
+def _score(idf):
+    return Sum(Case(
+        *[When(term=term, then=F('weight') * Value(weight)) for term, weight in idf.items()],
+        default=Value(0.0),
+        output_field=FloatField(),
+    ))
+
+
+def rank_courses(postings, idf, limit):
+    """Sum the scores of every course in `postings` and return the best `limit` as (course id, score)."""
+    ranked = postings.filter(term__in=idf).values('course').annotate(score=_score(idf)).order_by('-score', 'course')
+    return [(row['course'], row['score']) for row in ranked[:limit]]
+
+
+def _active(course_ids):
+    return list(Course.objects.filter(pk__in=course_ids, is_active=True).values_list('pk', flat=True))
+
+
+def search_course_ids(query, limit=30):
+    """
+    Return up to `limit` (course_id, score) pairs for active courses, best match first.
+    The score is the sum over query terms of the posting weight times the term's IDF.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return []
+    idf = term_weights(terms)
+    if not idf:
+        return []
+
+    # Posting reads stay inside the index; whether a course is active is checked on candidates only
+    postings = CourseSearchTerm.objects.all()
+    depth = limit * SEARCH_DEPTH
+    best, candidates, exhausted = {}, set(), True
+    for term in idf:
+        top = list(postings.filter(term=term).order_by('-weight', 'course').values_list('course', 'weight')[:depth])
+        best[term] = top[0][1]
+        candidates.update(course_id for course_id, _ in top)
+        exhausted = exhausted and len(top) < depth
+    candidates = _active(candidates)
+    if exhausted:
+        # Every posting was read, so the candidates are all the matches
+        return rank_courses(postings.filter(course__in=candidates), idf, limit)
+    if len(candidates) < limit:
+        # Inactive courses crowd the best postings: rare enough to rank the plain way
+        return rank_courses(postings.filter(course__is_active=True), idf, limit)
+
+    theta = rank_courses(postings.filter(course__in=candidates), idf, limit)[-1][1] - 1e-9
+    ceiling = sum(weight * idf[term] for term, weight in best.items())
+    cutoffs = {term: theta * weight / ceiling for term, weight in best.items()}
+    found = defaultdict(dict)
+    ranges = reduce(or_, (Q(term=term, weight__gte=cutoff) for term, cutoff in cutoffs.items()))
+    for course_id, term, weight in postings.filter(ranges).values_list('course', 'term', 'weight'):
+        found[course_id][term] = weight
+
+    # Weights are integers, so below a cutoff means at most ceil(cutoff) - 1
+    below = {term: (math.ceil(cutoff) - 1) * idf[term] for term, cutoff in cutoffs.items()}
+    survivors = [
+        course_id for course_id, weights in found.items()
+        if sum(weight * idf[term] for term, weight in weights.items())
+        + sum(bound for term, bound in below.items() if term not in weights) >= theta
+    ]
+    return rank_courses(postings.filter(course__in=_active(survivors)), idf, limit)
@@ -1,14 +1,80 @@
 from rest_framework import serializers
 from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.core.files import File
 from django.db import transaction
+from django.db.models import Prefetch
+from django.urls import reverse
 from .models import Collection, Promotion,  PaymentStatus, Description, Rating, Question, StudentAnswer, Option, Course, CourseProgress, \
   Review, Customer, InstructorEarnings, Lesson, Order, OrderItem, \
   Cart, CartItem, Certificate, CoreValue, WishList, WishListItem, Section, \
-  Mission, CompanyOverview, CoreValue, FAQ, Vission, StaffMember, Testimonial
+  Mission, CompanyOverview, CoreValue, FAQ, Vission, StaffMember, Testimonial, UploadSession
 from courses.signals import order_created
+from .outline import get_outline
+from .streaming import media_token
+from .images import variant_urls
+from .progress import completed_lesson_ids, has_bit, lesson_bits
 from core.models import User
 
 
+class DynamicFieldsMixin:
+    """
+    Sparse fieldsets and expandable relations for ModelSerializers.
+
+    `fields=[...]` keeps only those fields, so dropped SerializerMethodFields never run.
+    `expand=[...]` swaps relations listed in `Meta.expandable_fields` ({name: (serializer, kwargs)})
+    for nested serializers. `setup_queryset()` narrows the SQL to what the kept fields read;
+    `Meta.field_sources` lists the columns of fields that aren't plain model fields.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        self._requested_fields = fields
+        self._requested_expand = expand or []
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        for name in self._requested_expand:
+            if name in expandable:
+                serializer_class, options = expandable[name]
+                fields[name] = serializer_class(read_only=True, **options)
+        if self._requested_fields:
+            for name in set(fields) - set(self._requested_fields):
+                fields.pop(name)
+        return fields
+
+    @classmethod
+    def get_model_columns(cls, fields):
+        """Columns needed to render `fields`, or None when they can't all be resolved."""
+        opts = cls.Meta.model._meta
+        sources = getattr(cls.Meta, 'field_sources', {})
+        columns = {'pk'}
+        declared = cls._declared_fields
+        for name in fields:
+            if name in sources:
+                columns.update(sources[name])
+                continue
+            source = getattr(declared.get(name), 'source', None) or name
+            try:
+                model_field = opts.get_field(source)
+            except FieldDoesNotExist:
+                return None
+            if model_field.concrete and not model_field.many_to_many:
+                columns.add(source)
+            elif not model_field.many_to_many:
+                return None
+        return columns
+
+    @classmethod
+    def setup_queryset(cls, queryset, fields=None, expand=()):
+        if fields:
+            columns = cls.get_model_columns(fields)
+            if columns:
+                queryset = queryset.only(*columns)
+        return queryset
+
+
 class PromotionSerializer(serializers.ModelSerializer):
     instructor = serializers.CharField(read_only=True)
 
@@ -21,11 +87,29 @@ class PromotionSerializer(serializers.ModelSerializer):
         return super(PromotionSerializer, self).create(validated_data)
 
 
-class CollectionSerializer(serializers.ModelSerializer):
+class ImageVariantsField(serializers.Field):
+    """Read-only URLs of the resized variants of `image_field` (see courses/images.py), narrowest first."""
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        super().__init__(source='*', read_only=True, **kwargs)
+
+    def to_representation(self, instance):
+        return variant_urls(getattr(instance, self.image_field), getattr(instance, f'{self.image_field}_variants'))
+
+
+class CollectionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     courses_count = serializers.IntegerField()
     class Meta:
         model = Collection
         fields = ['id', 'title', 'courses_count']
+        field_sources = {'courses_count': []}
+
+
+class SimpleCollectionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Collection
+        fields = ['id', 'title']
 
 
 class RatingSerializer(serializers.ModelSerializer):
@@ -52,25 +136,55 @@ class RatingSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class CourseSerializer(serializers.ModelSerializer):
+class CourseSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     instructor = serializers.SerializerMethodField()
     numberOfStudents = serializers.SerializerMethodField()
     duration_in_hours = serializers.SerializerMethodField()
-    average_rating = serializers.SerializerMethodField()
-    rating_count = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField('image')
+
+    # Serializer field -> CourseQuerySet.with_catalog_stats() annotation it reads.
+    # rating_count/average_rating are running aggregates on Course itself (see Course.apply_rating_change).
+    CATALOG_STATS = {'numberOfStudents': 'students'}
 
     class Meta:
         model = Course
         fields = ['id', 'collection', 'title', 'courseFor', 'objectives', 'description', 'rating_count', 'average_rating',
                   'oldPrice', 'duration_in_hours', 'price', 'currency', 'instructor', 'level', 'syllabus', 'prerequisites',
-                  'image', 'preview', 'numberOfStudents', 'promotions', 'last_update'
+                  'image', 'image_variants', 'preview', 'numberOfStudents', 'promotions', 'last_update'
                   ]
+        read_only_fields = ['rating_count', 'average_rating']
+        field_sources = {
+            'instructor': ['instructor__first_name', 'instructor__last_name'],
+            'duration_in_hours': ['total_duration'],
+            'numberOfStudents': [],
+            'image_variants': ['image', 'image_variants'],
+        }
+        expandable_fields = {
+            'collection': (SimpleCollectionSerializer, {}),
+            'promotions': (PromotionSerializer, {'many': True}),
+        }
+
+    @classmethod
+    def setup_queryset(cls, queryset, fields=None, expand=()):
+        wanted = lambda name: not fields or name in fields
+        if wanted('instructor'):
+            queryset = queryset.select_related('instructor')
+        if wanted('collection') and 'collection' in expand:
+            queryset = queryset.select_related('collection')
+        if wanted('promotions'):
+            queryset = queryset.prefetch_related('promotions')
+        stats = [stat for name, stat in cls.CATALOG_STATS.items() if wanted(name)]
+        if stats:
+            queryset = queryset.with_catalog_stats(*stats)
+        return super().setup_queryset(queryset, fields, expand)
 
     def get_instructor(self, course: Course):
         instructor = course.instructor
         return {'first_name': instructor.first_name, 'last_name': instructor.last_name}
 
     def get_numberOfStudents(self, obj):
+        if hasattr(obj, 'catalog_students'):
+            return obj.catalog_students
         return OrderItem.objects.filter(course=obj).values('order__customer').distinct().count()
 
     def get_duration_in_hours(self, obj):
@@ -90,14 +204,8 @@ class CourseSerializer(serializers.ModelSerializer):
             Promotion.objects.create(course=instance, instructor=instance.instructor, **promotion_data)
         return instance
 
-    def get_average_rating(self, obj):
-        return obj.get_average_rating()
-
-    def get_rating_count(self, obj):
-        return obj.get_rating_count()
 
-
-class SimpleCourseSerializer(serializers.ModelSerializer):
+class SimpleCourseSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     instructor = serializers.SerializerMethodField()
     class Meta:
         model = Course
@@ -109,24 +217,83 @@ class SimpleCourseSerializer(serializers.ModelSerializer):
                  'last_name': instructor.last_name
                  }
 
-class LessonSerializer(serializers.ModelSerializer):
+class LessonSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     file = serializers.FileField(required=True)
     duration = serializers.IntegerField(read_only=True)
+    opened = serializers.SerializerMethodField()
+    playlist_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Lesson
-        fields = ['id', 'title', 'order', 'file', 'is_active', 'opened', 'duration']
-        read_only_fields = ['order']
+        fields = ['id', 'title', 'order', 'file', 'is_active', 'opened', 'duration', 'media_status', 'playlist_url']
+        read_only_fields = ['order', 'media_status']
+        field_sources = {'opened': ['section', 'progress_bit'], 'playlist_url': ['file', 'hls_status']}
+
+    def get_opened(self, obj):
+        # Whether the requesting user completed the lesson; their bitset is read once per section and request
+        request = self.context.get('request')
+        if not request or not request.user.is_authenticated:
+            return False
+        completed = self.context.setdefault('completed_bits', {})
+        if obj.section_id not in completed:
+            completed[obj.section_id] = CourseProgress.objects \
+                .filter(student=request.user, course__sections=obj.section_id) \
+                .values_list('completed_bits', flat=True).first()
+        return has_bit(completed[obj.section_id], obj.progress_bit)
+
+    def get_playlist_url(self, obj):
+        # The master playlist, behind a media token like the file itself (see LessonHlsView)
+        if obj.hls_status != Lesson.HLS_READY:
+            return None
+        url = reverse('lesson-hls', args=[media_token(obj), 'master.m3u8'])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
     
     def update(self, instance, validated_data):
         instance.title = validated_data.get('title', instance.title)
-        instance.file = validated_data.get('file', instance.file)
+        if 'file' in validated_data:
+            # A new upload needs a new probe
+            instance.file = validated_data['file']
+            instance.duration = 0
         instance.is_active = validated_data.get('is_active', instance.is_active)
         instance.save()
         return instance
 
 
-class SectionSerializer(serializers.ModelSerializer):
+class LessonBatchItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Lesson
+        fields = ['title', 'file', 'is_active']
+        # The model's extension validator without the per-item UniqueValidator query: storage already
+        # gives every saved upload a unique name
+        extra_kwargs = {'file': {'required': True, 'allow_null': False,
+                                 'validators': Lesson._meta.get_field('file').validators}}
+
+
+class LessonBatchSerializer(serializers.Serializer):
+    # See LessonViewSet.bulk
+    create = LessonBatchItemSerializer(many=True, required=False)
+    order = serializers.ListField(child=serializers.IntegerField(), required=False)
+    delete = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+
+class MoveSerializer(serializers.Serializer):
+    # Place the item right before or right after a sibling (see courses/ordering.py)
+    before = serializers.IntegerField(required=False)
+    after = serializers.IntegerField(required=False)
+
+
+class HeartbeatEventSerializer(serializers.Serializer):
+    lesson = serializers.IntegerField()
+    position = serializers.FloatField(min_value=0)  # Seconds into the lesson
+
+
+class HeartbeatSerializer(serializers.Serializer):
+    # A player's buffered playback reports, oldest first (see courses/watch.py)
+    events = HeartbeatEventSerializer(many=True, allow_empty=False, max_length=200)
+
+
+class SectionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     lessons = LessonSerializer(many=True, read_only=True)
     course = serializers.CharField(read_only=True)
     number_of_lessons = serializers.CharField(read_only=True)
@@ -134,7 +301,66 @@ class SectionSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Section
-        fields = ['id', 'course', 'title', 'number_of_lessons', 'total_duration', 'lessons']
+        fields = ['id', 'course', 'title', 'order', 'number_of_lessons', 'total_duration', 'lessons']
+        read_only_fields = ['order']
+        field_sources = {'course': ['course__title'], 'lessons': []}
+
+    @classmethod
+    def setup_queryset(cls, queryset, fields=None, expand=()):
+        if not fields or 'course' in fields:
+            queryset = queryset.select_related('course')
+        if not fields or 'lessons' in fields:
+            queryset = queryset.prefetch_related(Prefetch('lessons', Lesson.objects.order_by('order', 'id')))
+        return super().setup_queryset(queryset, fields, expand)
+
+
+class UploadTargetMixin:
+    """Checks shared by the upload serializers: one target (course, section + title, or lesson) the user owns."""
+
+    def validate_upload_target(self, data, course_field):
+        targets = [name for name in ('course', 'section', 'lesson') if data.get(name)]
+        if len(targets) != 1:
+            raise serializers.ValidationError('Give exactly one of course, section (new lesson) or lesson.')
+        if targets == ['section'] and not data.get('title'):
+            raise serializers.ValidationError({'title': 'A title is required for a new lesson.'})
+
+        target = data[targets[0]]
+        course = target if targets == ['course'] else target.course if targets == ['section'] else target.section.course
+        user = self.context['request'].user
+        if course.instructor_id != user.id and not user.is_staff:
+            raise serializers.ValidationError('You can only upload to your own courses.')
+
+        # Run the target field's validators (allowed extensions) before any bytes are sent
+        field = Course._meta.get_field(course_field) if targets == ['course'] else Lesson._meta.get_field('file')
+        for validator in field.validators:
+            validator(File(None, name=data['filename']))
+        return targets[0], field
+
+
+class UploadSessionSerializer(UploadTargetMixin, serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'course', 'section', 'lesson', 'title', 'filename', 'size', 'offset', 'status', 'created_at']
+        read_only_fields = ['offset', 'status']
+
+    def validate(self, data):
+        self.validate_upload_target(data, 'preview')
+        return data
+
+
+class DirectUploadSerializer(UploadTargetMixin, serializers.Serializer):
+    course = serializers.PrimaryKeyRelatedField(queryset=Course.objects.all(), required=False)
+    field = serializers.ChoiceField(choices=['image', 'preview'], default='preview')  # Which Course file, with `course`
+    section = serializers.PrimaryKeyRelatedField(queryset=Section.objects.all(), required=False)
+    lesson = serializers.PrimaryKeyRelatedField(queryset=Lesson.objects.all(), required=False)
+    title = serializers.CharField(max_length=255, required=False)
+    filename = serializers.CharField(max_length=255)
+    content_type = serializers.CharField(max_length=100)
+    size = serializers.IntegerField(min_value=1, max_value=settings.DIRECT_UPLOAD_MAX_SIZE)
+
+    def validate(self, data):
+        data['target'], data['model_field'] = self.validate_upload_target(data, data['field'])
+        return data
 
 
 class OptionSerializer(serializers.ModelSerializer):
@@ -143,12 +369,19 @@ class OptionSerializer(serializers.ModelSerializer):
         model = Option
         fields = ['id', 'text', 'is_correct']
 
-class QuestionSerializer(serializers.ModelSerializer):
+class QuestionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     options = serializers.SerializerMethodField()
 
     class Meta:
         model = Question
         fields = ['id', 'text', 'options', 'section']
+        field_sources = {'options': []}
+
+    @classmethod
+    def setup_queryset(cls, queryset, fields=None, expand=()):
+        if not fields or 'options' in fields:
+            queryset = queryset.prefetch_related('options')
+        return super().setup_queryset(queryset, fields, expand)
 
     def get_options(self, obj):
         # Check if the context has a flag to include `is_correct`
@@ -213,38 +446,48 @@ class CertificateSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class CourseDetailSerializer(serializers.ModelSerializer):
-    sections = SectionSerializer(many=True, read_only=True)
-    instructor = serializers.SerializerMethodField()
-    rating = RatingSerializer(many=True, read_only=True)
+class CourseDetailSerializer(CourseSerializer):
+    # Sections and lessons come from the stored outline document, not nested serializers
+    outline = serializers.SerializerMethodField()
 
-    class Meta:
-        model = Course
-        fields = ['id', 'title', 'instructor', 'description', 'rating', 'price', 'currency', 'sections']
+    class Meta(CourseSerializer.Meta):
+        fields = CourseSerializer.Meta.fields + ['outline']
+        field_sources = dict(CourseSerializer.Meta.field_sources, outline=['title', 'version'])
 
-    def get_instructor(self, course: Course):
-        instructor = course.instructor
-        return {
-            'first_name': instructor.first_name,
-            'last_name': instructor.last_name
-        }
+    def get_outline(self, course: Course):
+        document = get_outline(course)
+        return dict(document, sections=[dict(section, course=course.title) for section in document['sections']])
 
 
 class CourseProgressSerializer(serializers.ModelSerializer):
-    completed_lessons = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    completed_lessons = serializers.SerializerMethodField()
 
     class Meta:
         model = CourseProgress
         fields = ['student', 'course', 'completed_lessons', 'completed', 'progress', 'last_accessed']
         read_only_fields = ['student', 'course', 'completed_lessons']
 
+    def get_completed_lessons(self, obj):
+        # One {bit: lesson id} lookup per course and request, however many progress rows are listed
+        courses = self.context.setdefault('lesson_bits', {})
+        if obj.course_id not in courses:
+            courses[obj.course_id] = lesson_bits(obj.course_id)
+        return completed_lesson_ids(obj.completed_bits, courses[obj.course_id])
 
-class ReviewSerializer(serializers.ModelSerializer):
+
+class ReviewSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     course = serializers.StringRelatedField()
 
     class Meta:
         model = Review
         fields = ['id', 'name', 'course', 'rating', 'comment', 'created_at']
+        field_sources = {'course': ['course__title']}
+
+    @classmethod
+    def setup_queryset(cls, queryset, fields=None, expand=()):
+        if not fields or 'course' in fields:
+            queryset = queryset.select_related('course')
+        return super().setup_queryset(queryset, fields, expand)
 
     def create(self, validated_data):
         course_id = self.context['course_id']
@@ -389,6 +632,8 @@ class CoreValueSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class StaffMemberSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField('image')
+
     class Meta:
         model = StaffMember
         exclude = ['is_admin']  # Exclude sensitive admin details
@@ -408,6 +653,8 @@ class SocialMediaLinksSerializer(serializers.ModelSerializer):
         fields = ['fb', 'linkedin', 'twitter', 'tiktok', 'telegram_channel']
 
 class TestimonialSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField('image')
+
     class Meta:
         model = Testimonial
         fields = '__all__'
@@ -424,6 +671,8 @@ class DescriptionSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class PaymentStatusSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField('image')
+
     class Meta:
         model = PaymentStatus
         fields = '__all__'
\ No newline at end of file
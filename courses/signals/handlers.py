@@ -1,18 +1,65 @@
-from django.db.models.signals import post_save, post_delete
+import posixpath
+from collections import Counter
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.conf import settings
 from django.dispatch import receiver
-from courses.models import Lesson, SectionAttempt, Course, Customer, CourseProgress, Rating, OrderItem, Order, InstructorEarnings
+from courses.models import Lesson, SectionAttempt, Course, Customer, CourseProgress, Rating, OrderItem, Order, InstructorEarnings, \
+    Section, Collection, Promotion, CompanyOverview, Mission, Vission, CoreValue, StaffMember, Testimonial, FAQ, Description, \
+    PaymentStatus, CourseProgressRollup, StudentScore
+from courses.search import SEARCH_FIELDS, index_course
+from courses.cache import bump_generation, CATALOG, SITE_CONTENT
+from courses.facets import FACET_FIELDS, facet_values, course_facet_values, update_course_facets
+from courses.ratings import record_rating_change
+from courses.images import queue_variants
+from courses.durations import schedule_duration_rollup
+from courses.progress import schedule_lesson_count_refresh
+from courses.hls import HLS_ROOT, schedule_rendition_cleanup
+from courses.dashboard import apply_rollup_changes, days_to_complete, progress_bucket
 from notifications.notifications import send_notification_to_instructor, send_notification_to_customer
 
 
+@receiver(post_save, sender=Course)
+def update_course_search_index(sender, instance, update_fields=None, **kwargs):
+    # Metric-only saves (ratings, durations, student counts) don't touch the indexed text
+    if update_fields and not set(update_fields) & set(SEARCH_FIELDS):
+        return
+    index_course(instance)
+
+
 @receiver(post_save, sender=Lesson)
-def update_course_progress(sender, instance, **kwargs):
-    # Get all CourseProgress instances where this lesson is marked as completed
-    course_progresses = CourseProgress.objects.filter(completed_lessons=instance)
-    
-    for course_progress in course_progresses:
-        course_progress.calculate_progress()
-        course_progress.save()
+def refresh_lesson_count_on_save(sender, instance, created, **kwargs):
+    # Edits don't change how many lessons a course has; only additions rescale progress
+    if created:
+        schedule_lesson_count_refresh(instance.section.course_id)
+
+
+@receiver(post_delete, sender=Lesson)
+def refresh_lesson_count_on_delete(sender, instance, **kwargs):
+    # Also clears the lesson's bit from the course's completion bitsets, on commit
+    course_id = Section.objects.filter(pk=instance.section_id).values_list('course_id', flat=True).first()
+    if course_id:
+        schedule_lesson_count_refresh(course_id, removed=True)
+
+
+@receiver(pre_save, sender=Course)
+def remember_course_facets(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not set(update_fields) & set(FACET_FIELDS):
+        instance._old_facets = None
+        return
+    old_values = Course.objects.filter(pk=instance.pk).values(*FACET_FIELDS).first() if instance.pk else None
+    instance._old_facets = facet_values(old_values)
+
+
+@receiver(post_save, sender=Course)
+def update_facet_counts_on_save(sender, instance, **kwargs):
+    old_facets = getattr(instance, '_old_facets', None)
+    if old_facets is not None:
+        update_course_facets(old_facets, course_facet_values(instance))
+
+
+@receiver(post_delete, sender=Course)
+def update_facet_counts_on_delete(sender, instance, **kwargs):
+    update_course_facets(course_facet_values(instance), set())
 
 
 @receiver(post_save, sender=Order)
@@ -22,6 +69,51 @@ def create_course_progress(sender, instance, created, **kwargs):
             CourseProgress.objects.get_or_create(student=instance.customer, course=item.course)
 
 
+@receiver(post_save, sender=CourseProgress)
+def count_enrolment(sender, instance, created, **kwargs):
+    # Later changes to progress go through courses/progress.py, which moves the rollups itself
+    if created:
+        apply_rollup_changes({(instance.course_id, CourseProgressRollup.PROGRESS, progress_bucket(instance.progress)): 1})
+
+
+@receiver(post_delete, sender=CourseProgress)
+def uncount_enrolment(sender, instance, **kwargs):
+    deltas = Counter({(instance.course_id, CourseProgressRollup.PROGRESS, progress_bucket(instance.progress)): -1})
+    days = days_to_complete(instance.started_at, instance.completed_at)
+    if instance.completed and days is not None:
+        deltas[instance.course_id, CourseProgressRollup.DAYS_TO_COMPLETE, days] -= 1
+    apply_rollup_changes(deltas)
+
+
+@receiver(pre_save, sender=StudentScore)
+def remember_section_pass(sender, instance, **kwargs):
+    instance._was_passed = StudentScore.objects.filter(pk=instance.pk).values_list('completed', flat=True).first() \
+        if instance.pk else None
+
+
+@receiver(post_save, sender=StudentScore)
+def count_section_pass(sender, instance, created, **kwargs):
+    course_id = instance.section.course_id
+    deltas = Counter()
+    if created:
+        deltas[course_id, CourseProgressRollup.SECTION_ATTEMPTED, instance.section_id] += 1
+    elif getattr(instance, '_was_passed', False):
+        deltas[course_id, CourseProgressRollup.SECTION_PASSED, instance.section_id] -= 1
+    if instance.completed:
+        deltas[course_id, CourseProgressRollup.SECTION_PASSED, instance.section_id] += 1
+    apply_rollup_changes(deltas)
+
+
+@receiver(post_delete, sender=StudentScore)
+def uncount_section_pass(sender, instance, **kwargs):
+    course_id = Section.objects.filter(pk=instance.section_id).values_list('course_id', flat=True).first()
+    if course_id:
+        apply_rollup_changes({
+            (course_id, CourseProgressRollup.SECTION_ATTEMPTED, instance.section_id): -1,
+            (course_id, CourseProgressRollup.SECTION_PASSED, instance.section_id): -int(instance.completed),
+        })
+
+
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_customer_for_new_user(sender, instance, created,  **kwargs):
     if created:
@@ -47,18 +139,132 @@ def update_instructor_earnings(sender, instance, created, **kwargs):
         earnings, created = InstructorEarnings.objects.get_or_create(instructor=instructor)
 
 
+@receiver(pre_save, sender=Rating)
+def remember_previous_rating(sender, instance, **kwargs):
+    instance._previous_rating = Rating.objects.filter(pk=instance.pk).values_list('course_id', 'score').first() \
+        if instance.pk else None
+
+
 @receiver(post_save, sender=Rating)
+def update_course_rating_on_save(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_rating', None)
+    if previous is None:
+        record_rating_change(instance.course_id, 1, instance.score)
+    elif previous[0] != instance.course_id:
+        record_rating_change(previous[0], -1, -previous[1])
+        record_rating_change(instance.course_id, 1, instance.score)
+    else:
+        record_rating_change(instance.course_id, 0, instance.score - previous[1])
+
+
 @receiver(post_delete, sender=Rating)
-def update_course_rating_count(sender, instance, created, **kwargs):
-  instance.course.update_rating_metrics()
+def update_course_rating_on_delete(sender, instance, **kwargs):
+    record_rating_change(instance.course_id, -1, -instance.score)
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=StaffMember)
+@receiver(post_save, sender=Testimonial)
+@receiver(post_save, sender=PaymentStatus)
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def queue_image_variants(sender, instance, **kwargs):
+    # Resizing runs in the render_image_variants worker, not in the request
+    queue_variants(instance)
 
 
 @receiver(post_save, sender=Lesson)
-def update_section_duration_on_save(sender, instance, **kwargs):
-    section = instance.section
-    section.update_total_duration()
+def update_section_duration_on_save(sender, instance, update_fields=None, **kwargs):
+    # Saves that can't change a duration (e.g. `title`) skip the rollup
+    if update_fields and not {'duration', 'section', 'file'} & set(update_fields):
+        return
+    schedule_duration_rollup(instance.section_id)
 
 @receiver(post_delete, sender=Lesson)
 def update_section_duration_on_delete(sender, instance, **kwargs):
-    section = instance.section
-    section.update_total_duration()
+    schedule_duration_rollup(instance.section_id)
+
+
+@receiver(pre_save, sender=Lesson)
+def remember_lesson_playlist(sender, instance, update_fields=None, **kwargs):
+    instance._old_hls_playlist = None
+    if instance.pk and (not update_fields or {'file', 'hls_playlist'} & set(update_fields)):
+        instance._old_hls_playlist = Lesson.objects.filter(pk=instance.pk).values_list('hls_playlist', flat=True).first()
+
+
+@receiver(post_save, sender=Lesson)
+def delete_replaced_renditions(sender, instance, **kwargs):
+    # prepare_media() drops the playlist of a replaced file; its rendition tree goes with it
+    old_playlist = getattr(instance, '_old_hls_playlist', None)
+    if old_playlist and old_playlist != instance.hls_playlist:
+        schedule_rendition_cleanup(instance.file.storage, posixpath.dirname(old_playlist))
+
+
+@receiver(post_delete, sender=Lesson)
+def delete_lesson_renditions(sender, instance, **kwargs):
+    # Every run of the lesson, including any a worker finished after the lesson was replaced
+    if instance.hls_status:
+        schedule_rendition_cleanup(instance.file.storage, f'{HLS_ROOT}/{instance.pk}')
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(m2m_changed, sender=Course.promotions.through)
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+@receiver(post_save, sender=Section)
+@receiver(post_delete, sender=Section)
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+@receiver(post_save, sender=OrderItem)
+def invalidate_catalog_cache(sender, **kwargs):
+    bump_generation(CATALOG)
+
+
+@receiver(post_save, sender=CompanyOverview)
+@receiver(post_delete, sender=CompanyOverview)
+@receiver(post_save, sender=Mission)
+@receiver(post_delete, sender=Mission)
+@receiver(post_save, sender=Vission)
+@receiver(post_delete, sender=Vission)
+@receiver(post_save, sender=CoreValue)
+@receiver(post_delete, sender=CoreValue)
+@receiver(post_save, sender=StaffMember)
+@receiver(post_delete, sender=StaffMember)
+@receiver(post_save, sender=Testimonial)
+@receiver(post_delete, sender=Testimonial)
+@receiver(post_save, sender=FAQ)
+@receiver(post_delete, sender=FAQ)
+@receiver(post_save, sender=Description)
+@receiver(post_delete, sender=Description)
+def invalidate_site_content_cache(sender, **kwargs):
+    bump_generation(SITE_CONTENT)
+
+
+@receiver(post_save, sender=Section)
+@receiver(post_delete, sender=Section)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+@receiver(post_save, sender=OrderItem)
+def touch_course_version(sender, instance, **kwargs):
+    # Change the course's ETag / Last-Modified when anything rendered with it changes
+    Course.touch(instance.course_id)
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def touch_course_version_for_lesson(sender, instance, **kwargs):
+    Course.touch(instance.section.course_id)
+
+
+@receiver(m2m_changed, sender=Course.promotions.through)
+def touch_course_version_for_promotions(sender, instance, action, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, Course):
+        Course.touch(instance.pk)
+    elif pk_set:
+        Course.touch(*pk_set)
@@ -0,0 +1,47 @@
+import time
+from django.core import signing
+from django.core.files.storage import FileSystemStorage
+from django.urls import reverse
+from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
+
+
+# Presign contract shared by the storages below: presign_upload() returns the request a client
+# must make to put `name` straight into the storage ({method, url, fields}, sent as a multipart
+# form with the file last, as S3 expects), limited to `max_size` bytes of `content_type` and
+# valid for `expires_in` seconds. Verification afterwards uses the ordinary exists()/size()/open().
+
+LOCAL_UPLOAD_SALT = 'courses.storage.local-upload'
+
+
+class PresignedS3Storage(S3Boto3Storage):
+    def presign_upload(self, name, content_type, max_size, expires_in):
+        post = self.bucket.meta.client.generate_presigned_post(
+            self.bucket.name, self._normalize_name(clean_name(name)),
+            Fields={'Content-Type': content_type},
+            Conditions=[{'Content-Type': content_type}, ['content-length-range', 1, max_size]],
+            ExpiresIn=expires_in,
+        )
+        return {'method': 'POST', 'url': post['url'], 'fields': post['fields']}
+
+
+class LocalPresignedStorage(FileSystemStorage):
+    """
+    Filesystem stand-in for PresignedS3Storage: the target is DirectUploadReceiveView, which checks
+    the signed token the way S3 checks a POST policy and writes the file into this storage.
+    """
+
+    def presign_upload(self, name, content_type, max_size, expires_in):
+        token = signing.dumps({
+            'name': name, 'content_type': content_type, 'max_size': max_size,
+            'expires': int(time.time()) + expires_in,
+        }, salt=LOCAL_UPLOAD_SALT)
+        return {'method': 'POST', 'url': reverse('direct-upload-receive', args=[token]),
+                'fields': {'Content-Type': content_type}}
+
+    def check_upload_token(self, token):
+        """The policy a presigned token grants, or signing.BadSignature if it is forged or expired."""
+        policy = signing.loads(token, salt=LOCAL_UPLOAD_SALT)
+        if policy['expires'] < time.time():
+            raise signing.SignatureExpired('Upload target expired')
+        return policy
@@ -0,0 +1,198 @@
+import mimetypes
+import os
+import re
+from uuid import uuid4
+import requests
+from django.conf import settings
+from django.core import signing
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+
+
+# Byte-serving of lesson media. Entitlement is checked once, when LessonViewSet.media issues a
+# signed token; the token then authorizes every Range request a player makes while seeking.
+
+MEDIA_TOKEN_SALT = 'courses.streaming.media'
+STREAM_BLOCK = 64 * 1024
+MAX_RANGES = 16  # More ranges than this are answered with the whole file (RFC 9110 allows ignoring Range)
+
+_RANGE_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def media_token(lesson):
+    return signing.dumps({'lesson': lesson.pk, 'name': lesson.file.name}, salt=MEDIA_TOKEN_SALT)
+
+
+def read_media_token(token):
+    """(lesson id, file name) from a token, or signing.BadSignature if it is forged or older than MEDIA_TOKEN_MAX_AGE."""
+    claim = signing.loads(token, salt=MEDIA_TOKEN_SALT, max_age=settings.MEDIA_TOKEN_MAX_AGE)
+    return claim['lesson'], claim['name']
+
+
+def parse_range_header(header, size):
+    """
+    Parse `Range: bytes=...` into sorted, merged (start, end) pairs with inclusive ends.
+    Returns None when the header should be ignored (absent, not bytes, malformed or too many
+    ranges) and raises RangeNotSatisfiable when no range overlaps the file.
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    specs = header[len('bytes='):].split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+    ranges = []
+    for spec in specs:
+        match = _RANGE_RE.match(spec)
+        if not match or match.groups() == ('', ''):
+            return None
+        first, last = match.groups()
+        if first == '':
+            # Suffix range: the last N bytes
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
+        if start <= end and start < size:
+            ranges.append((start, end))
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class FileRange:
+    """
+    A file narrowed to bytes [start, start + length). It keeps fileno() so WSGI servers with a
+    file_wrapper (gunicorn) sendfile() straight from the OS file offset, and read() stops at the
+    range end for servers that iterate instead.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.start = start
+        self.length = length
+        self.name = file.name
+        self.file.seek(start)
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self.tell(), os.SEEK_END: self.length}[whence]
+        self.file.seek(self.start + min(max(base + offset, 0), self.length))
+        return self.tell()
+
+    def tell(self):
+        return self.file.tell() - self.start
+
+    def read(self, size=-1):
+        remaining = self.length - self.tell()
+        if size < 0 or size > remaining:
+            size = remaining
+        return self.file.read(size) if size > 0 else b''
+
+    def close(self):
+        self.file.close()
+
+
+def _local_path(field_file):
+    try:
+        return field_file.storage.path(field_file.name)
+    except NotImplementedError:
+        return None
+
+
+def _remote_blocks(url, start, end):
+    # One ranged GET per requested range, streamed through in STREAM_BLOCK pieces
+    with requests.get(url, headers={'Range': f'bytes={start}-{end}'}, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        yield from response.iter_content(STREAM_BLOCK)
+
+
+def _local_blocks(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = f.read(min(STREAM_BLOCK, remaining))
+            if not data:
+                return
+            remaining -= len(data)
+            yield data
+
+
+def serve_file(request, field_file):
+    """
+    Serve a stored file with Range support: a 200 for the whole file, a 206 for one range (sendfile
+    from local storage, one ranged GET upstream for remote storage), a multipart/byteranges 206 for
+    several ranges, and a 416 when nothing requested overlaps the file.
+    """
+    path = _local_path(field_file)
+    size = os.path.getsize(path) if path else field_file.storage.size(field_file.name)
+    content_type = mimetypes.guess_type(field_file.name)[0] or 'application/octet-stream'
+    url = None if path else field_file.storage.url(field_file.name)
+
+    try:
+        ranges = parse_range_header(request.headers.get('Range'), size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return _common_headers(response)
+    partial = ranges is not None
+    if not partial:
+        ranges = [(0, size - 1)]
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        length = end - start + 1
+        if path:
+            response = FileResponse(FileRange(open(path, 'rb'), start, length), content_type=content_type)
+        else:
+            response = StreamingHttpResponse(_remote_blocks(url, start, end) if length else iter(()),
+                                             content_type=content_type)
+        response['Content-Length'] = str(length)
+        if partial:
+            response.status_code = 206
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        return _common_headers(response)
+
+    boundary = uuid4().hex
+    parts = [
+        (f'--{boundary}\r\nContent-Type: {content_type}\r\nContent-Range: bytes {start}-{end}/{size}\r\n\r\n'.encode(),
+         start, end)
+        for start, end in ranges
+    ]
+    closing = f'\r\n--{boundary}--\r\n'.encode()
+
+    def body():
+        for number, (header, start, end) in enumerate(parts):
+            yield (b'\r\n' if number else b'') + header
+            yield from _local_blocks(path, start, end) if path else _remote_blocks(url, start, end)
+        yield closing
+
+    length = sum(len(header) + end - start + 1 for header, start, end in parts) + 2 * (len(parts) - 1) + len(closing)
+    response = StreamingHttpResponse(body(), status=206, content_type=f'multipart/byteranges; boundary={boundary}')
+    response['Content-Length'] = str(length)
+    return _common_headers(response)
+
+
+def _common_headers(response):
+    response['Accept-Ranges'] = 'bytes'
+    # Tokens are per user, so shared caches must not keep the bytes
+    response['Cache-Control'] = f'private, max-age={settings.MEDIA_TOKEN_MAX_AGE}'
+    return response
@@ -0,0 +1,713 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from base64 import b64encode
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from core.models import User
+from courses import hls, images
+from courses.lessons import LessonBatchError, apply_lesson_batch
+from courses.models import Collection, Course, CourseProgress, CourseProgressRollup, Lesson, Option, Promotion, Question, \
+    Rating, Section, StudentScore, UploadSession
+from courses.ordering import ORDER_GAP, OrderingError, crowded_parents, move, rebalance
+from courses.dashboard import rebuild_rollups
+from courses.grading import grade_submission
+from courses.progress import has_bit, popcount, set_lesson_completed
+from courses.uploads import ChunkReader
+
+
+class CourseListQueriesTest(TestCase):
+    """The catalog list page costs the same number of queries however many courses it shows."""
+
+    def setUp(self):
+        cache.clear()
+        self.instructor = User.objects.create(email='instructor@example.com', role='instructor',
+                                              first_name='Ada', last_name='Byron')
+        self.student = User.objects.create(email='student@example.com',
+                                           first_name='Alan', last_name='Turing')
+        self.collection = Collection.objects.create(title='Programming')
+
+    def add_courses(self, count):
+        now = timezone.now()
+        for _ in range(count):
+            number = Course.objects.count()
+            course = Course.objects.create(
+                title=f'Course {number}', objectives='-', description='-', price=10, instructor=self.instructor,
+                collection=self.collection, image='course/images/cover.jpg',
+                preview=f'course/lessons/videos/intro-{number}.mp4',
+            )
+            Rating.objects.create(score=4, user=self.student, course=course)
+            course.promotions.add(Promotion.objects.create(
+                instructor=self.instructor, course=course, title='Launch', message='-', discount=10,
+                start_date=now, end_date=now + timedelta(days=7),
+            ))
+
+    def list_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/course/courses/', {'page_size': 100})
+        self.assertEqual(response.status_code, 200)
+        return len(response.data['results']), len(queries)
+
+    def test_query_count_does_not_grow_with_the_catalog(self):
+        self.add_courses(3)
+        small, small_queries = self.list_queries()
+        self.add_courses(37)
+        large, large_queries = self.list_queries()
+
+        self.assertEqual((small, large), (3, 40))
+        self.assertEqual(small_queries, large_queries)
+
+
+class LocalStorageMixin:
+    """Store media in a temporary directory for the duration of each test."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        storage = override_settings(
+            STORAGES={'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                      'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}},
+            MEDIA_ROOT=self.media_root,
+        )
+        storage.enable()
+        self.addCleanup(storage.disable)
+
+
+@override_settings(UPLOAD_CHUNK_SIZE=4 * 1024 * 1024)
+class ChunkedUploadTest(LocalStorageMixin, TestCase):
+    """A multi-chunk upload to local storage, end to end through the resumable upload endpoints."""
+
+    def setUp(self):
+        super().setUp()
+        self.instructor = User.objects.create(email='instructor@example.com', role='instructor',
+                                              first_name='Ada', last_name='Byron')
+        course = Course.objects.create(
+            title='Video', objectives='-', description='-', price=10, instructor=self.instructor,
+            collection=Collection.objects.create(title='Film'), image='course/images/cover.jpg',
+            preview='course/lessons/videos/intro.mp4',
+        )
+        self.section = Section.objects.create(course=course, title='Part 1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.instructor)
+
+    def start(self, size):
+        response = self.client.post('/course/uploads/', {
+            'section': self.section.pk, 'title': 'Lecture', 'filename': 'lecture.mp4', 'size': size,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def put_chunk(self, session_id, offset, data):
+        return self.client.put(f'/course/uploads/{session_id}/chunk/', data,
+                               content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_large_upload_is_assembled_in_storage(self):
+        chunk_size, size = settings.UPLOAD_CHUNK_SIZE, 10 * settings.UPLOAD_CHUNK_SIZE + 12345
+        session_id = self.start(size)
+        sent = hashlib.sha256()
+        for offset in range(0, size, chunk_size):
+            data = os.urandom(min(chunk_size, size - offset))
+            sent.update(data)
+            response = self.put_chunk(session_id, offset, data)
+            self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['offset'], size)
+
+        session = UploadSession.objects.get(pk=session_id)
+        chunks = list(session.chunks)
+        self.assertEqual(len(chunks), 11)
+        # The seeks an S3 transfer makes to size a seekable stream, then a read from the middle
+        reader = ChunkReader(chunks, size)
+        self.assertEqual(reader.seek(0, io.SEEK_END), size)
+        self.assertEqual(reader.tell(), size)
+        reader.seek(chunk_size * 3 - 10)
+        self.assertEqual(len(reader.read(20)), 20)
+        self.assertEqual(reader.tell(), chunk_size * 3 + 10)
+        reader.close()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/course/uploads/{session_id}/complete/')
+        self.assertEqual(response.status_code, 200, response.data)
+
+        lesson = Lesson.objects.get(section=self.section, title='Lecture')
+        stored = hashlib.sha256()
+        with default_storage.open(lesson.file.name, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                stored.update(block)
+        self.assertEqual(stored.hexdigest(), sent.hexdigest())
+        self.assertEqual(lesson.file.size, size)
+        self.assertFalse(any(default_storage.exists(name) for name in chunks))
+
+        response = self.client.post(f'/course/uploads/{session_id}/complete/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_oversized_chunk_is_refused_before_reading(self):
+        session_id = self.start(settings.UPLOAD_CHUNK_SIZE * 2)
+        response = self.put_chunk(session_id, 0, b'x' * (settings.UPLOAD_CHUNK_SIZE + 1))
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(UploadSession.objects.get(pk=session_id).offset, 0)
+
+
+class KeysetPaginationTest(TestCase):
+    """Paging through an ordering full of ties seeks on (field, id) instead of offsetting."""
+
+    def setUp(self):
+        cache.clear()
+        instructor = User.objects.create(email='instructor@example.com', role='instructor',
+                                         first_name='Ada', last_name='Byron')
+        collection = Collection.objects.create(title='Programming')
+        self.ids = [Course.objects.create(
+            title=f'Course {number}', objectives='-', description='-', price=10 if number % 4 else 20,
+            instructor=instructor, collection=collection, image='course/images/cover.jpg',
+            preview=f'course/lessons/videos/intro-{number}.mp4',
+        ).pk for number in range(23)]
+
+    def walk(self, ordering):
+        url, pages = f'/course/courses/?ordering={ordering}&page_size=4', []
+        while url:
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(any('OFFSET' in query['sql'] for query in queries))
+            pages.append([course['id'] for course in response.data['results']])
+            url = response.data['next']
+        return pages
+
+    def test_ties_are_walked_by_id_in_both_directions(self):
+        for ordering in ('price', '-price'):
+            pages = self.walk(ordering)
+            seen = [pk for page in pages for pk in page]
+            expected = sorted(self.ids, key=lambda pk: (10 if self.ids.index(pk) % 4 else 20, pk),
+                              reverse=ordering.startswith('-'))
+            self.assertEqual(seen, expected)
+
+            # Walking back from the last page returns the same pages
+            cache.clear()
+            last = self.client.get(f'/course/courses/?ordering={ordering}&page_size=4')
+            while last.data['next']:
+                cache.clear()
+                last = self.client.get(last.data['next'])
+            url, back = last.data['previous'], [[course['id'] for course in last.data['results']]]
+            while url:
+                cache.clear()
+                response = self.client.get(url)
+                back.append([course['id'] for course in response.data['results']])
+                url = response.data['previous']
+            self.assertEqual(back[::-1], pages)
+
+    def test_malformed_cursor_is_not_found(self):
+        cursor = b64encode(b'p=10').decode()
+        response = self.client.get(f'/course/courses/?ordering=price&cursor={cursor}')
+        self.assertEqual(response.status_code, 404)
+
+
+class ConditionalCourseResponseTest(TestCase):
+    """Course validators stop answering 304 once the signed URLs in the payload may have expired."""
+
+    def setUp(self):
+        cache.clear()
+        instructor = User.objects.create(email='instructor@example.com', role='instructor',
+                                         first_name='Ada', last_name='Byron')
+        self.course = Course.objects.create(
+            title='Course', objectives='-', description='-', price=10, instructor=instructor,
+            collection=Collection.objects.create(title='Programming'), image='course/images/cover.jpg',
+            preview='course/lessons/videos/intro.mp4',
+        )
+
+    def get(self, now, **headers):
+        cache.clear()
+        with mock.patch('courses.cache.time.time', return_value=now):
+            return self.client.get(f'/course/courses/{self.course.pk}/', **headers)
+
+    def test_validators_roll_over_within_the_url_lifetime(self):
+        now = timezone.now().timestamp() + 60
+        first = self.get(now)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Cache-Control'], 'private, no-cache')
+        self.assertEqual(self.get(now + 1, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertEqual(self.get(now + 1, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304)
+
+        later = now + settings.CONDITIONAL_RESPONSE_MAX_AGE
+        self.assertLess(settings.CONDITIONAL_RESPONSE_MAX_AGE + settings.RESPONSE_CACHE_TIMEOUT,
+                        settings.MEDIA_TOKEN_MAX_AGE)
+        second = self.get(later, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(self.get(later, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 200)
+
+
+class CourseTransferTest(TestCase):
+    """NDJSON import of exported course trees, including backends that return no ids from bulk inserts."""
+
+    def setUp(self):
+        cache.clear()
+        self.instructor = User.objects.create(email='instructor@example.com', role='instructor',
+                                              first_name='Ada', last_name='Byron')
+        self.admin = User.objects.create(email='admin@example.com', is_staff=True,
+                                         first_name='Grace', last_name='Hopper')
+        self.course = Course.objects.create(
+            title='Course', objectives='-', description='-', price=10, instructor=self.instructor,
+            collection=Collection.objects.create(title='Programming'), image='course/images/cover.jpg',
+            preview='course/lessons/videos/intro.mp4',
+        )
+        section = Section.objects.create(course=self.course, title='Part 1')
+        Lesson.objects.create(section=section, title='Video', order=1, file='course/lessons/files/video.mp4',
+                              duration=0)
+        Lesson.objects.create(section=section, title='Notes', order=2, file='course/lessons/files/notes.pdf')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def export(self):
+        return b''.join(self.client.get('/course/admin/course-transfer/').streaming_content)
+
+    def post(self, content):
+        upload = SimpleUploadedFile('courses.ndjson', content, content_type='application/x-ndjson')
+        return self.client.post('/course/admin/course-transfer/', {'file': upload}, format='multipart')
+
+    def renamed(self, content, suffix):
+        return content.replace(b'.mp4', f'-{suffix}.mp4'.encode()).replace(b'.pdf', f'-{suffix}.pdf'.encode())
+
+    def test_import_maps_new_courses_by_batch_key_and_queues_media(self):
+        exported = self.export()
+        # As on MySQL: bulk_create() leaves primary keys unset
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            response = self.post(self.renamed(exported, 'copy'))
+        self.assertEqual(response.status_code, 201, response.data)
+
+        copy = Course.objects.exclude(pk=self.course.pk).get()
+        self.assertEqual(copy.preview.name, 'course/lessons/videos/intro-copy.mp4')
+        self.assertEqual(Section.objects.filter(course=self.course).count(), 1)
+        lessons = {lesson.title: lesson for lesson in Lesson.objects.filter(section__course=copy)}
+        self.assertEqual(set(lessons), {'Video', 'Notes'})
+        self.assertEqual(lessons['Video'].media_status, Lesson.MEDIA_PENDING)
+        self.assertEqual(lessons['Notes'].media_status, Lesson.MEDIA_READY)
+
+    def test_reimport_and_bad_values_are_client_errors(self):
+        exported = self.export()
+        response = self.post(exported)
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.data['error'].startswith('Line 1:'))
+
+        bad_price = self.renamed(exported, 'bad').replace(b'"price": "10.00"', b'"price": "ten"')
+        response = self.post(b'\n' + bad_price)
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.data['error'].startswith('Line 2:'))
+
+        no_text = self.renamed(exported, 'q').replace(b'"questions": []', b'"questions": [{}]')
+        self.assertEqual(self.post(no_text).status_code, 400)
+        self.assertEqual(Course.objects.count(), 1)
+
+
+class HlsRenditionTest(LocalStorageMixin, TestCase):
+    """Finished transcodes invalidate the lesson's course, and stale rendition trees are deleted."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        instructor = User.objects.create(email='instructor@example.com', role='instructor',
+                                         first_name='Ada', last_name='Byron')
+        self.course = Course.objects.create(
+            title='Video', objectives='-', description='-', price=10, instructor=instructor,
+            collection=Collection.objects.create(title='Film'), image='course/images/cover.jpg',
+            preview='course/lessons/videos/intro.mp4',
+        )
+        section = Section.objects.create(course=self.course, title='Part 1')
+        self.lesson = Lesson.objects.create(section=section, title='Lecture', order=1,
+                                            file='course/lessons/files/lecture.mp4', duration=60)
+
+    def claim(self):
+        Lesson.objects.filter(pk=self.lesson.pk).update(hls_status=Lesson.HLS_PENDING)
+        return hls.claim_transcodes(1)[0]
+
+    def finish(self, lesson):
+        """Run _finish as if ffmpeg had written one rendition; returns the stored playlist name."""
+        output_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(output_dir, '360p'))
+        for name in ('master.m3u8', '360p/index.m3u8', '360p/segment_0000.ts'):
+            with open(os.path.join(output_dir, name), 'w') as f:
+                f.write(name)
+        future = Future()
+        future.set_result(['360p'])
+        hls._finish(lesson, future, output_dir)
+        return Lesson.objects.get(pk=self.lesson.pk).hls_playlist
+
+    def lesson_tree(self):
+        """Files left under the lesson's HLS prefix (local storage keeps the emptied directories)."""
+        root = os.path.join(self.media_root, hls.HLS_ROOT, str(self.lesson.pk))
+        return [name for _, _, files in os.walk(root) for name in files]
+
+    def test_ready_renditions_change_the_course_validators(self):
+        version = Course.objects.get(pk=self.course.pk).version
+        playlist = self.finish(self.claim())
+        self.assertEqual(Lesson.objects.get(pk=self.lesson.pk).hls_status, Lesson.HLS_READY)
+        self.assertTrue(default_storage.exists(playlist))
+        self.assertGreater(Course.objects.get(pk=self.course.pk).version, version)
+
+    def test_replacing_or_deleting_the_file_deletes_its_renditions(self):
+        first = self.finish(self.claim())
+        lesson = Lesson.objects.get(pk=self.lesson.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson.file, lesson.duration = 'course/lessons/files/lecture-2.mp4', 0
+            lesson.save()
+        self.assertEqual(Lesson.objects.get(pk=self.lesson.pk).hls_playlist, '')
+        self.assertFalse(default_storage.exists(first))
+        self.assertEqual(self.lesson_tree(), [])
+
+        second = self.finish(self.claim())
+        self.assertTrue(default_storage.exists(second))
+        with self.captureOnCommitCallbacks(execute=True):
+            Lesson.objects.get(pk=self.lesson.pk).delete()
+        self.assertEqual(self.lesson_tree(), [])
+
+    def test_renditions_of_a_file_replaced_mid_transcode_are_dropped(self):
+        lesson = self.claim()
+        Lesson.objects.filter(pk=self.lesson.pk).update(file='course/lessons/files/other.mp4')
+        self.assertEqual(self.finish(lesson), '')
+        self.assertEqual(self.lesson_tree(), [])
+
+
+@override_settings(IMAGE_VARIANT_WIDTHS=[160, 320], IMAGE_VARIANT_FORMATS=['webp'])
+class ImageVariantTest(LocalStorageMixin, TestCase):
+    """Images that differ only by extension get separate variants, and replacing one leaves the other's alone."""
+
+    def setUp(self):
+        super().setUp()
+        self.instructor = User.objects.create(email='instructor@example.com', role='instructor',
+                                              first_name='Ada', last_name='Byron')
+        self.collection = Collection.objects.create(title='Design')
+
+    def course(self, image, number):
+        return Course.objects.create(
+            title=f'Course {number}', objectives='-', description='-', price=10, instructor=self.instructor,
+            collection=self.collection, image=self.store(image), preview=f'course/lessons/videos/intro-{number}.mp4',
+        )
+
+    def store(self, name, color='red'):
+        buffer = io.BytesIO()
+        Image.new('RGB', (400, 300), color).save(buffer, 'PNG' if name.endswith('.png') else 'JPEG')
+        return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    def render(self):
+        images.queue_existing()
+        while images.render_jobs():
+            pass
+
+    def urls(self, course):
+        course.refresh_from_db()
+        return [variant['webp'] for variant in images.variant_urls(course.image, course.image_variants)]
+
+    def test_extensions_do_not_share_variants(self):
+        png, jpg = self.course('course/images/cover.png', 1), self.course('course/images/cover.jpg', 2)
+        self.render()
+        png_urls, jpg_urls = self.urls(png), self.urls(jpg)
+        self.assertEqual(len(png_urls), 2)
+        self.assertFalse(set(png_urls) & set(jpg_urls))
+
+        png.image = self.store('course/images/other.png', 'blue')
+        png.save()
+        self.render()
+        self.assertEqual(len(self.urls(png)), 2)
+        self.assertTrue(all(default_storage.exists(images.variant_name(jpg.image.name, width, 'webp'))
+                            for width in (160, 320)))
+        self.assertFalse(default_storage.exists(images.variant_name('course/images/cover.png', 160, 'webp')))
+
+    def test_variants_of_the_old_layout_are_rerendered_and_removed(self):
+        course = self.course('course/images/cover.png', 1)
+        legacy = images.variant_name(course.image.name, 160, 'webp', layout=1)
+        default_storage.save(legacy, ContentFile(b'old'))
+        Course.objects.filter(pk=course.pk).update(
+            image_variants={'source': course.image.name, 'widths': [160], 'formats': ['webp']})
+        self.assertEqual(self.urls(course), [])
+
+        self.render()
+        self.assertEqual(len(self.urls(course)), 2)
+        self.assertFalse(default_storage.exists(legacy))
+
+
+class LessonBatchTest(TestCase):
+    """apply_lesson_batch keeps order keys, counters and completion bits right in one transaction."""
+
+    def setUp(self):
+        instructor = User.objects.create(email='instructor@example.com', role='instructor',
+                                         first_name='Ada', last_name='Byron')
+        self.student = User.objects.create(email='student@example.com', first_name='Alan', last_name='Turing')
+        self.course = Course.objects.create(
+            title='Course', objectives='-', description='-', price=10, instructor=instructor,
+            collection=Collection.objects.create(title='Programming'), image='course/images/cover.jpg',
+            preview='course/lessons/videos/intro.mp4',
+        )
+        self.section = Section.objects.create(course=self.course, title='Part 1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lessons = [Lesson.objects.create(section=self.section, title=title, order=order * ORDER_GAP,
+                                                  file=f'course/lessons/files/{title}.pdf')
+                            for order, title in enumerate('ABC', start=1)]
+        self.progress = CourseProgress.objects.create(student=self.student, course=self.course)
+
+    def test_delete_reorder_and_create_in_one_batch(self):
+        a, b, c = self.lessons
+        set_lesson_completed(self.progress, b, True)
+        with self.captureOnCommitCallbacks(execute=True):
+            result = list(apply_lesson_batch(
+                self.section.pk, delete=[b.pk], order=[c.pk, a.pk],
+                create=[Lesson(title='D', file='course/lessons/files/D.pdf'),
+                        Lesson(title='E', file='course/lessons/files/E.mp4')],
+            ))
+
+        self.assertEqual([lesson.title for lesson in result], ['C', 'A', 'D', 'E'])
+        self.assertEqual([lesson.order for lesson in result], [ORDER_GAP * n for n in range(1, 5)])
+        # New lessons never reuse a bit, not even the deleted lesson's
+        self.assertEqual(sorted(lesson.progress_bit for lesson in result), [0, 2, 3, 4])
+        self.assertEqual(result[-1].media_status, Lesson.MEDIA_PENDING)
+        self.assertEqual(Section.objects.get(pk=self.section.pk).number_of_lessons, 4)
+        course = Course.objects.get(pk=self.course.pk)
+        self.assertEqual((course.lesson_count, course.next_progress_bit), (4, 5))
+
+        progress = CourseProgress.objects.get(pk=self.progress.pk)
+        self.assertFalse(has_bit(progress.completed_bits, b.progress_bit))
+        self.assertEqual((progress.completed_count, progress.progress), (0, 0.0))
+
+    def test_invalid_batches_change_nothing(self):
+        a, b, c = self.lessons
+        with self.assertRaises(LessonBatchError):
+            apply_lesson_batch(self.section.pk, delete=[b.pk], order=[a.pk])
+        with self.assertRaises(LessonBatchError):
+            apply_lesson_batch(self.section.pk, delete=[b.pk, 0])
+        with self.assertRaises(LessonBatchError):
+            apply_lesson_batch(self.section.pk, order=[a.pk, a.pk, c.pk])
+        self.assertEqual(list(Lesson.objects.filter(section=self.section).order_by('order').values_list('title', flat=True)),
+                         ['A', 'B', 'C'])
+        self.assertEqual(Course.objects.get(pk=self.course.pk).next_progress_bit, 3)
+
+
+class SparseOrderingTest(TestCase):
+    """Moves write one row between gapped keys and renumber the parent only once the gap is used up."""
+
+    def setUp(self):
+        instructor = User.objects.create(email='instructor@example.com', role='instructor',
+                                         first_name='Ada', last_name='Byron')
+        course = Course.objects.create(
+            title='Course', objectives='-', description='-', price=10, instructor=instructor,
+            collection=Collection.objects.create(title='Programming'), image='course/images/cover.jpg',
+            preview='course/lessons/videos/intro.mp4',
+        )
+        self.section = Section.objects.create(course=course, title='Part 1')
+        self.lessons = [Lesson.objects.create(section=self.section, title=title, order=order * ORDER_GAP,
+                                              file=f'course/lessons/files/{title}.pdf')
+                        for order, title in enumerate('ABCD', start=1)]
+        self.siblings = Lesson.objects.filter(section=self.section)
+
+    def titles(self):
+        return ''.join(self.siblings.order_by('order', 'id').values_list('title', flat=True))
+
+    def keys(self):
+        return dict(self.siblings.values_list('title', 'order'))
+
+    def test_move_writes_only_the_moved_row(self):
+        a, b, c, d = self.lessons
+        before = self.keys()
+        with CaptureQueriesContext(connection) as queries:
+            key = move(d, self.siblings, after=a.pk)
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in queries), 1)
+        self.assertEqual(key, (ORDER_GAP + 2 * ORDER_GAP) // 2)
+        self.assertEqual(self.titles(), 'ADBC')
+        self.assertEqual({title: order for title, order in self.keys().items() if title != 'D'},
+                         {title: order for title, order in before.items() if title != 'D'})
+
+        move(c, self.siblings, before=a.pk)
+        self.assertEqual(self.titles(), 'CADB')
+        move(c, self.siblings, after=b.pk)
+        self.assertEqual(self.titles(), 'ADBC')
+
+    def test_exhausted_gap_rebalances_the_parent(self):
+        a, b, c, d = self.lessons
+        Lesson.objects.filter(pk=b.pk).update(order=ORDER_GAP + 1)
+        self.assertEqual(crowded_parents(Lesson, 'section', 2), {self.section.pk})
+
+        move(d, self.siblings, after=a.pk)
+        self.assertEqual(self.titles(), 'ADBC')
+        keys = sorted(self.keys().values())
+        self.assertTrue(all(upper - lower >= 2 for lower, upper in zip(keys, keys[1:])))
+        # D sits halfway between A and B, so D, B and C take new keys
+        self.assertEqual(rebalance(self.siblings), 3)
+        self.assertEqual(sorted(self.keys().values()), [ORDER_GAP * n for n in range(1, 5)])
+        self.assertEqual(crowded_parents(Lesson, 'section', 2), set())
+
+    def test_moves_need_exactly_one_sibling_anchor(self):
+        a, b, c, d = self.lessons
+        with self.assertRaises(OrderingError):
+            move(a, self.siblings, before=b.pk, after=c.pk)
+        with self.assertRaises(OrderingError):
+            move(a, self.siblings)
+        with self.assertRaises(OrderingError):
+            move(a, self.siblings, after=a.pk)
+        self.assertEqual(self.titles(), 'ABCD')
+
+
+class CourseProgressTest(TestCase):
+    """Bitsets, counters and dashboard rollups stay in step through marks, unmarks, lesson adds and deletes."""
+
+    def setUp(self):
+        instructor = User.objects.create(email='instructor@example.com', role='instructor',
+                                         first_name='Ada', last_name='Byron')
+        self.course = Course.objects.create(
+            title='Course', objectives='-', description='-', price=10, instructor=instructor,
+            collection=Collection.objects.create(title='Programming'), image='course/images/cover.jpg',
+            preview='course/lessons/videos/intro.mp4',
+        )
+        self.section = Section.objects.create(course=self.course, title='Part 1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lessons = [self.add_lesson(title) for title in 'ABCD']
+        self.progress = [
+            CourseProgress.objects.create(student=User.objects.create(email=f'{name}@example.com', first_name=name,
+                                                                     last_name='Student'), course=self.course)
+            for name in ('alan', 'grace')
+        ]
+
+    def add_lesson(self, title):
+        order = (ord(title) - ord('A') + 1) * ORDER_GAP
+        return Lesson.objects.create(section=self.section, title=title, order=order,
+                                     file=f'course/lessons/files/{title}.pdf')
+
+    def mark(self, progress, lessons, completed=True):
+        return [set_lesson_completed(progress, lesson, completed) for lesson in lessons]
+
+    def state(self, progress):
+        progress.refresh_from_db()
+        return progress.completed_count, round(progress.progress, 2), progress.completed
+
+    def rollups(self, kind):
+        return dict(CourseProgressRollup.objects.filter(course=self.course, kind=kind, count__gt=0)
+                    .values_list('key', 'count'))
+
+    def assertRollupsMatchProgress(self):
+        stored = {(row.course_id, row.kind, row.key): row.count
+                  for row in CourseProgressRollup.objects.filter(count__gt=0)}
+        self.assertEqual(stored, {key: count for key, count in rebuild_rollups().items() if count})
+
+    def test_mark_and_unmark(self):
+        alan, grace = self.progress
+        a, b, c, d = self.lessons
+        self.assertEqual(self.mark(alan, [a, b]), [True, True])
+        self.assertEqual(self.mark(alan, [a]), [False])
+        self.assertEqual(self.state(alan), (2, 50.0, False))
+        self.assertEqual(popcount(alan.completed_bits), 2)
+        self.assertEqual(self.rollups(CourseProgressRollup.PROGRESS), {0: 1, 5: 1})
+
+        self.assertEqual(self.mark(alan, [b, c], completed=False), [True, False])
+        self.assertEqual(self.state(alan), (1, 25.0, False))
+        self.assertTrue(has_bit(alan.completed_bits, a.progress_bit))
+        self.assertFalse(has_bit(alan.completed_bits, b.progress_bit))
+        self.assertEqual(self.rollups(CourseProgressRollup.PROGRESS), {0: 1, 2: 1})
+        self.assertRollupsMatchProgress()
+
+    def test_completing_every_lesson_counts_the_days(self):
+        alan, grace = self.progress
+        self.mark(alan, self.lessons)
+        self.assertEqual(self.state(alan), (4, 100.0, True))
+        self.assertIsNotNone(alan.completed_at)
+        self.assertEqual(self.rollups(CourseProgressRollup.PROGRESS), {0: 1, 10: 1})
+        self.assertEqual(self.rollups(CourseProgressRollup.DAYS_TO_COMPLETE), {0: 1})
+        self.assertRollupsMatchProgress()
+
+    def test_deleting_a_completed_lesson_clears_its_bit_and_rescales(self):
+        alan, grace = self.progress
+        a, b, c, d = self.lessons
+        self.mark(alan, [a, b])
+        self.mark(grace, [b])
+        with self.captureOnCommitCallbacks(execute=True):
+            b.delete()
+
+        self.assertEqual(Course.objects.get(pk=self.course.pk).lesson_count, 3)
+        self.assertEqual(self.state(alan), (1, 33.33, False))
+        self.assertFalse(has_bit(alan.completed_bits, b.progress_bit))
+        self.assertEqual(self.state(grace), (0, 0.0, False))
+        self.assertEqual(bytes(grace.completed_bits), b'')
+        self.assertRollupsMatchProgress()
+
+        # The remaining lessons complete the course
+        self.mark(alan, [c, d])
+        self.assertEqual(self.state(alan), (3, 100.0, True))
+        self.assertRollupsMatchProgress()
+
+    def test_adding_a_lesson_reopens_a_completed_course(self):
+        alan, grace = self.progress
+        self.mark(alan, self.lessons)
+        self.mark(grace, self.lessons[:2])
+        self.assertEqual(self.rollups(CourseProgressRollup.DAYS_TO_COMPLETE), {0: 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            e = self.add_lesson('E')
+        self.assertEqual(Course.objects.get(pk=self.course.pk).lesson_count, 5)
+        self.assertEqual(self.state(alan), (4, 80.0, False))
+        self.assertIsNone(alan.completed_at)
+        self.assertEqual(self.state(grace), (2, 40.0, False))
+        self.assertEqual(self.rollups(CourseProgressRollup.DAYS_TO_COMPLETE), {})
+        self.assertEqual(self.rollups(CourseProgressRollup.PROGRESS), {4: 1, 8: 1})
+        self.assertRollupsMatchProgress()
+
+        self.mark(alan, [e])
+        self.assertEqual(self.state(alan), (5, 100.0, True))
+        self.assertEqual(self.rollups(CourseProgressRollup.DAYS_TO_COMPLETE), {0: 1})
+        self.assertRollupsMatchProgress()
+
+
+class GradingTest(TestCase):
+    """Resubmitting a quiz updates the student's one score and moves the section rollups by the difference."""
+
+    def setUp(self):
+        instructor = User.objects.create(email='instructor@example.com', role='instructor',
+                                         first_name='Ada', last_name='Byron')
+        self.student = User.objects.create(email='student@example.com', first_name='Alan', last_name='Turing')
+        course = Course.objects.create(
+            title='Course', objectives='-', description='-', price=10, instructor=instructor,
+            collection=Collection.objects.create(title='Programming'), image='course/images/cover.jpg',
+            preview='course/lessons/videos/intro.mp4',
+        )
+        self.section = Section.objects.create(course=course, title='Part 1')
+        self.options = []
+        for number in range(2):
+            question = Question.objects.create(section=self.section, text=f'Question {number}')
+            self.options.append((Option.objects.create(question=question, text='Right', is_correct=True),
+                                 Option.objects.create(question=question, text='Wrong')))
+
+    def submit(self, *picks):
+        return grade_submission(self.student, self.section, [
+            {'question_id': right.question_id, 'option_id': (right if pick else wrong).pk}
+            for (right, wrong), pick in zip(self.options, picks)
+        ])
+
+    def rollups(self):
+        return dict(CourseProgressRollup.objects.filter(key=self.section.pk).values_list('kind', 'count'))
+
+    def test_resubmissions_count_one_attempt_and_move_the_pass(self):
+        score, correct, total = self.submit(True, False)
+        self.assertEqual((score.score, score.completed, correct, total), (50.0, False, 1, 2))
+        self.assertEqual(self.rollups(), {CourseProgressRollup.SECTION_ATTEMPTED: 1})
+
+        score, correct, total = self.submit(True, True)
+        self.assertTrue(score.completed)
+        self.assertEqual(self.rollups(), {CourseProgressRollup.SECTION_ATTEMPTED: 1, CourseProgressRollup.SECTION_PASSED: 1})
+
+        self.submit(True, True)
+        self.submit(False, True)
+        self.assertEqual(StudentScore.objects.filter(student=self.student, section=self.section).count(), 1)
+        self.assertEqual(self.rollups(), {CourseProgressRollup.SECTION_ATTEMPTED: 1, CourseProgressRollup.SECTION_PASSED: 0})
+        sections = (CourseProgressRollup.SECTION_ATTEMPTED, CourseProgressRollup.SECTION_PASSED)
+        rebuilt = {kind: count for (_, kind, key), count in rebuild_rollups().items() if kind in sections and count}
+        self.assertEqual(rebuilt, {CourseProgressRollup.SECTION_ATTEMPTED: 1})
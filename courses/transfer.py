@@ -0,0 +1,259 @@
+import json
+from collections import Counter, defaultdict
+from datetime import timedelta
+from uuid import uuid4
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import DataError, IntegrityError, connection, transaction
+from django.db.models import Count, Sum
+from .cache import bump_generation, CATALOG
+from .facets import apply_facet_changes, course_facet_values
+from .models import Collection, Course, CourseSearchTerm, Lesson, Option, Question, Section
+from .ordering import ORDER_GAP
+from .search import build_terms
+
+
+# Course tree format, one JSON document per line (NDJSON):
+# {<COURSE_FIELDS>, "instructor": email, "collection": title,
+#  "sections": [{<SECTION_FIELDS>, "lessons": [{<LESSON_FIELDS>}],
+#                "questions": [{"text": ..., "options": [{"text": ..., "is_correct": ...}]}]}]}
+COURSE_FIELDS = ['title', 'slug', 'objectives', 'description', 'courseFor', 'price', 'oldPrice', 'currency',
+                 'syllabus', 'prerequisites', 'is_active', 'level', 'image', 'preview']
+SECTION_FIELDS = ['title', 'locked', 'default', 'order']
+LESSON_FIELDS = ['title', 'order', 'file', 'is_active', 'duration']
+
+EXPORT_BATCH_SIZE = 100
+
+
+class CourseImportError(ValueError):
+    pass
+
+
+def _course_document(course, sections, lessons, questions, options):
+    document = {field: getattr(course, field) for field in COURSE_FIELDS}
+    document.update({
+        'price': str(course.price),
+        'oldPrice': str(course.oldPrice) if course.oldPrice is not None else None,
+        'image': course.image.name,
+        'preview': course.preview.name,
+        'instructor': course.instructor.email,
+        'collection': course.collection.title,
+        'sections': [],
+    })
+    for section in sections.get(course.pk, []):
+        document['sections'].append(dict(
+            {field: section[field] for field in SECTION_FIELDS},
+            lessons=[{field: lesson[field] for field in LESSON_FIELDS} for lesson in lessons.get(section['id'], [])],
+            questions=[
+                {'text': question['text'], 'options': options.get(question['id'], [])}
+                for question in questions.get(section['id'], [])
+            ],
+        ))
+    return document
+
+
+def export_courses(queryset=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yield one NDJSON line per course tree. Courses are walked by primary key in batches,
+    and each batch costs five queries however many sections, lessons and questions it has.
+    """
+    queryset = (queryset if queryset is not None else Course.objects.all()) \
+        .select_related('instructor', 'collection').order_by('pk')
+    last_pk = 0
+    while True:
+        courses = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not courses:
+            return
+        course_ids = [course.pk for course in courses]
+
+        sections = defaultdict(list)
+        for section in Section.objects.filter(course_id__in=course_ids).order_by('order', 'id').values('id', 'course_id', *SECTION_FIELDS):
+            sections[section['course_id']].append(section)
+        lessons = defaultdict(list)
+        for lesson in Lesson.objects.filter(section__course_id__in=course_ids).order_by('order', 'id') \
+                .values('section_id', *LESSON_FIELDS):
+            lessons[lesson['section_id']].append(lesson)
+        questions = defaultdict(list)
+        for question in Question.objects.filter(section__course_id__in=course_ids).order_by('id').values('id', 'section_id', 'text'):
+            questions[question['section_id']].append(question)
+        options = defaultdict(list)
+        for option in Option.objects.filter(question__section__course_id__in=course_ids).order_by('id') \
+                .values('question_id', 'text', 'is_correct'):
+            options[option['question_id']].append({'text': option['text'], 'is_correct': option['is_correct']})
+
+        for course in courses:
+            yield json.dumps(_course_document(course, sections, lessons, questions, options)) + '\n'
+        last_pk = course_ids[-1]
+
+
+def _bulk_create(model, objects, parent_field):
+    """
+    bulk_create `objects` and make sure they have primary keys afterwards. Backends that can't
+    return ids from a bulk insert (MySQL) get them back by re-reading the new children of each
+    parent in id order, which matches insertion order because every parent here is brand new.
+    """
+    model.objects.bulk_create(objects)
+    if not objects or objects[0].pk is not None:
+        return objects
+    by_parent = defaultdict(list)
+    for obj in objects:
+        by_parent[getattr(obj, parent_field)].append(obj)
+    ids = model.objects.filter(**{f'{parent_field}__in': list(by_parent)}).order_by('id').values_list(parent_field, 'id')
+    position = defaultdict(int)
+    for parent_id, pk in ids:
+        by_parent[parent_id][position[parent_id]].pk = pk
+        position[parent_id] += 1
+    return objects
+
+
+def _import_batch(documents, instructors, collections):
+    courses = []
+    for document in documents:
+        course = Course(**{field: document[field] for field in COURSE_FIELDS if field in document})
+        course.instructor_id = instructors[document['instructor']]
+        course.collection_id = collections[document['collection']]
+        courses.append(course)
+    if connection.features.can_return_rows_from_bulk_insert:
+        Course.objects.bulk_create(courses)
+    else:
+        # MySQL returns no ids: insert under previews unique to this batch, read the ids back by
+        # them, then restore the real previews. Matching on the imported previews could pick up
+        # a course that already existed.
+        marker, previews = uuid4().hex, [course.preview.name for course in courses]
+        for number, course in enumerate(courses):
+            course.preview = f'import-{marker}/{number}'
+        Course.objects.bulk_create(courses)
+        pks = dict(Course.objects.filter(preview__startswith=f'import-{marker}/').values_list('preview', 'pk'))
+        for course, preview in zip(courses, previews):
+            course.pk = pks[course.preview.name]
+            course.preview = preview
+        Course.objects.bulk_update(courses, ['preview'])
+
+    sections, section_documents = [], []
+    for course, document in zip(courses, documents):
+        for position, section_document in enumerate(document.get('sections', []), start=1):
+            section_fields = {field: section_document[field] for field in SECTION_FIELDS if field in section_document}
+            # Documents without keys (older exports) keep their listed order
+            section_fields.setdefault('order', position * ORDER_GAP)
+            sections.append(Section(course_id=course.pk, **section_fields))
+            section_documents.append(section_document)
+    _bulk_create(Section, sections, 'course_id')
+
+    lessons, questions, question_documents = [], [], []
+    progress_bits = Counter()  # The courses are new, so their lessons take bits 0..n-1
+    for section, section_document in zip(sections, section_documents):
+        for order, lesson_document in enumerate(section_document.get('lessons', []), start=1):
+            lesson_fields = {field: lesson_document[field] for field in LESSON_FIELDS if field in lesson_document}
+            lesson_fields.setdefault('order', order * ORDER_GAP)
+            lesson = Lesson(section_id=section.pk, progress_bit=progress_bits[section.course_id], **lesson_fields)
+            # Videos without a duration are queued for the probe worker, as save() would
+            lesson.prepare_media()
+            lessons.append(lesson)
+            progress_bits[section.course_id] += 1
+        for question_document in section_document.get('questions', []):
+            questions.append(Question(section_id=section.pk, text=question_document['text']))
+            question_documents.append(question_document)
+    Lesson.objects.bulk_create(lessons, batch_size=1000)
+    _bulk_create(Question, questions, 'section_id')
+    Option.objects.bulk_create([
+        Option(question_id=question.pk, text=option['text'], is_correct=option.get('is_correct', False))
+        for question, question_document in zip(questions, question_documents)
+        for option in question_document.get('options', [])
+    ], batch_size=1000)
+
+    recompute_course_metrics(courses)
+    return len(courses), len(lessons)
+
+
+def recompute_course_metrics(courses):
+    """One aggregate pass over the imported courses: lesson counters, durations, search postings and facets."""
+    course_ids = [course.pk for course in courses]
+    totals = {
+        row['section']: row
+        for row in Lesson.objects.filter(section__course_id__in=course_ids).values('section')
+        .annotate(lesson_count=Count('id'), seconds=Sum('duration')).order_by()
+    }
+    sections = list(Section.objects.filter(course_id__in=course_ids).only('id', 'course_id'))
+    course_durations, course_lessons = defaultdict(timedelta), Counter()
+    for section in sections:
+        row = totals.get(section.pk, {})
+        section.number_of_lessons = row.get('lesson_count', 0)
+        section.total_duration = timedelta(seconds=row.get('seconds') or 0)
+        course_durations[section.course_id] += section.total_duration
+        course_lessons[section.course_id] += section.number_of_lessons
+    Section.objects.bulk_update(sections, ['number_of_lessons', 'total_duration'], batch_size=1000)
+
+    for course in courses:
+        course.total_duration = course_durations[course.pk]
+        course.lesson_count = course.next_progress_bit = course_lessons[course.pk]
+    Course.objects.bulk_update(courses, ['total_duration', 'lesson_count', 'next_progress_bit'], batch_size=1000)
+
+    CourseSearchTerm.objects.bulk_create([
+        CourseSearchTerm(course_id=course.pk, term=term, weight=weight)
+        for course in courses for term, weight in build_terms(course).items()
+    ], batch_size=2000)
+
+    facets = Counter()
+    for course in courses:
+        facets.update(course_facet_values(course))
+    apply_facet_changes(facets)
+
+
+def import_courses(lines, batch_size=50):
+    """
+    Import NDJSON course trees from an iterable of lines, `batch_size` courses per transaction.
+    Instructors are matched by email and must exist; collections are matched by title and
+    created when missing. Returns (courses, lessons) imported. A batch that can't be stored
+    (duplicate previews or lesson files, bad field values) raises CourseImportError naming its
+    lines; the batches before it stay imported.
+    """
+    User = get_user_model()
+    instructors, collections = {}, {}
+    imported_courses = imported_lessons = 0
+
+    def flush(documents):
+        lines = f'Line {first_line}' if first_line == number else f'Lines {first_line}-{number}'
+        try:
+            with transaction.atomic():
+                emails = {document['instructor'] for document in documents} - set(instructors)
+                instructors.update(User.objects.filter(email__in=emails).values_list('email', 'id'))
+                missing = emails - set(instructors)
+                if missing:
+                    raise CourseImportError(f'{lines}: unknown instructor(s): {", ".join(sorted(missing))}')
+                for title in {document['collection'] for document in documents} - set(collections):
+                    collections[title] = Collection.objects.get_or_create(title=title)[0].pk
+                return _import_batch(documents, instructors, collections)
+        except CourseImportError:
+            raise
+        except (IntegrityError, DataError, ValidationError, ValueError, KeyError, TypeError) as e:
+            raise CourseImportError(f'{lines}: missing {e}' if isinstance(e, KeyError) else f'{lines}: {e}')
+
+    documents, first_line = [], None
+    for number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            document = json.loads(line)
+        except ValueError as e:
+            raise CourseImportError(f'Line {number}: invalid JSON ({e})')
+        for key in ('title', 'instructor', 'collection', 'preview'):
+            if key not in document:
+                raise CourseImportError(f'Line {number}: missing "{key}"')
+        if not documents:
+            first_line = number
+        documents.append(document)
+        if len(documents) >= batch_size:
+            courses, lessons = flush(documents)
+            imported_courses += courses
+            imported_lessons += lessons
+            documents = []
+    if documents:
+        courses, lessons = flush(documents)
+        imported_courses += courses
+        imported_lessons += lessons
+
+    if imported_courses:
+        bump_generation(CATALOG)
+    return imported_courses, imported_lessons
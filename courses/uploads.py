@@ -0,0 +1,282 @@
+import io
+import os
+from bisect import bisect_right
+from itertools import accumulate
+from uuid import uuid4
+from django.conf import settings
+from django.core import signing
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Course, Lesson, Section, UploadSession
+from .lessons import lock_section, next_lesson_order
+
+
+# Resumable upload protocol:
+#   1. POST   /uploads/                  {filename, size, and lesson | section + title | course}
+#   2. PUT    /uploads/<id>/chunk/       raw bytes, header Upload-Offset = bytes already received
+#   3. GET    /uploads/<id>/             current offset, to resume after a dropped connection
+#   4. POST   /uploads/<id>/complete/    assemble the chunks into Lesson.file / Course.preview
+# Chunks are stored in the default storage (so any web worker can take any chunk) and streamed
+# back in order on completion, so memory use is bounded by UPLOAD_CHUNK_SIZE throughout.
+#
+# Direct uploads skip Django entirely for the bytes:
+#   1. POST   /direct-uploads/           {filename, content_type, size, and lesson | section + title | course + field}
+#                                        -> a presigned target from the storage (see courses/storage.py) and a token
+#   2. the client sends the file to that target
+#   3. POST   /direct-uploads/complete/  {token}: check the stored object, then attach it to the model
+
+DIRECT_UPLOAD_SALT = 'courses.uploads.direct'
+
+
+class UploadError(Exception):
+    pass
+
+
+class UploadOffsetError(UploadError):
+    def __init__(self, offset):
+        super().__init__(f'Expected Upload-Offset {offset}.')
+        self.offset = offset
+
+
+def _chunk_name(session, offset):
+    return f'upload-sessions/{session.pk}/{offset:020d}'
+
+
+def store_chunk(session_id, offset, data):
+    """Append `data` at `offset`; a retried or out-of-order chunk raises UploadOffsetError with the offset to resume from."""
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session_id)
+        if session.status != UploadSession.STATUS_OPEN:
+            raise UploadError('This upload is already complete.')
+        if offset != session.offset:
+            raise UploadOffsetError(session.offset)
+        if not data:
+            raise UploadError('Empty chunk.')
+        if len(data) > settings.UPLOAD_CHUNK_SIZE:
+            raise UploadError(f'Chunks may be at most {settings.UPLOAD_CHUNK_SIZE} bytes.')
+        if offset + len(data) > session.size:
+            raise UploadError('Chunk runs past the declared upload size.')
+
+        session.chunks.append(default_storage.save(_chunk_name(session, offset), ContentFile(data)))
+        session.offset += len(data)
+        session.save(update_fields=['chunks', 'offset', 'updated_at'])
+    return session
+
+
+class ChunkReader(io.RawIOBase):
+    """Read-only stream over the stored chunks of a session, opening one chunk at a time."""
+
+    def __init__(self, names, size):
+        self.names = names
+        self.size = size
+        self.starts = None
+        self.seek(0)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        # Uploaders rewind, and S3 transfers also seek to the end to size the stream; neither reads a chunk
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        elif whence != io.SEEK_SET:
+            raise ValueError(f'Invalid whence {whence}')
+        if offset < 0:
+            raise ValueError('Negative seek position')
+        self.close_current()
+        self.position = offset
+        if offset == 0:
+            self.index = 0
+        elif offset >= self.size:
+            self.index = len(self.names)
+        else:
+            # Anywhere in between: find the chunk from the stored chunk sizes, looked up once
+            if self.starts is None:
+                self.starts = list(accumulate((default_storage.size(name) for name in self.names), initial=0))
+            self.index = bisect_right(self.starts, offset) - 1
+            self.current = default_storage.open(self.names[self.index], 'rb')
+            self.current.seek(offset - self.starts[self.index])
+        return offset
+
+    def tell(self):
+        return self.position
+
+    def close_current(self):
+        if getattr(self, 'current', None) is not None:
+            self.current.close()
+        self.current = None
+
+    def readinto(self, buffer):
+        # Fill the whole buffer across chunk boundaries: S3 transfers take each read(part_size) as one part
+        filled = 0
+        while filled < len(buffer) and self.index < len(self.names):
+            if self.current is None:
+                self.current = default_storage.open(self.names[self.index], 'rb')
+            data = self.current.read(len(buffer) - filled)
+            if data:
+                buffer[filled:filled + len(data)] = data
+                filled += len(data)
+                self.position += len(data)
+                continue
+            self.close_current()
+            self.index += 1
+        return filled
+
+    def close(self):
+        self.close_current()
+        super().close()
+
+
+def _new_lesson(section, title):
+    # Called inside the completing transaction; the section lock holds until it commits
+    section = lock_section(section.pk)
+    Section.objects.filter(pk=section.pk).update(number_of_lessons=F('number_of_lessons') + 1)
+    return Lesson(section=section, title=title, order=next_lesson_order(section))
+
+
+def _check_complete(session):
+    if session.status != UploadSession.STATUS_OPEN:
+        raise UploadError('This upload is already complete.')
+    if session.offset != session.size:
+        raise UploadError(f'Only {session.offset} of {session.size} bytes have been received.')
+
+
+def complete_upload(session_id):
+    """
+    Attach the assembled upload to its target: replace the lesson's file, create the lesson in the
+    section, or replace the course preview. Returns the session, with `lesson` set for new lessons.
+    """
+    session = UploadSession.objects.select_related('lesson', 'section', 'course').get(pk=session_id)
+    _check_complete(session)
+
+    # Copy the chunks to the file's final name before taking any lock: a multi-GB copy to storage
+    # must not hold the session or section rows. A concurrent completion that loses the race below
+    # deletes its copy.
+    if session.course_id:
+        field, instance = Course._meta.get_field('preview'), session.course
+    else:
+        field = Lesson._meta.get_field('file')
+        instance = session.lesson or Lesson(section=session.section, title=session.title)
+    with File(ChunkReader(session.chunks, session.size), name=session.filename) as upload:
+        name = field.storage.save(field.generate_filename(instance, session.filename), upload,
+                                  max_length=field.max_length)
+
+    try:
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().select_related('lesson', 'section', 'course') \
+                .get(pk=session_id)
+            _check_complete(session)
+            if session.course_id:
+                course = session.course
+                course.preview = name
+                course.save(update_fields=['preview', 'last_update'])
+            else:
+                if session.lesson_id:
+                    lesson = session.lesson
+                else:
+                    lesson = session.lesson = _new_lesson(session.section, session.title)
+                lesson.file = name
+                lesson.duration = 0  # Queue the new file for the probe worker
+                lesson.save()
+
+            session.status = UploadSession.STATUS_COMPLETE
+            session.save(update_fields=['status', 'lesson', 'updated_at'])
+            chunks = list(session.chunks)
+            transaction.on_commit(lambda: [default_storage.delete(chunk) for chunk in chunks])
+    except Exception:
+        field.storage.delete(name)
+        raise
+    return session
+
+
+def discard_upload(session):
+    for name in session.chunks:
+        default_storage.delete(name)
+    session.delete()
+
+
+def clear_stale_sessions(max_age=None):
+    """Delete unfinished sessions (and their chunks) idle for longer than UPLOAD_SESSION_MAX_AGE."""
+    cutoff = timezone.now() - (max_age or settings.UPLOAD_SESSION_MAX_AGE)
+    sessions = UploadSession.objects.filter(status=UploadSession.STATUS_OPEN, updated_at__lt=cutoff)
+    count = 0
+    for session in sessions.iterator():
+        discard_upload(session)
+        count += 1
+    return count
+
+
+def issue_direct_upload(data, user):
+    """Reserve a storage name for a validated DirectUploadSerializer payload and presign an upload target for it."""
+    field = data['model_field']
+    target = data[data['target']]
+    if not hasattr(field.storage, 'presign_upload'):
+        raise UploadError('The configured storage does not support direct uploads.')
+
+    # A random suffix instead of get_available_name(): no existence check, and no two targets share a name
+    root, extension = os.path.splitext(field.generate_filename(target, data['filename']))
+    name = f'{root}_{uuid4().hex[:12]}{extension}'
+    upload = field.storage.presign_upload(name, data['content_type'], data['size'], settings.DIRECT_UPLOAD_EXPIRES)
+    token = signing.dumps({
+        'user': user.pk, 'name': name, 'size': data['size'], 'target': data['target'], 'pk': target.pk,
+        'field': field.name, 'title': data.get('title', ''),
+    }, salt=DIRECT_UPLOAD_SALT)
+    return {'upload': upload, 'name': name, 'token': token}
+
+
+def complete_direct_upload(token, user):
+    """
+    Check the object a direct upload put in storage (present, declared size, a real image for image
+    fields) and attach it. Returns the Lesson or Course it was attached to; completing twice is harmless.
+    """
+    try:
+        claim = signing.loads(token, salt=DIRECT_UPLOAD_SALT, max_age=settings.DIRECT_UPLOAD_EXPIRES * 2)
+    except signing.BadSignature:
+        raise UploadError('Invalid or expired upload token.')
+    if claim['user'] != user.pk:
+        raise UploadError('This upload belongs to another user.')
+
+    model = Course if claim['target'] == 'course' else Lesson
+    field = model._meta.get_field(claim['field'])
+    name = claim['name']
+    if not field.storage.exists(name):
+        raise UploadError('The file has not been uploaded yet.')
+    if field.storage.size(name) != claim['size']:
+        raise UploadError('The uploaded file does not match the declared size.')
+    if isinstance(field, models.ImageField):
+        from PIL import Image
+        try:
+            with field.storage.open(name, 'rb') as f:
+                Image.open(f).verify()
+        except Exception:
+            field.storage.delete(name)
+            raise UploadError('The uploaded file is not a valid image.')
+
+    with transaction.atomic():
+        if claim['target'] == 'course':
+            course = Course.objects.select_for_update().get(pk=claim['pk'])
+            if getattr(course, field.name).name != name:
+                setattr(course, field.name, name)
+                course.save(update_fields=[field.name, 'last_update'])
+            return course
+
+        lesson = Lesson.objects.filter(file=name).first()
+        if lesson:
+            return lesson
+        if claim['target'] == 'lesson':
+            lesson = Lesson.objects.select_for_update().get(pk=claim['pk'])
+        else:
+            lesson = _new_lesson(Section.objects.get(pk=claim['pk']), claim['title'])
+        lesson.file = name
+        lesson.duration = 0  # Queue the new file for the probe worker
+        lesson.save()
+        return lesson
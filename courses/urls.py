@@ -23,6 +23,9 @@ router.register('faqs', views.FAQViewSet)
 router.register('purchased_course', views.FullCourseViewSet, basename='purchased-courses')
 router.register('payment_description', views.DescriptionViewSet)
 router.register('payment_snapshot', views.PaymentStatusViewSet)
+router.register('uploads', views.UploadSessionViewSet, basename='uploads')
+router.register('direct-uploads', views.DirectUploadViewSet, basename='direct-uploads')
+router.register('heartbeats', views.HeartbeatViewSet, basename='heartbeats')
 
 # Nested routers for Course-related models
 course_router = routers.NestedDefaultRouter(router, r'courses', lookup='course')
@@ -56,6 +59,10 @@ urlpatterns = [
     path('', include(purchased_course_router.urls)),
     path('', include(purchased_section_router.urls)),
     path('social-media-links/', views.SocialMediaLinksView.as_view(), name='social-media-links'),
+    path('media/<str:token>/', views.LessonMediaView.as_view(), name='lesson-media'),
+    path('media/<str:token>/hls/<path:path>', views.LessonHlsView.as_view(), name='lesson-hls'),
+    path('direct-uploads/receive/<str:token>/', views.DirectUploadReceiveView.as_view(), name='direct-upload-receive'),
+    path('admin/course-transfer/', views.CourseTransferView.as_view(), name='course-transfer'),
     path('instructors/<int:instructor_pk>/earnings/', views.InstructorEarningsViewSet.as_view({'get': 'list'})),
     path('courses/<int:course_pk>/sections/<int:section_pk>/questions/<int:pk>/answer/', views.QuestionViewSet.as_view({'post': 'question_answer'}), name='question-answer'),
 ]
@@ -1,30 +1,50 @@
 from django.db.utils import IntegrityError
 from django.db import transaction
+from django.db.models import F
 from django.db.models.aggregates import Count
 from django.conf import settings
 from django.urls import reverse
+from django.core import signing
+from django.core.files.storage import default_storage
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse, HttpResponseRedirect
-from rest_framework import viewsets, status, serializers
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from rest_framework import viewsets, mixins, status, serializers
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAdminUser
 from rest_framework.permissions import IsAdminUser, IsAuthenticated, SAFE_METHODS, AllowAny
 from .models import Course, Collection, SectionAttempt, Promotion, PaymentStatus, Customer, Description, Review, CourseProgress, Lesson, \
-    Order, OrderItem, Option, StudentAnswer, StudentScore, Cart, CartItem, Rating, WishList, WishListItem, Section, Question, \
-    CompanyOverview, Mission, Vission, Testimonial, FAQ
+    Order, OrderItem, StudentAnswer, StudentScore, Cart, CartItem, Rating, WishList, WishListItem, Section, Question, \
+    CompanyOverview, Mission, Vission, Testimonial, FAQ, UploadSession
 from .serializers import CourseSerializer, SocialMediaLinksSerializer, CourseDetailSerializer, CollectionSerializer, PromotionSerializer, \
     InstructorEarningsSerializer, RatingSerializer, DescriptionSerializer, ReviewSerializer, CourseProgressSerializer,CustomerSerializer, \
     InstructorEarnings, LessonSerializer, OrderSerializer, OrderItemSerializer, CartSerializer, CartItemSerializer, \
     WishListItemSerializer, WishListItemSerializer,  PaymentStatusSerializer, WishListSerializer, SectionSerializer, \
     QuestionSerializer, OptionSerializer, CoreValue, StudentAnswerSerializer, CompanyOverviewSerializer, \
-    MissionSerializer, VissionSerializer, CoreValueSerializer, StaffMember, TestimonialSerializer, FAQSerializer, StaffMemberSerializer
+    MissionSerializer, VissionSerializer, CoreValueSerializer, StaffMember, TestimonialSerializer, FAQSerializer, StaffMemberSerializer, \
+    DynamicFieldsMixin, UploadSessionSerializer, DirectUploadSerializer, LessonBatchSerializer, MoveSerializer, \
+    HeartbeatSerializer
 from .permissions import IsAdminOrReadOnly, ViewCustomerHistoryPermission, IsInstructor, \
     IsStudentOrInstructor, IsInstructorOwner, IsInstructorOrReadOnly, IsStudentOrAdmin, IsInstructorOrAdmin, IsStudentAndPurchasedCourse, IsPreviousSectionCompleted
-from .pagination import DefaultPagination
+from .pagination import KeysetPagination
+from .search import search_course_ids
+from .outline import get_outline
+from .facets import filter_courses, get_facet_counts
+from .transfer import export_courses, import_courses, CourseImportError
+from .streaming import media_token, read_media_token, serve_file
+from .lessons import LessonBatchError, apply_lesson_batch, lock_section, next_lesson_order
+from .progress import set_lesson_completed
+from .watch import record as record_heartbeats, watchable_lessons
+from .dashboard import course_dashboard
+from .grading import GradingError, UnknownAnswerError, grade_submission
+from .ordering import OrderingError, append_key, move as move_between
+from .hls import rewrite_playlist
+from .uploads import store_chunk, complete_upload, discard_upload, issue_direct_upload, complete_direct_upload, \
+    UploadError, UploadOffsetError
+from .cache import CachedReadMixin, cached_response, conditional_course_response, bump_generation, CATALOG, SITE_CONTENT
 from uuid import uuid4
 
 import boto3
@@ -37,20 +57,54 @@ import requests
 import io
 
 
+class SparseFieldsMixin:
+    """
+    Read requests accept ?fields=a,b to return (and SELECT) only those fields and
+    ?expand=x,y to nest the relations in the serializer's Meta.expandable_fields.
+    """
+    def get_sparse_params(self):
+        if self.request.method not in SAFE_METHODS:
+            return None, []
+        fields = [name for name in self.request.query_params.get('fields', '').split(',') if name]
+        expand = [name for name in self.request.query_params.get('expand', '').split(',') if name]
+        return fields or None, expand
+
+    def get_serializer(self, *args, **kwargs):
+        if issubclass(self.get_serializer_class(), DynamicFieldsMixin):
+            fields, expand = self.get_sparse_params()
+            kwargs.setdefault('fields', fields)
+            kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+        if self.request.method in SAFE_METHODS and issubclass(serializer_class, DynamicFieldsMixin):
+            fields, expand = self.get_sparse_params()
+            queryset = serializer_class.setup_queryset(queryset, fields, expand)
+        return queryset
+
+
 class CustomerViewSet(viewsets.ModelViewSet):
     pass
 
-class CourseViewSet(viewsets.ModelViewSet):
-    queryset = Course.objects.select_related('instructor', 'collection').all().order_by('id')
+class CourseViewSet(CachedReadMixin, SparseFieldsMixin, viewsets.ModelViewSet):
+    queryset = Course.objects.all()
     serializer_class = CourseSerializer
-    pagination_class = DefaultPagination
+    pagination_class = KeysetPagination
     search_fields = ['title']
+    ordering = 'id'
     ordering_fields = ['price', 'last_update', 'id']
     http_method_names = ['get', 'post', 'delete', 'put', 'patch'] # CRUD
 
     def get_serializer_context(self):
         return {'request': self.request}
 
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return CourseDetailSerializer
+        return CourseSerializer
+
     def destroy(self, request, *args, **kwargs):
         if OrderItem.objects.filter(course_id=kwargs['pk']).exists():
             return Response({'error': 'course cannot be deleted because it is associated with an order item.'}, 
@@ -60,25 +114,30 @@ class CourseViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(instructor=self.request.user)
 
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_course_response(
+            request, self.get_queryset().filter(pk=kwargs['pk']),
+            lambda: super(CourseViewSet, self).retrieve(request, *args, **kwargs)
+        )
+
     def get_queryset(self):
         queryset = super().get_queryset()
-        ordering = self.request.query_params.get('ordering', None)      
-        
+
         if self.request.user.is_authenticated:
             if self.request.user.role == "instructor":
                 return queryset.filter(instructor=self.request.user)
         # For anonymous user, all active courses
+        # Ordering (?ordering=) is validated and applied by KeysetPagination
         queryset = queryset.filter(is_active=True)
-    
-        if ordering:
-            try:
-                queryset = queryset.order_by(ordering)
-            except TypeError as e:
-                print(f"TypeError: {e}")
-                # Handle the error or provide a default ordering
-                queryset = queryset.order_by('id')
+        if self.action == 'list':
+            queryset = filter_courses(queryset, self.request.query_params)
         return queryset
 
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        # Per-value course counts for the catalog filters, read from the precomputed facet table
+        return cached_response(CATALOG, request, lambda: Response(get_facet_counts()))
+
 
     @action(detail=True, methods=['get'], permission_classes=[IsInstructorOrAdmin])
     def statistics(self, request, pk=None):
@@ -91,25 +150,67 @@ class CourseViewSet(viewsets.ModelViewSet):
         }
         return Response(data)
 
+    @action(detail=True, methods=['get'])
+    def dashboard(self, request, pk=None):
+        # Cohort progress for the course's instructor, read from the rollups (courses/dashboard.py)
+        course = self.get_object()
+        if course.instructor_id != request.user.id and not request.user.is_staff:
+            return Response({'error': 'Only the course instructor can view its dashboard.'}, status=status.HTTP_403_FORBIDDEN)
+        return Response(course_dashboard(course))
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        # Ranked full-text search over the course search index: ?q=<terms>&limit=<n>
+        return cached_response(CATALOG, request, lambda: self._search(request))
+
+    def _search(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'The q parameter is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 30)), 1), 100)
+        except ValueError:
+            return Response({'error': 'limit must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        ranked = search_course_ids(query, limit=limit)
+        fields, expand = self.get_sparse_params()
+        courses = CourseSerializer.setup_queryset(Course.objects.all(), fields, expand) \
+            .in_bulk([course_id for course_id, score in ranked])
+        results = []
+        for course_id, score in ranked:
+            if course_id in courses:
+                data = CourseSerializer(
+                    courses[course_id], context=self.get_serializer_context(), fields=fields, expand=expand
+                ).data
+                data['score'] = round(score, 4)
+                results.append(data)
+        return Response({'count': len(results), 'results': results})
 
     def get_permissions(self):
         if self.action == 'destroy':
             self.permission_classes = [IsInstructorOrAdmin]
-        elif self.action == 'retrieve' or self.action  == 'list':
+        elif self.action in ['retrieve', 'list', 'search', 'facets']:
             self.permission_classes = [AllowAny]
         elif self.action == 'create':
             self.permission_classes = [IsInstructorOrReadOnly]
         elif self.action == 'update':
             self.permission_classes = [IsInstructor]
+        elif self.action == 'dashboard':
+            self.permission_classes = [IsInstructorOrAdmin]
         else:
             self.permission_classes = []
         return super().get_permissions()
 
 
-class FullCourseViewSet(viewsets.ReadOnlyModelViewSet):
+class FullCourseViewSet(SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = CourseSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return CourseDetailSerializer
+        return CourseSerializer
+
     def get_queryset(self):
         user = self.request.user
         purchased_course_ids = OrderItem.objects.filter(
@@ -122,24 +223,46 @@ class FullCourseViewSet(viewsets.ReadOnlyModelViewSet):
     def get_rating(self, request, pk=None):
         course = self.get_object()
         return Response({
-            'average_rating': course.get_average_ratings(),
-            'rating_count': course.get_rating_count()
+            'average_rating': course.average_rating,
+            'rating_count': course.rating_count
         })
 
 
-class CollectionViewSet(viewsets.ModelViewSet):
+class CollectionViewSet(CachedReadMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Collection.objects.annotate(courses_count=Count('courses')).all()
     serializer_class = CollectionSerializer
     permission_classes = [IsAdminOrReadOnly]
 
 
-class SectionViewSet(viewsets.ModelViewSet):
+class SectionViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     serializer_class = SectionSerializer
 
+    def list(self, request, *args, **kwargs):
+        # Served from the course's stored outline document instead of nested serializers
+        return conditional_course_response(
+            request, Course.objects.filter(pk=kwargs['course_pk']),
+            lambda: self.list_from_outline(kwargs['course_pk'])
+        )
+
+    def list_from_outline(self, course_pk):
+        course = get_object_or_404(Course.objects.only('id', 'title', 'version'), pk=course_pk)
+        sections = [dict(section, course=course.title) for section in get_outline(course)['sections']]
+        fields, expand = self.get_sparse_params()
+        if fields:
+            sections = [{name: value for name, value in section.items() if name in fields} for section in sections]
+        return Response(sections)
+
+    def retrieve(self, request, *args, **kwargs):
+        # The nested lessons show the requesting student's `opened`; the outline-backed list doesn't
+        return conditional_course_response(
+            request, Course.objects.filter(pk=kwargs['course_pk']),
+            lambda: super(SectionViewSet, self).retrieve(request, *args, **kwargs), per_student=True
+        )
+
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
             self.permission_classes = [IsAuthenticated, IsStudentAndPurchasedCourse | IsInstructorOwner, IsPreviousSectionCompleted]
-        elif self.action in ['create', 'update', 'destroy']:
+        elif self.action in ['create', 'update', 'destroy', 'move']:
             self.permission_classes = [IsAuthenticated, IsInstructorOwner]
         else:
             self.permission_classes = [IsAuthenticated]
@@ -151,7 +274,7 @@ class SectionViewSet(viewsets.ModelViewSet):
 
         # Check if the user is an instructor for the course
         if Course.objects.filter(id=course_id, instructor=user).exists():
-            return Section.objects.filter(course_id=course_id)
+            return Section.objects.filter(course_id=course_id).order_by('order', 'id')
 
         # Check if the user is a student who purchased the course
         if self.request.method in SAFE_METHODS:
@@ -160,7 +283,7 @@ class SectionViewSet(viewsets.ModelViewSet):
                 order__customer=user.customer_profile,
                 order__payment_status='C'
             ).exists():
-                return Section.objects.filter(course_id=course_id)
+                return Section.objects.filter(course_id=course_id).order_by('order', 'id')
             raise PermissionDenied("You do not have permission to access this course's sections.")
         raise PermissionDenied("You do not have permission to access this course's sections.")
     
@@ -184,11 +307,29 @@ class SectionViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         course_id = self.kwargs['course_pk']
-        course = get_object_or_404(Course, id=course_id)
-        serializer.save(course=course)
+        with transaction.atomic():
+            # The row lock serializes order assignment between concurrent creates
+            course = get_object_or_404(Course.objects.select_for_update(), id=course_id)
+            serializer.save(course=course, order=append_key(Section.objects.filter(course=course)))
+
+    @action(detail=True, methods=['post'])
+    def move(self, request, *args, **kwargs):
+        """{"before": <section id>} or {"after": <section id>}: a single-row update of the section's order key."""
+        serializer = MoveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            get_object_or_404(Course.objects.select_for_update(), pk=kwargs['course_pk'])
+            section = get_object_or_404(Section, pk=kwargs['pk'], course_id=kwargs['course_pk'])
+            try:
+                move_between(section, Section.objects.filter(course_id=section.course_id), **serializer.validated_data)
+            except OrderingError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            Course.touch(section.course_id)
+            bump_generation(CATALOG)
+        return Response({'id': section.pk, 'order': section.order})
 
 
-class BaseLessonViewSet(viewsets.ModelViewSet):
+class BaseLessonViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     serializer_class = LessonSerializer
 
     def create(self, request, *args, **kwargs):
@@ -202,66 +343,56 @@ class BaseLessonViewSet(viewsets.ModelViewSet):
         context = super().get_serializer_context()
         context.update({"request": self.request})
         return context
+
+    def list(self, request, *args, **kwargs):
+        return conditional_course_response(
+            request, Course.objects.filter(pk=kwargs['course_pk']),
+            lambda: super(BaseLessonViewSet, self).list(request, *args, **kwargs), per_student=True
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_course_response(
+            request, Course.objects.filter(pk=kwargs['course_pk']),
+            lambda: super(BaseLessonViewSet, self).retrieve(request, *args, **kwargs), per_student=True
+        )
     
-    def update_course_progress(self, request, lesson):
-        user = request.user
-        # Get or create the CourseProgress instance and ensure it is saved
+    def update_course_progress(self, request, lesson, completed):
         course_progress, created = CourseProgress.objects.get_or_create(
-        student=user,
-        course=lesson.section.course
+        student=request.user,
+        course_id=lesson.section.course_id
         )
-
-        # Save the instance to ensure it has an ID before accessing many-to-many relationships
-        if created:
-            course_progress.save()
-
-        if lesson.opened:
-            # Add the lesson to completed_lessons if not already added
-            if not course_progress.completed_lessons.filter(id=lesson.id).exists():
-                course_progress.completed_lessons.add(lesson)
-        else:
-            # Remove the lesson from completed_lessons if it exists
-            if course_progress.completed_lessons.filter(id=lesson.id).exists():
-                course_progress.completed_lessons.remove(lesson)
-
-        # Update and save progress
-        course_progress.save()
+        set_lesson_completed(course_progress, lesson, completed)
 
     
     def get_queryset(self):
         section_id = self.kwargs['section_pk']
-        return Lesson.objects.filter(section_id=section_id)
+        return Lesson.objects.filter(section_id=section_id).order_by('order', 'id')
     
     def perform_create(self, serializer):
         section_id = self.kwargs['section_pk']
-        section = Section.objects.get(id=section_id)
-        order = Lesson.objects.filter(section=section).count() + 1
-        lesson = serializer.save(section=section, order=order)
+        with transaction.atomic():
+            # The row lock serializes order assignment between concurrent creates
+            section = lock_section(section_id)
+            # Video durations are filled in later by the probe_media worker
+            serializer.save(section=section, order=next_lesson_order(section))
 
-        # Check if the file is a vido and update the duration
-        if lesson.file and lesson.file.name.split('.')[-1].lower() in Lesson.VIDEO_EXTENTIONS:
-            lesson.save() # Triggers the save method with duration calculate if it's a video
-
-        # Update the number_of_lessons for the section
-        section.number_of_lessons += 1
-        section.update_total_duration() # Ensure section duration is updated after adding a lesson 
-        section.save() # Save the updated section
+            # Update the number_of_lessons for the section; durations are rolled up by the Lesson signals.
+            # update() rather than save(), so a stale in-memory total_duration is never written back.
+            Section.objects.filter(pk=section.pk).update(number_of_lessons=F('number_of_lessons') + 1)
 
     def perform_destroy(self, instance):
-        section = instance.section
+        section_id = instance.section_id
         super().perform_destroy(instance)
-        section.number_of_lessons -= 1
-        section.update_total_duration() # Update section and course duration after deleting lesson 
-        section.save() # Save the updated section
+        Section.objects.filter(pk=section_id).update(number_of_lessons=F('number_of_lessons') - 1)
 
 
 class LessonViewSet(BaseLessonViewSet):
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'media']:
             self.permission_classes = [IsAuthenticated, IsStudentAndPurchasedCourse | IsInstructorOwner]
         elif self.action in ['mark_as_finished', 'mark_as_unfinished']:
             self.permission_classes = [IsAuthenticated, IsStudentAndPurchasedCourse]
-        elif self.action in ['create', 'update', 'destroy']:
+        elif self.action in ['create', 'update', 'destroy', 'bulk', 'move']:
             self.permission_classes = [IsAuthenticated, IsInstructorOwner]  # Restricted actions for instructors only
         else:
             self.permission_classes = [IsAuthenticated]
@@ -276,6 +407,54 @@ class LessonViewSet(BaseLessonViewSet):
         ).exists()
         return has_purchased
 
+    @action(detail=True, methods=['post'])
+    def move(self, request, *args, **kwargs):
+        """{"before": <lesson id>} or {"after": <lesson id>}: a single-row update of the lesson's order key."""
+        serializer = MoveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        section = get_object_or_404(Section, pk=kwargs['section_pk'], course_id=kwargs['course_pk'])
+        with transaction.atomic():
+            lock_section(section.pk)
+            lesson = get_object_or_404(Lesson, pk=kwargs['pk'], section=section)
+            try:
+                move_between(lesson, Lesson.objects.filter(section=section), **serializer.validated_data)
+            except OrderingError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            Course.touch(section.course_id)
+            bump_generation(CATALOG)
+        return Response(LessonSerializer(lesson, context=self.get_serializer_context()).data)
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, MultiPartParser, FormParser])
+    def bulk(self, request, *args, **kwargs):
+        """
+        Create, reorder and delete many lessons of the section in one transaction:
+        {"delete": [ids], "order": [every remaining id, in order], "create": [{"title", "file", "is_active"}]}.
+        Files are sent as multipart fields named create[<index>]file.
+        """
+        section = get_object_or_404(Section, pk=kwargs['section_pk'], course_id=kwargs['course_pk'])
+        serializer = LessonBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            lessons = apply_lesson_batch(
+                section.pk,
+                create=[Lesson(**item) for item in data.get('create', [])],
+                order=data.get('order'),
+                delete=data.get('delete', []),
+            )
+        except LessonBatchError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(LessonSerializer(lessons, many=True, context=self.get_serializer_context()).data)
+
+    @action(detail=True, methods=['get'])
+    def media(self, request, *args, **kwargs):
+        # Entitlement is checked here, once; the signed URL then serves every Range request while the video plays
+        lesson = get_object_or_404(self.get_queryset(), pk=kwargs['pk'], section__course_id=kwargs['course_pk'])
+        if not lesson.file:
+            return Response({'error': 'This lesson has no file.'}, status=status.HTTP_404_NOT_FOUND)
+        url = reverse('lesson-media', args=[media_token(lesson)])
+        return Response({'url': request.build_absolute_uri(url), 'expires_in': settings.MEDIA_TOKEN_MAX_AGE})
+
     @action(detail=True, methods=['get', 'put'], url_path='mark_as_finished')
     def mark_as_finished(self, request, *args, **kwargs):
         lesson = self.get_object()
@@ -285,10 +464,8 @@ class LessonViewSet(BaseLessonViewSet):
         if not self.is_student_with_purchase(request.user, course_id):
             return Response({'detail': 'You do not have permission to perform this action.'}, status=403)
 
-        # Mark lesson as finished
-        lesson.opened = True
-        lesson.save()
-        self.update_course_progress(request, lesson)
+        # Mark lesson as finished for this student only
+        self.update_course_progress(request, lesson, completed=True)
         return Response(LessonSerializer(lesson, context={'request': request}).data)
 
     @action(detail=True, methods=['get', 'put'], url_path='mark_as_unfinished')
@@ -300,15 +477,15 @@ class LessonViewSet(BaseLessonViewSet):
         if not self.is_student_with_purchase(request.user, course_id):
             return Response({'detail': 'You do not have permission to perform this action.'}, status=status.HTTP_403_FORBIDDEN)
 
-        # Mark lesson as unfinished
-        lesson.opened = False
-        lesson.save()
-        self.update_course_progress(request, lesson)
+        # Mark lesson as unfinished for this student only
+        self.update_course_progress(request, lesson, completed=False)
         return Response(LessonSerializer(lesson, context={'request': request}).data)
 
 
-class QuestionViewSet(viewsets.ModelViewSet):
+class QuestionViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     serializer_class = QuestionSerializer
+    pagination_class = KeysetPagination
+    ordering = 'id'
 
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
@@ -341,49 +518,22 @@ class QuestionViewSet(viewsets.ModelViewSet):
          # No access
          raise PermissionDenied("You do not have permission to access this section's questions.")
     @action(detail=False, methods=['post'], url_path='answer-all')
-    @transaction.atomic
     def answer_all_questions(self, request, course_pk=None, section_pk=None):
-        section = get_object_or_404(Section, pk=section_pk)
-        student = request.user
-        answers = request.data.get('answers', None)  # Expecting a list of answers directly
-
-        if not isinstance(answers, list):
-            return Response({'error': 'Answers should be provided as a list.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        for answer_data in answers:
-            question_id = answer_data.get('question_id')
-            option_id = answer_data.get('option_id')
-
-            if not question_id or not option_id:
-                return Response({'error': 'Both question_id and option_id are required.'}, status=status.HTTP_400_BAD_REQUEST)
-
-            question = get_object_or_404(Question, pk=question_id, section=section)
-            option = get_object_or_404(Option, pk=option_id, question=question)
-
-            # Save student answer
-            StudentAnswer.objects.update_or_create(
-                student=student,
-                question=question,
-                defaults={'selected_option': option}
-            )
-
-        # Update student score after all answers
-        student_score, created = StudentScore.objects.get_or_create(
-            student=student,
-            section=section
-        )
-        student_score.calculate_progress()
+        # Graded in one pass with a fixed number of queries, see courses/grading.py
+        section = get_object_or_404(Section.objects.only('id', 'course'), pk=section_pk)
+        try:
+            student_score, correct, total = grade_submission(request.user, section, request.data.get('answers', None))
+        except UnknownAnswerError as e:
+            return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except GradingError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({
             'score': student_score.score,
             'passed': student_score.completed,
             'progress': {
-                'correct_answers': StudentAnswer.objects.filter(
-                    student=student,
-                    question__section=section,
-                    selected_option__is_correct=True
-                ).count(),
-                'total_questions': section.questions.count()
+                'correct_answers': correct,
+                'total_questions': total
             }
         })
     
@@ -441,8 +591,12 @@ class PromotionViewSet(viewsets.ModelViewSet):
         serializer.save(instructor=self.request.user, course=course)
 
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     serializer_class = ReviewSerializer
+    pagination_class = KeysetPagination
+    ordering = '-created_at'
+    ordering_fields = ['created_at', 'rating', 'id']
+
     def get_serializer_context(self):
         return {'course_id': self.kwargs['course_pk']}
 
@@ -453,11 +607,19 @@ class ReviewViewSet(viewsets.ModelViewSet):
 class CourseProgressViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = CourseProgressSerializer
     permission_classes = [IsStudentOrInstructor]
+    pagination_class = KeysetPagination
+    ordering = '-id'
+    ordering_fields = ['last_accessed', 'progress', 'id']
 
     def get_queryset(self):
-        queryset = CourseProgress.objects.prefetch_related('student').select_related('course')
+        queryset = CourseProgress.objects.select_related('student', 'course')
+        if 'course_pk' in self.kwargs:
+            queryset = queryset.filter(course_id=self.kwargs['course_pk'])
         if self.request.user.is_staff:
             return queryset.all()
+        if self.request.user.role == 'instructor':
+            # Instructors see their own students; the cohort summary is CourseViewSet.dashboard
+            return queryset.filter(course__instructor=self.request.user)
 
         # Get the customer instance linked to the current user
         customer = Customer.objects.get(user=self.request.user)
@@ -508,10 +670,14 @@ class InstructorEarningsViewSet(viewsets.ReadOnlyModelViewSet):
 class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsStudentOrAdmin]
+    pagination_class = KeysetPagination
+    ordering = '-placed_at'
+    ordering_fields = ['placed_at', 'id']
 
     def get_queryset(self):
         customer = self.request.user.customer_profile
-        return Order.objects.filter(customer=customer)
+        return Order.objects.filter(customer=customer).prefetch_related(
+            'items__course__instructor', 'items__customer__user', 'items__instructor')
 
     def get_cart(self, request):
         try:
@@ -711,8 +877,7 @@ class RatingViewSet(viewsets.ModelViewSet):
 
         serializer = self.get_serializer(data=data)
         if serializer.is_valid():
-            rating = serializer.save()
-            course.update_rating_metrics()
+            serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -722,53 +887,243 @@ class RatingViewSet(viewsets.ModelViewSet):
 
         serializer = self.get_serializer(rating, data=request.data, partial=True)
         if serializer.is_valid():
-            rating = serializer.save()
-            course.update_rating_metrics()
+            serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def destroy(self, request, course_pk=None, pk=None):
-        course = get_object_or_404(Course, pk=course_pk)
         rating = get_object_or_404(self.get_queryset(), pk=pk, user=request.user)
         rating.delete()
-        course.update_rating_metrics()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class CompanyOverviewViewSet(viewsets.ModelViewSet):
+class CompanyOverviewViewSet(CachedReadMixin, viewsets.ModelViewSet):
     queryset = CompanyOverview.objects.all()
     serializer_class = CompanyOverviewSerializer
     permission_classes = [IsAdminOrReadOnly]
+    cache_namespace = SITE_CONTENT
 
 
-class MissionViewSet(viewsets.ModelViewSet):
+class MissionViewSet(CachedReadMixin, viewsets.ModelViewSet):
     queryset = Mission.objects.all()
     serializer_class = MissionSerializer
     permission_classes = [IsAdminOrReadOnly]
+    cache_namespace = SITE_CONTENT
 
 
-class VisionViewSet(viewsets.ModelViewSet):
+class VisionViewSet(CachedReadMixin, viewsets.ModelViewSet):
     queryset = Vission.objects.all()
     serializer_class = VissionSerializer
     permission_classes = [IsAdminOrReadOnly]
+    cache_namespace = SITE_CONTENT
 
 
-class CoreValueViewSet(viewsets.ModelViewSet):
+class CoreValueViewSet(CachedReadMixin, viewsets.ModelViewSet):
     queryset = CoreValue.objects.all()
     serializer_class = CoreValueSerializer
     permission_classes = [IsAdminOrReadOnly]
+    cache_namespace = SITE_CONTENT
 
 
-class StaffMemberViewSet(viewsets.ModelViewSet):
+class StaffMemberViewSet(CachedReadMixin, viewsets.ModelViewSet):
     queryset = StaffMember.objects.all()
     serializer_class = StaffMemberSerializer 
     permission_classes = [IsAdminOrReadOnly]
+    cache_namespace = SITE_CONTENT
+
+
+class CourseTransferView(APIView):
+    """
+    GET streams course trees as NDJSON (optionally ?ids=1,2); POST imports an uploaded
+    NDJSON `file` in the same format.
+    """
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def get(self, request):
+        queryset = Course.objects.all()
+        ids = request.query_params.get('ids')
+        if ids:
+            queryset = queryset.filter(pk__in=ids.split(','))
+        response = StreamingHttpResponse(export_courses(queryset), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="courses.ndjson"'
+        return response
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({'error': 'No file uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            courses, lessons = import_courses(upload)
+        except CourseImportError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'courses': courses, 'lessons': lessons}, status=status.HTTP_201_CREATED)
+
+
+class UploadSessionViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    Resumable uploads of lesson files and course previews (protocol in courses/uploads.py).
+    Chunks are raw request bodies addressed by the Upload-Offset header.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsInstructorOrAdmin]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        discard_upload(instance)
+
+    @action(detail=True, methods=['put'])
+    def chunk(self, request, pk=None):
+        # Refuse oversized chunks on the declared length, before the body is buffered
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length > settings.UPLOAD_CHUNK_SIZE:
+            return Response({'error': f'Chunks may be at most {settings.UPLOAD_CHUNK_SIZE} bytes.'},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        session = self.get_object()
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return Response({'error': 'The Upload-Offset header is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            session = store_chunk(session.pk, offset, request.body)
+        except UploadOffsetError as e:
+            return Response({'error': str(e), 'offset': e.offset}, status=status.HTTP_409_CONFLICT,
+                            headers={'Upload-Offset': str(e.offset)})
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'offset': session.offset, 'size': session.size}, headers={'Upload-Offset': str(session.offset)})
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        session = self.get_object()
+        try:
+            session = complete_upload(session.pk)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(session).data)
+
+
+class DirectUploadViewSet(viewsets.GenericViewSet):
+    """Presigned direct-to-storage uploads of lesson files and course images/previews (see courses/uploads.py)."""
+    serializer_class = DirectUploadSerializer
+    permission_classes = [IsInstructorOrAdmin]
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            data = issue_direct_upload(serializer.validated_data, request.user)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'])
+    def complete(self, request):
+        token = request.data.get('token')
+        if not token:
+            return Response({'error': 'The token is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            instance = complete_direct_upload(token, request.user)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if isinstance(instance, Lesson):
+            return Response(LessonSerializer(instance, context=self.get_serializer_context()).data)
+        return Response({'id': instance.pk, 'image': instance.image.url, 'preview': instance.preview.url})
+
+
+class DirectUploadReceiveView(APIView):
+    """Upload target issued by LocalPresignedStorage; stands in for the S3 bucket endpoint offline."""
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, token):
+        if not hasattr(default_storage, 'check_upload_token'):
+            return Response({'error': 'Direct uploads go to the storage backend.'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            policy = default_storage.check_upload_token(token)
+        except signing.BadSignature:
+            return Response({'error': 'Invalid or expired upload target.'}, status=status.HTTP_403_FORBIDDEN)
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({'error': 'No file uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+        if request.data.get('Content-Type') != policy['content_type']:
+            return Response({'error': 'Content-Type does not match the upload policy.'}, status=status.HTTP_403_FORBIDDEN)
+        if not 1 <= upload.size <= policy['max_size']:
+            return Response({'error': 'File size is outside the upload policy.'}, status=status.HTTP_400_BAD_REQUEST)
+        saved = default_storage.save(policy['name'], upload)
+        if saved != policy['name']:
+            default_storage.delete(saved)
+            return Response({'error': 'This upload target was already used.'}, status=status.HTTP_409_CONFLICT)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class LessonMediaView(APIView):
+    """Byte-range serving of a lesson file for the holder of a media token (see LessonViewSet.media)."""
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, token):
+        try:
+            lesson_id, name = read_media_token(token)
+        except signing.BadSignature:
+            return Response({'error': 'Invalid or expired media link.'}, status=status.HTTP_403_FORBIDDEN)
+        lesson = Lesson.objects.filter(pk=lesson_id, file=name).only('file').first()
+        if lesson is None:
+            # The lesson was deleted or its file replaced since the link was issued
+            return Response({'error': 'Media not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return serve_file(request, lesson.file)
+
+
+class LessonHlsView(APIView):
+    """
+    HLS playlists of a lesson for the holder of a media token. Segment URIs are rewritten to signed
+    storage URLs, so only the small playlists pass through Django.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, token, path):
+        try:
+            lesson_id, name = read_media_token(token)
+        except signing.BadSignature:
+            return Response({'error': 'Invalid or expired media link.'}, status=status.HTTP_403_FORBIDDEN)
+        if not path.endswith('.m3u8') or '..' in path.split('/'):
+            return Response({'error': 'Playlist not found.'}, status=status.HTTP_404_NOT_FOUND)
+        lesson = Lesson.objects.filter(pk=lesson_id, file=name, hls_status=Lesson.HLS_READY) \
+            .only('file', 'hls_playlist').first()
+        if lesson is None:
+            return Response({'error': 'Playlist not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        storage = lesson.file.storage
+        playlist = f'{os.path.dirname(lesson.hls_playlist)}/{path}'
+        try:
+            with storage.open(playlist, 'rb') as f:
+                text = f.read().decode()
+        except (FileNotFoundError, OSError):
+            return Response({'error': 'Playlist not found.'}, status=status.HTTP_404_NOT_FOUND)
+        response = HttpResponse(rewrite_playlist(storage, playlist, text), content_type='application/vnd.apple.mpegurl')
+        # Segment URLs carry their own expiry, so keep playlists out of shared caches and refresh them often
+        response['Cache-Control'] = 'private, max-age=60'
+        return response
 
 
 class SocialMediaLinksView(APIView):
     permission_classes = [AllowAny]
     
     def get(self, request):
+        return cached_response(SITE_CONTENT, request, lambda: self._get(request))
+
+    def _get(self, request):
         try:
             # Fetch the admin staff member
             admin = StaffMember.objects.filter(is_admin=True).first()
@@ -787,22 +1142,25 @@ class SocialMediaLinksView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
-class TestimonialViewSet(viewsets.ModelViewSet):
+class TestimonialViewSet(CachedReadMixin, viewsets.ModelViewSet):
     queryset = Testimonial.objects.all()
     serializer_class = TestimonialSerializer
     permission_classes = [IsAuthenticated]
+    cache_namespace = SITE_CONTENT
 
 
-class FAQViewSet(viewsets.ModelViewSet):
+class FAQViewSet(CachedReadMixin, viewsets.ModelViewSet):
     queryset = FAQ.objects.all()
     serializer_class = FAQSerializer
     permission_classes = [IsAdminOrReadOnly]
+    cache_namespace = SITE_CONTENT
 
 
-class DescriptionViewSet(viewsets.ModelViewSet):
+class DescriptionViewSet(CachedReadMixin, viewsets.ModelViewSet):
     queryset = Description.objects.all()
     serializer_class = DescriptionSerializer
     permission_classes = [IsAdminOrReadOnly]
+    cache_namespace = SITE_CONTENT
 
 
 class PaymentStatusViewSet(viewsets.ModelViewSet):
@@ -821,4 +1179,23 @@ class SetEmailView(APIView):
         # Your existing logic
 
 def home(request):
-    return HttpResponse("Welcome to the home page!")
\ No newline at end of file
+    return HttpResponse("Welcome to the home page!")
+
+
+class HeartbeatViewSet(viewsets.GenericViewSet):
+    """
+    Playback heartbeats: {"events": [{"lesson": <id>, "position": <seconds>}, ...]}. Positions are buffered
+    and written in bulk (courses/watch.py), so a report costs one read and no writes. Video lessons complete
+    themselves once watched far enough.
+    """
+    serializer_class = HeartbeatSerializer
+    permission_classes = [IsAuthenticated]
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        events = serializer.validated_data['events']
+        lessons = watchable_lessons(request.user, {event['lesson'] for event in events})
+        accepted = record_heartbeats(request.user.pk, events, lessons)
+        rejected = sorted({event['lesson'] for event in events} - lessons.keys())
+        return Response({'accepted': accepted, 'rejected': rejected}, status=status.HTTP_202_ACCEPTED)
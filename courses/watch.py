@@ -0,0 +1,158 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import CourseProgress, Lesson, LessonWatch, Order
+from .progress import has_bit, set_lesson_completed
+
+# Write-behind playback heartbeats. Players report positions every few seconds; record() only merges
+# them into an in-process buffer keyed by (student, lesson). A daemon thread writes the buffer to
+# LessonWatch with one upsert every WATCH_FLUSH_INTERVAL seconds (sooner when WATCH_BUFFER_SIZE keys
+# are pending, and at exit), then completes the video lessons whose furthest position crossed
+# WATCH_COMPLETE_RATIO of their duration. A crash loses at most one interval of positions.
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_buffer = {}
+_wake = threading.Event()
+_flusher = None
+
+
+def watchable_lessons(user, lesson_ids):
+    """{lesson id: (duration, progress_bit, course id)} for the lessons of courses `user` has paid for."""
+    rows = Lesson.objects.filter(
+        pk__in=lesson_ids,
+        section__course__orderitems__order__customer__user=user,
+        section__course__orderitems__order__payment_status=Order.PAYMENT_STATUS_COMPLETE,
+    ).values_list('id', 'duration', 'progress_bit', 'section__course_id').distinct()
+    return {pk: (duration, bit, course_id) for pk, duration, bit, course_id in rows}
+
+
+def record(student_id, events, lessons):
+    """
+    Buffer heartbeat `events` ({'lesson', 'position'} dicts) of one student; `lessons` is their
+    watchable_lessons(). Returns how many events were accepted. Never touches the database.
+    """
+    accepted = 0
+    with _lock:
+        for event in events:
+            lesson = lessons.get(event['lesson'])
+            if lesson is None:
+                continue
+            duration, bit, course_id = lesson
+            position = int(event['position'])
+            if duration:
+                position = min(position, duration)
+            key = (student_id, event['lesson'])
+            previous = _buffer.get(key)
+            furthest = max(position, previous['furthest']) if previous else position
+            _buffer[key] = {'position': position, 'furthest': furthest,
+                            'duration': duration, 'bit': bit, 'course': course_id}
+            accepted += 1
+        pending = len(_buffer)
+    _start_flusher()
+    if pending >= settings.WATCH_BUFFER_SIZE:
+        _wake.set()
+    return accepted
+
+
+def _merge_back(pending):
+    # A failed flush keeps its positions for the next attempt, unless newer reports replaced them
+    with _lock:
+        for key, entry in pending.items():
+            current = _buffer.get(key)
+            if current is None:
+                _buffer[key] = entry
+            else:
+                current['furthest'] = max(current['furthest'], entry['furthest'])
+
+
+def flush_watches():
+    """Write the buffered positions and complete crossed lessons. Returns the number of (student, lesson) rows written."""
+    global _buffer
+    with _lock:
+        pending, _buffer = _buffer, {}
+    if not pending:
+        return 0
+    try:
+        write_watches(pending)
+    except Exception:
+        logger.exception('Writing %d buffered lesson positions failed', len(pending))
+        _merge_back(pending)
+        return 0
+    return len(pending)
+
+
+def write_watches(pending):
+    # Lessons deleted since their heartbeat arrived are dropped
+    lessons = set(Lesson.objects.filter(pk__in={lesson_id for _, lesson_id in pending}).values_list('id', flat=True))
+    pending = {key: entry for key, entry in pending.items() if key[1] in lessons}
+    if not pending:
+        return
+    students = {student_id for student_id, _ in pending}
+    stored = {
+        (student_id, lesson_id): furthest
+        for student_id, lesson_id, furthest in LessonWatch.objects
+        .filter(student_id__in=students, lesson_id__in=lessons).values_list('student_id', 'lesson_id', 'furthest')
+    }
+    for key, entry in pending.items():
+        entry['furthest'] = max(entry['furthest'], stored.get(key, 0))
+
+    # MySQL upserts on any unique key and takes no conflict target
+    target = ['student', 'lesson'] if connection.features.supports_update_conflicts_with_target else None
+    with transaction.atomic():
+        LessonWatch.objects.bulk_create([
+            LessonWatch(student_id=student_id, lesson_id=lesson_id, position=entry['position'], furthest=entry['furthest'])
+            for (student_id, lesson_id), entry in pending.items()
+        ], update_conflicts=True, unique_fields=target, update_fields=['position', 'furthest', 'updated_at'],
+            batch_size=1000)
+
+        students_by_course = defaultdict(set)
+        for (student_id, _), entry in pending.items():
+            students_by_course[entry['course']].add(student_id)
+        progress = CourseProgress.objects.filter(reduce(or_, (
+            Q(course_id=course_id, student_id__in=course_students)
+            for course_id, course_students in students_by_course.items()
+        )))
+        progress.update(last_accessed=timezone.now())
+
+    crossed = [
+        (student_id, lesson_id, entry) for (student_id, lesson_id), entry in pending.items()
+        if entry['duration'] and entry['furthest'] >= entry['duration'] * settings.WATCH_COMPLETE_RATIO
+    ]
+    if crossed:
+        rows = {(row.student_id, row.course_id): row
+                for row in progress.only('id', 'student_id', 'course_id', 'completed_bits')}
+        for student_id, lesson_id, entry in crossed:
+            row = rows.get((student_id, entry['course']))
+            if row is not None and not has_bit(row.completed_bits, entry['bit']):
+                set_lesson_completed(row, Lesson(pk=lesson_id, progress_bit=entry['bit']), True)
+
+
+def _flush_loop():
+    while True:
+        _wake.wait(settings.WATCH_FLUSH_INTERVAL)
+        _wake.clear()
+        close_old_connections()
+        flush_watches()
+
+
+def _start_flusher():
+    # Started lazily in each serving process, so forking servers don't inherit a dead thread
+    global _flusher
+    if _flusher is not None and _flusher.is_alive():
+        return
+    with _lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flush_loop, name='watch-flush', daemon=True)
+            _flusher.start()
+
+
+atexit.register(flush_watches)
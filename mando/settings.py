@@ -89,7 +89,6 @@ MIDDLEWARE = [
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.cache.CacheMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -141,6 +140,31 @@ DATABASES = {
 }
 
 
+# Cache
+# Response caching for public catalog endpoints lives in courses/cache.py. The site-wide
+# CacheMiddleware was removed because it keyed on the URL alone and would serve one JWT
+# user's response to another. Set REDIS_URL so cache generations are shared between workers.
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+RESPONSE_CACHE_TIMEOUT = 300  # Keep below the lifetime of signed storage URLs in cached payloads
+# Longest a course ETag/Last-Modified keeps answering 304. Payloads embed signed storage URLs (1h) and
+# media tokens (MEDIA_TOKEN_MAX_AGE), so this plus RESPONSE_CACHE_TIMEOUT must stay well below both.
+CONDITIONAL_RESPONSE_MAX_AGE = 15 * 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -186,8 +210,9 @@ AWS_S3_VERIFY = True  # Verify SSL certificates
 
 
 
-# Default file storage for media files
-DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+# Default file storage for media files. S3Boto3Storage plus presigned direct uploads; use
+# courses.storage.LocalPresignedStorage to run the same upload flow against the local filesystem.
+DEFAULT_FILE_STORAGE = 'courses.storage.PresignedS3Storage'
 
 # Static file storage (if using S3 for static files as well)
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
@@ -289,6 +314,36 @@ DJOSER = {
 
 # Remove the limit on data upload size
 DATA_UPLOAD_MAX_MEMORY_SIZE = None
+
+# Resumable uploads (courses/uploads.py): largest accepted chunk, and how long an unfinished session is kept
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_SESSION_MAX_AGE = timedelta(days=1)
+
+# Presigned direct-to-storage uploads: how long a target is valid, and the largest single object (S3 POST limit)
+DIRECT_UPLOAD_EXPIRES = 3600
+DIRECT_UPLOAD_MAX_SIZE = 5 * 1024 ** 3
+
+# Lifetime of a lesson media token (courses/streaming.py); long enough to watch one lesson without refreshing
+MEDIA_TOKEN_MAX_AGE = 2 * 60 * 60
+
+# HLS renditions made by `manage.py transcode_lessons`, smallest first
+HLS_RENDITIONS = [
+    {'name': '360p', 'height': 360, 'video_bitrate': '800k', 'audio_bitrate': '96k'},
+    {'name': '720p', 'height': 720, 'video_bitrate': '2800k', 'audio_bitrate': '128k'},
+]
+HLS_WORKERS = 2  # ffmpeg processes per worker
+
+# Resized copies of uploaded images (courses/images.py), rendered by `manage.py render_image_variants`
+IMAGE_VARIANT_WIDTHS = [160, 320, 640, 1280]
+IMAGE_VARIANT_FORMATS = ['webp', 'jpeg']
+
+# Playback heartbeats (courses/watch.py) are buffered per process and written every WATCH_FLUSH_INTERVAL
+# seconds, or sooner once WATCH_BUFFER_SIZE lessons are pending. A video lesson is completed once the
+# furthest position reaches WATCH_COMPLETE_RATIO of its duration.
+WATCH_FLUSH_INTERVAL = 10
+WATCH_BUFFER_SIZE = 5000
+WATCH_COMPLETE_RATIO = 0.9
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -5,10 +5,14 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from .models import Notification
 from .serializers import NotificationSerializer, UpdateNotificationSerializer
+from courses.pagination import KeysetPagination
 
 
 class NotificationViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    ordering = '-created_at'
+    ordering_fields = ['created_at', 'id']
 
     def get_queryset(self):
         # Filter notifications for the authenticated user